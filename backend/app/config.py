@@ -5,7 +5,111 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     database_url: str = "sqlite+aiosqlite:///./pair_programming.db"
     environment: str = "development"
-    
+
+    # Database engine. Pool sizes also apply to SQLite files; recycle and
+    # pre-ping only to server databases
+    db_echo: bool = False
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30.0
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    # Prepared statements cached per asyncpg connection; 0 for pgbouncer
+    db_statement_cache_size: int = 500
+    # Open SQLite in WAL mode with synchronous=NORMAL
+    sqlite_wal: bool = True
+
+    # WebSocket fan-out
+    ws_send_timeout: float = 2.0
+    ws_queue_max_size: int = 256
+    ws_queue_high_water: int = 64
+    ws_slow_consumer_grace: float = 5.0
+    # Compact binary frames larger than this are deflated
+    ws_compress_threshold: int = 1024
+
+    # Collaborative editing
+    ot_history_size: int = 500
+
+    # Write-behind persistence of live room code
+    persist_flush_interval: float = 5.0
+    persist_flush_edits: int = 200
+    # Each flush also records a revision of every changed room: a full
+    # snapshot every revision_snapshot_interval revisions, deltas in between
+    revision_history: bool = True
+    revision_snapshot_interval: int = 50
+
+    # Cross-worker backplane: "memory" (single process) or "redis"
+    backplane: str = "memory"
+    backplane_url: str = "redis://localhost:6379/0"
+    backplane_channel: str = "codepair"
+    backplane_heartbeat_interval: float = 10.0
+    # "broadcast" relays every room to every worker; "sharded" gives each
+    # room a single owner worker chosen by consistent hashing
+    room_routing: str = "broadcast"
+
+    # Rooms the server will hold; the room count is re-read from the
+    # database this often so rooms created by other workers are seen
+    room_limit: int = 100
+    room_count_refresh: float = 30.0
+    # Saved room metadata and code cached in memory; a TTL of 0 disables caching
+    room_cache_ttl: float = 30.0
+    room_cache_size: int = 1024
+
+    # Per-client request budgets per rate_limit_window seconds, by route.
+    # "redis" shares them between workers through rate_limit_url
+    # (defaults to backplane_url)
+    rate_limit_backend: str = "memory"
+    rate_limit_url: str = ""
+    rate_limit_window: float = 60.0
+    rate_limit_requests: int = 10
+    rate_limit_execute_requests: int = 10
+    rate_limit_autocomplete_requests: int = 120
+
+    # Code execution sandbox
+    execution_max_concurrency: int = 4
+    execution_max_queue: int = 32
+    execution_timeout: float = 10.0
+    execution_memory_limit_mb: int = 256
+    execution_output_limit: int = 65536
+    # Streamed output is flushed once this many bytes are pending, or this
+    # many seconds after the first unflushed byte
+    execution_flush_bytes: int = 4096
+    execution_flush_interval: float = 0.05
+    # Results of programs that look deterministic are reused for this long.
+    # The check is best effort, so this is off (0) unless enabled
+    execution_result_cache_ttl: float = 0.0
+    execution_result_cache_size: int = 256
+
+    # Upstream completion model used by autocomplete. Identifiers are completed
+    # from the document first; the model is only asked when that finds nothing
+    autocomplete_model_enabled: bool = True
+    autocomplete_api_url: str = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-medium"
+    autocomplete_api_token: str = ""
+    autocomplete_timeout: float = 3.0
+    autocomplete_max_connections: int = 20
+    autocomplete_max_concurrency: int = 10
+    # Open the circuit after this many consecutive failed or slow calls and
+    # retry the upstream after autocomplete_breaker_reset seconds
+    autocomplete_breaker_failures: int = 5
+    autocomplete_breaker_reset: float = 30.0
+    autocomplete_slow_call: float = 2.0
+    # Suggestions cached per language and cursor context; a TTL of 0 disables caching
+    autocomplete_cache_ttl: float = 30.0
+    autocomplete_cache_size: int = 2048
+    # Autocomplete requests over a room socket closer together than this are debounced
+    autocomplete_debounce: float = 0.05
+    autocomplete_batch_max: int = 32
+    # Warm Python interpreters; 0 starts a fresh python3 for every run
+    python_pool_size: int = 4
+    python_pool_max_runs: int = 100
+    python_pool_preload: str = "collections,itertools,functools,math,random,re,json,heapq,bisect"
+    # C++ builds, cached by hash of compiler, flags and source; an empty
+    # directory means a folder under the system temp dir
+    cpp_compiler: str = "g++"
+    cpp_flags: str = ""
+    compile_cache_dir: str = ""
+    compile_cache_max_mb: int = 256
+
     class Config:
         env_file = ".env"
 
@@ -1,4 +1,7 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from typing import Any, Dict
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.config import settings
 
@@ -7,11 +10,60 @@ class Base(DeclarativeBase):
     pass
 
 
-# Create async engine
-engine = create_async_engine(
-    settings.database_url.replace("postgresql://", "postgresql+asyncpg://"),
-    echo=settings.environment == "development"
-)
+def async_database_url(url: str) -> str:
+    """Point plain postgresql:// and sqlite:// URLs at the async drivers"""
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the writer, and with WAL synchronous=NORMAL
+    # only risks the last commits on power loss, never corruption
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+def create_engine(url: str = None, **overrides: Any) -> AsyncEngine:
+    """Build an engine with the pool and driver options from settings"""
+    url = async_database_url(url or settings.database_url)
+    options: Dict[str, Any] = {"echo": settings.db_echo}
+
+    if url.startswith("sqlite"):
+        # In-memory databases live in a single connection, so no pool options
+        database = make_url(url).database
+        if database not in (None, "", ":memory:") and "mode=memory" not in url:
+            options.update(pool_size=settings.db_pool_size, max_overflow=settings.db_max_overflow,
+                           pool_timeout=settings.db_pool_timeout)
+    else:
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+            pool_pre_ping=settings.db_pool_pre_ping,
+        )
+        if url.startswith("postgresql+asyncpg"):
+            # SQLAlchemy's cache of asyncpg prepared statements and asyncpg's
+            # own; both must be 0 behind pgbouncer in transaction mode
+            options["connect_args"] = {
+                "prepared_statement_cache_size": settings.db_statement_cache_size,
+                "statement_cache_size": settings.db_statement_cache_size,
+            }
+
+    sqlite_wal = overrides.pop("sqlite_wal", settings.sqlite_wal)
+    options.update(overrides)
+    engine = create_async_engine(url, **options)
+    if url.startswith("sqlite") and sqlite_wal:
+        event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
+engine = create_engine()
 
 # Create session factory
 AsyncSessionLocal = async_sessionmaker(
@@ -1,45 +1,235 @@
+import asyncio
+import logging
+import math
 import time
-from typing import Dict, Tuple
-from fastapi import HTTPException, Request
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
+from app.config import settings
+from app.services.redis_protocol import RedisConnection
+
+logger = logging.getLogger(__name__)
+
+
+class Budget(NamedTuple):
+    """At most `requests` per `window` seconds, all of which may come at once"""
+    requests: int
+    window: float
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.window
+
 
 class RateLimiter:
-    def __init__(self):
-        self.requests: Dict[str, Tuple[int, float]] = {}
-        self.max_requests = 10
-        self.window_seconds = 60
-    
-    def is_allowed(self, ip: str) -> bool:
-        current_time = time.time()
-        
-        if ip not in self.requests:
-            self.requests[ip] = (1, current_time)
-            return True
-        
-        count, window_start = self.requests[ip]
-        
-        if current_time - window_start > self.window_seconds:
-            self.requests[ip] = (1, current_time)
-            return True
-        
-        if count >= self.max_requests:
-            return False
-        
-        self.requests[ip] = (count + 1, window_start)
-        return True
+    """Token bucket per client and route group, kept in process memory.
+
+    Each bucket holds up to budget.requests tokens and refills continuously,
+    so there is no window edge at which a client can burst twice. Buckets
+    are kept in LRU order; ones that have refilled completely are dropped
+    by a periodic sweep, and the least recently used go once there are
+    more than max_keys.
+    """
+
+    def __init__(
+        self,
+        budgets: Dict[str, Budget],
+        routes: List[Tuple[str, str]],
+        max_keys: int = 100_000,
+        sweep_interval: float = 60.0,
+    ):
+        self.budgets = budgets
+        self.routes = routes  # (path prefix, budget name), first match wins
+        self.max_keys = max_keys
+        self.sweep_interval = sweep_interval
+        self.rejected = 0
+        self.evicted = 0
+        # (client, budget name) -> (tokens, updated_at), least recently used first
+        self._buckets: "OrderedDict[Tuple[str, str], Tuple[float, float]]" = OrderedDict()
+        self._last_sweep = time.monotonic()
+
+    def budget_for(self, path: str) -> Tuple[str, Budget]:
+        for prefix, name in self.routes:
+            if path.startswith(prefix):
+                return name, self.budgets[name]
+        return "default", self.budgets["default"]
+
+    def take(self, client: str, path: str = "/") -> float:
+        """Spend a token; returns 0 if allowed, else seconds until one is available"""
+        name, budget = self.budget_for(path)
+        now = time.monotonic()
+        key = (client, name)
+
+        tokens, updated_at = self._buckets.get(key, (budget.requests, now))
+        tokens = min(budget.requests, tokens + (now - updated_at) * budget.rate)
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0.0
+        else:
+            self.rejected += 1
+            retry_after = (1 - tokens) / budget.rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+            self.evicted += 1
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+        return retry_after
+
+    def is_allowed(self, ip: str, path: str = "/") -> bool:
+        return self.take(ip, path) == 0
+
+    async def acquire(self, client: str, path: str) -> float:
+        """Like take(); subclasses sharing limits between workers do I/O here"""
+        return self.take(client, path)
+
+    def _sweep(self, now: float):
+        """Drop buckets that are full again, which is what a missing bucket means"""
+        self._last_sweep = now
+        for key, (tokens, updated_at) in list(self._buckets.items()):
+            budget = self.budgets[key[1]]
+            if tokens + (now - updated_at) * budget.rate >= budget.requests:
+                del self._buckets[key]
+                self.evicted += 1
+
+    async def stop(self):
+        pass
+
+    def stats(self) -> Dict[str, object]:
+        return {"backend": "memory", "keys": len(self._buckets), "rejected": self.rejected, "evicted": self.evicted}
+
+
+class RedisRateLimiter(RateLimiter):
+    """Limits shared by every worker through a Redis-protocol server.
+
+    Uses a sliding window counter: one INCR-ed key per client, budget and
+    fixed window, with the previous window's count weighted by how much of
+    it still overlaps the sliding window. If the server can't be reached
+    the per-process buckets are used until it is back.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        budgets: Dict[str, Budget],
+        routes: List[Tuple[str, str]],
+        prefix: str = "ratelimit",
+        retry_interval: float = 5.0,
+        **kwargs
+    ):
+        super().__init__(budgets, routes, **kwargs)
+        self.url = url
+        self.prefix = prefix
+        self.retry_interval = retry_interval
+        self.fallbacks = 0
+        self._connection: Optional[RedisConnection] = None
+        self._connect_lock = asyncio.Lock()
+        self._retry_at = 0.0
+
+    async def _connect(self):
+        """Open the shared connection; concurrent callers wait for one attempt"""
+        async with self._connect_lock:
+            if self._connection is not None or time.monotonic() < self._retry_at:
+                return
+            try:
+                self._connection = await RedisConnection.open(self.url, timeout=1.0)
+            except Exception as e:
+                logger.warning(f"Rate limit store unavailable, limiting per worker: {e!r}")
+                self._retry_at = time.monotonic() + self.retry_interval
+
+    async def acquire(self, client: str, path: str) -> float:
+        name, budget = self.budget_for(path)
+        if self._connection is None and time.monotonic() >= self._retry_at:
+            await self._connect()
+        connection = self._connection
+        if connection is not None:
+            try:
+                return await asyncio.wait_for(self._acquire_shared(connection, client, name, budget), timeout=1.0)
+            except Exception as e:
+                # Only the first caller to see this connection fail closes it
+                if self._connection is connection:
+                    logger.warning(f"Rate limit store failed, limiting per worker: {e!r}")
+                    self._connection = None
+                    self._retry_at = time.monotonic() + self.retry_interval
+                    await connection.close()
+        self.fallbacks += 1
+        return self.take(client, path)
+
+    async def _acquire_shared(self, connection: RedisConnection, client: str, name: str, budget: Budget) -> float:
+        now = time.time()
+        window = int(now // budget.window)
+        elapsed = now - window * budget.window
+        current_key = f"{self.prefix}:{name}:{client}:{window}"
+        previous_key = f"{self.prefix}:{name}:{client}:{window - 1}"
+
+        count, _, previous = await connection.pipeline([
+            ("INCR", current_key),
+            ("PEXPIRE", current_key, math.ceil(budget.window * 2000)),
+            ("GET", previous_key),
+        ])
+        if isinstance(count, Exception):
+            raise count
+        previous = int(previous) if isinstance(previous, bytes) else 0
+        overlap = 1 - elapsed / budget.window
+        if previous * overlap + count <= budget.requests:
+            return 0.0
+
+        # Denied requests don't count against the client
+        await connection.execute("DECR", current_key)
+        self.rejected += 1
+        remaining = budget.window - elapsed
+        if previous == 0:
+            return remaining
+        # The previous window's weight drops by previous / window per second
+        excess = previous * overlap + count - budget.requests
+        return min(remaining, excess * budget.window / previous)
+
+    async def stop(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def stats(self) -> Dict[str, object]:
+        return {**super().stats(), "backend": "redis", "fallbacks": self.fallbacks}
+
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, rate_limiter: RateLimiter):
         super().__init__(app)
         self.rate_limiter = rate_limiter
-    
+
     async def dispatch(self, request: Request, call_next):
         if request.url.path in ["/health", "/", "/docs"]:
             return await call_next(request)
-        
-        if not self.rate_limiter.is_allowed(request.client.host):
-            raise HTTPException(status_code=429, detail="Too many requests")
-        
+
+        retry_after = await self.rate_limiter.acquire(request.client.host, request.url.path)
+        if retry_after > 0:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
         return await call_next(request)
 
-rate_limiter = RateLimiter()
\ No newline at end of file
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the limiter selected by settings.rate_limit_backend"""
+    budgets = {
+        "default": Budget(settings.rate_limit_requests, settings.rate_limit_window),
+        "execute": Budget(settings.rate_limit_execute_requests, settings.rate_limit_window),
+        "autocomplete": Budget(settings.rate_limit_autocomplete_requests, settings.rate_limit_window),
+    }
+    routes = [("/api/execute", "execute"), ("/api/autocomplete", "autocomplete")]
+    if settings.rate_limit_backend == "redis":
+        return RedisRateLimiter(settings.rate_limit_url or settings.backplane_url, budgets, routes)
+    if settings.rate_limit_backend == "memory":
+        return RateLimiter(budgets, routes)
+    raise ValueError(f"Unknown rate limit backend: {settings.rate_limit_backend}")
+
+
+rate_limiter = create_rate_limiter()
@@ -1,3 +1,4 @@
 from .room import Room
+from .revision import RoomRevision
 
-__all__ = ["Room"]
\ No newline at end of file
+__all__ = ["Room", "RoomRevision"]
\ No newline at end of file
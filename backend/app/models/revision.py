@@ -0,0 +1,19 @@
+from sqlalchemy import Boolean, Column, DateTime, Integer, LargeBinary, String, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class RoomRevision(Base):
+    """A saved version of a room's code: a full snapshot or a delta from the previous revision"""
+    __tablename__ = "room_revisions"
+    __table_args__ = (UniqueConstraint("room_id", "revision", name="uq_room_revisions_room_revision"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(String(50), nullable=False)
+    revision = Column(Integer, nullable=False)
+    is_snapshot = Column(Boolean, nullable=False, default=False)
+    language = Column(String(50), default="python")
+    # zlib-compressed code for snapshots, compressed JSON operation for deltas
+    data = Column(LargeBinary, nullable=False)
+    code_length = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,6 +1,15 @@
 from fastapi import APIRouter, HTTPException
-from app.schemas.autocomplete import AutocompleteRequest, AutocompleteResponse
+from app.config import settings
+from app.schemas.autocomplete import (
+    AutocompleteBatchItem,
+    AutocompleteBatchRequest,
+    AutocompleteBatchResponse,
+    AutocompleteRequest,
+    AutocompleteResponse,
+)
+from app.services.autocomplete_scheduler import autocomplete_scheduler
 from app.services.autocomplete_service import AutocompleteService
+from app.services.completion_client import completion_client
 
 router = APIRouter()
 
@@ -9,7 +18,38 @@ router = APIRouter()
 async def get_autocomplete_suggestion(request: AutocompleteRequest):
     """Get AI-style autocomplete suggestion (mocked)"""
     try:
-        suggestion = AutocompleteService.get_autocomplete_suggestion(request)
+        suggestion = await AutocompleteService.get_autocomplete_suggestion(request)
         return suggestion
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to generate suggestion: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to generate suggestion: {str(e)}")
+
+
+@router.post("/autocomplete/batch", response_model=AutocompleteBatchResponse)
+async def get_autocomplete_suggestions(batch: AutocompleteBatchRequest):
+    """Get suggestions for several cursors in one round trip, in request order"""
+    if len(batch.requests) > settings.autocomplete_batch_max:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.autocomplete_batch_max} requests per batch"
+        )
+    try:
+        results, deduplicated = await AutocompleteService.get_batch_suggestions(batch.requests)
+        return AutocompleteBatchResponse(
+            responses=[
+                AutocompleteBatchItem(**response.model_dump(), durationMs=round(duration * 1000, 3))
+                for response, duration in results
+            ],
+            deduplicated=deduplicated
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate suggestions: {str(e)}")
+
+
+@router.get("/autocomplete/stats")
+async def get_autocomplete_stats():
+    """Get suggestion cache, socket request, upstream call and circuit breaker metrics"""
+    return {
+        **AutocompleteService.stats(),
+        "socket": autocomplete_scheduler.stats(),
+        "upstream": completion_client.stats()
+    }
\ No newline at end of file
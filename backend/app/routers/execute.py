@@ -1,10 +1,14 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import subprocess
-import tempfile
-import os
+import asyncio
+import json
 import time
 from typing import Optional
+from app.services.compile_cache import compile_cache
+from app.services.execution_engine import execution_engine, ExecutionQueueFull
+from app.services.execution_service import ExecutionService
+from app.services.python_pool import python_pool
 
 router = APIRouter()
 
@@ -16,19 +20,23 @@ class ExecuteResponse(BaseModel):
     output: str
     error: Optional[str] = None
     execution_time: float
+    cached: bool = False
 
 @router.post("/execute", response_model=ExecuteResponse)
 async def execute_code(request: ExecuteRequest):
     start_time = time.time()
     
     try:
-        if request.language == "python":
-            return await execute_python(request.code, start_time)
-        elif request.language == "cpp":
-            return await execute_cpp(request.code, start_time)
-        else:
-            raise HTTPException(status_code=400, detail=f"Unsupported language: {request.language}")
+        result = await ExecutionService.execute(request.language, request.code)
+        return ExecuteResponse(
+            output=result["output"],
+            error=result["error"],
+            execution_time=result["execution_time"],
+            cached=result["cached"]
+        )
     
+    except ExecutionQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         return ExecuteResponse(
             output="",
@@ -36,96 +44,51 @@ async def execute_code(request: ExecuteRequest):
             execution_time=time.time() - start_time
         )
 
-async def execute_python(code: str, start_time: float) -> ExecuteResponse:
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-        f.write(code)
-        temp_file = f.name
-    
-    try:
-        result = subprocess.run(
-            ['python3', temp_file],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        execution_time = time.time() - start_time
-        
-        if result.returncode == 0:
-            return ExecuteResponse(
-                output=result.stdout,
-                execution_time=execution_time
-            )
-        else:
-            return ExecuteResponse(
-                output=result.stdout,
-                error=result.stderr,
-                execution_time=execution_time
-            )
-    
-    except subprocess.TimeoutExpired:
-        return ExecuteResponse(
-            output="",
-            error="Execution timeout (10 seconds)",
-            execution_time=10.0
-        )
-    
-    finally:
-        os.unlink(temp_file)
+@router.post("/execute/stream")
+async def execute_code_stream(request: ExecuteRequest):
+    """Run code and stream its output as newline-delimited JSON events.
 
-async def execute_cpp(code: str, start_time: float) -> ExecuteResponse:
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.cpp', delete=False) as f:
-        f.write(code)
-        cpp_file = f.name
+    Emits {"type": "output", "stream", "data"} chunks while the program
+    runs, then one {"type": "result", ...} or {"type": "error", "error"}.
+    """
+    if request.language not in ExecutionService.languages:
+        raise HTTPException(status_code=400, detail=f"Unsupported language: {request.language}")
     
-    exe_file = cpp_file.replace('.cpp', '')
+    events: asyncio.Queue = asyncio.Queue()
     
-    try:
-        # Compile
-        compile_result = subprocess.run(
-            ['g++', '-o', exe_file, cpp_file],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        if compile_result.returncode != 0:
-            return ExecuteResponse(
-                output="",
-                error=f"Compilation error: {compile_result.stderr}",
-                execution_time=time.time() - start_time
-            )
-        
-        # Execute
-        run_result = subprocess.run(
-            [exe_file],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-        
-        execution_time = time.time() - start_time
-        
-        if run_result.returncode == 0:
-            return ExecuteResponse(
-                output=run_result.stdout,
-                execution_time=execution_time
-            )
-        else:
-            return ExecuteResponse(
-                output=run_result.stdout,
-                error=run_result.stderr,
-                execution_time=execution_time
-            )
+    async def on_output(stream: str, data: str):
+        events.put_nowait({"type": "output", "stream": stream, "data": data})
     
-    except subprocess.TimeoutExpired:
-        return ExecuteResponse(
-            output="",
-            error="Execution timeout (10 seconds)",
-            execution_time=10.0
-        )
+    async def run():
+        try:
+            result = await ExecutionService.execute(request.language, request.code, on_output)
+            # The output itself has already been streamed
+            result.pop("output")
+            events.put_nowait({"type": "result", **result})
+        except Exception as e:
+            events.put_nowait({"type": "error", "error": str(e)})
+        finally:
+            events.put_nowait(None)
     
-    finally:
-        for file_path in [cpp_file, exe_file]:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
\ No newline at end of file
+    async def stream():
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    return
+                yield json.dumps(event) + "\n"
+        finally:
+            # Client went away: stop the program instead of running it for nobody
+            task.cancel()
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@router.get("/execute/stats")
+async def get_execution_stats():
+    """Get execution queue depth and timing metrics"""
+    stats = execution_engine.stats()
+    stats["pythonPool"] = python_pool.stats()
+    stats["cppCache"] = compile_cache.stats()
+    stats["dedup"] = ExecutionService.stats()
+    return stats
\ No newline at end of file
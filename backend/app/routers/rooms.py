@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
 from app.database import get_db
 from app.schemas.room import RoomCreate, RoomResponse
-from app.services.room_service import RoomService
+from app.services.revision_store import revision_store
+from app.services.room_persister import room_persister
+from app.services.room_service import RoomService, room_etag
+from app.services.websocket_manager import websocket_manager
 
 router = APIRouter()
 
@@ -27,16 +32,61 @@ async def create_room(
 
 
 @router.get("/rooms/{room_id}")
-async def get_room(room_id: str, db: AsyncSession = Depends(get_db)):
-    """Get room information"""
-    room = await RoomService.get_room_by_id(db, room_id)
+async def get_room(room_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    """Get room information, with live code for rooms active on this worker"""
+    # Other workers save rooms without invalidating the cache here
+    use_cache = settings.backplane == "memory"
+    room = await RoomService.get_room_info(db, room_id, use_cache=use_cache)
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
+    code, language, etag = room["codeContent"], room["language"], room["etag"]
+    # A room that just emptied is gone from the manager but may not be saved yet
+    state = websocket_manager.room_states.get(room_id) or room_persister.pending_state(room_id)
+    if state is not None:
+        code, language = state["document"].text(), state["language"]
+        etag = room_etag(language, code)
+    
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return {
+        "roomId": room["roomId"],
+        "language": language,
+        "codeContent": code,
+        "createdAt": room["createdAt"],
+        "updatedAt": room["updatedAt"]
+    }
+
+
+@router.get("/rooms/{room_id}/revisions")
+async def list_room_revisions(
+    room_id: str,
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """List saved revisions of a room's code, newest first"""
+    if not await RoomService.get_room_info(db, room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    
     return {
-        "roomId": room.room_id,
-        "language": room.language,
-        "codeContent": room.code_content,
-        "createdAt": room.created_at,
-        "updatedAt": room.updated_at
-    }
\ No newline at end of file
+        "roomId": room_id,
+        "revisions": await revision_store.list_revisions(db, room_id, limit=limit, before=before)
+    }
+
+
+@router.get("/rooms/{room_id}/revisions/{revision}")
+async def get_room_revision(room_id: str, revision: int, db: AsyncSession = Depends(get_db)):
+    """Get a room's code as it was at a saved revision"""
+    if not await RoomService.get_room_info(db, room_id):
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    saved = await revision_store.get_revision(db, room_id, revision)
+    if not saved:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    
+    return saved
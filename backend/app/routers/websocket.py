@@ -1,10 +1,12 @@
-import json
+import math
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
+from app.middleware.rate_limiter import rate_limiter
 from app.schemas.websocket import WebSocketMessage
 from app.services.websocket_manager import websocket_manager
 from app.services.room_service import RoomService
+from app.services.wire_protocol import FrameError, negotiate
 
 router = APIRouter()
 
@@ -19,51 +21,56 @@ async def websocket_endpoint(websocket: WebSocket, room_id: str):
         query_params = dict(websocket.query_params)
         display_name = query_params.get('display_name', 'Anonymous')
         
+        # Clients that offer the compact subprotocol get binary msgpack frames
+        codec, subprotocol = negotiate(websocket.scope.get("subprotocols", []))
+        
         # Connect user to the room
-        user_id = await websocket_manager.connect(websocket, room_id, display_name)
+        user_id = await websocket_manager.connect(websocket, room_id, display_name, codec, subprotocol)
         
         while True:
             # Receive message from client
-            data = await websocket.receive_text()
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
             
             try:
-                message_data = json.loads(data)
+                message_data = codec.decode(frame["text"] if frame.get("text") is not None else frame.get("bytes"))
+                # The socket belongs to the room in its URL, whatever the frame says
+                message_data["roomId"] = room_id
                 message = WebSocketMessage(**message_data)
                 
+                # Runs spend the same budget as POST /api/execute
+                if message.type == "execute":
+                    retry_after = await rate_limiter.acquire(websocket.client.host, "/api/execute")
+                    if retry_after > 0:
+                        await websocket_manager.send_to_user({
+                            "type": "error",
+                            "message": f"Too many runs, try again in {math.ceil(retry_after)}s"
+                        }, room_id, user_id)
+                        continue
+                
                 # Handle the message
                 await websocket_manager.handle_message(message, user_id)
                 
-            except json.JSONDecodeError:
-                await websocket_manager.send_personal_message({
+            except FrameError as e:
+                await websocket_manager.send_to_user({
                     "type": "error",
-                    "message": "Invalid JSON format"
-                }, websocket)
+                    "message": str(e)
+                }, room_id, user_id)
             except Exception as e:
-                await websocket_manager.send_personal_message({
+                await websocket_manager.send_to_user({
                     "type": "error",
                     "message": f"Error processing message: {str(e)}"
-                }, websocket)
+                }, room_id, user_id)
     
     except WebSocketDisconnect:
         pass
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        # Clean up connection
+        # Clean up connection and notify other users about disconnection
         if user_id:
-            websocket_manager.disconnect(room_id, user_id)
-            
-            # Notify other users about disconnection
-            remaining_users = list(websocket_manager.room_users.get(room_id, {}).values())
-            await websocket_manager.broadcast_to_room({
-                "type": "user_left",
-                "roomId": room_id,
-                "userId": user_id,
-                "data": {
-                    "userCount": websocket_manager.get_room_user_count(room_id),
-                    "connectedUsers": remaining_users
-                }
-            }, room_id)
+            await websocket_manager.leave_room(room_id, user_id)
 
 
 @router.get("/ws/rooms/{room_id}/status")
@@ -72,5 +79,8 @@ async def get_room_status(room_id: str):
     return {
         "roomId": room_id,
         "userCount": websocket_manager.get_room_user_count(room_id),
-        "hasCode": bool(websocket_manager.get_room_code(room_id))
+        "hasCode": bool(websocket_manager.get_room_code(room_id)),
+        "fanout": websocket_manager.get_room_fanout_stats(room_id),
+        "owner": websocket_manager.get_room_owner(room_id),
+        "worker": websocket_manager.worker_id
     }
\ No newline at end of file
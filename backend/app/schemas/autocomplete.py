@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 
 class AutocompleteRequest(BaseModel):
@@ -11,4 +11,17 @@ class AutocompleteRequest(BaseModel):
 class AutocompleteResponse(BaseModel):
     suggestion: str
     insertPosition: int
-    confidence: float = 0.8
\ No newline at end of file
+    confidence: float = 0.8
+
+
+class AutocompleteBatchRequest(BaseModel):
+    requests: List[AutocompleteRequest]
+
+
+class AutocompleteBatchItem(AutocompleteResponse):
+    durationMs: float
+
+
+class AutocompleteBatchResponse(BaseModel):
+    responses: List[AutocompleteBatchItem]
+    deduplicated: int = 0
@@ -3,7 +3,7 @@ from typing import Optional, Any, Dict
 
 
 class WebSocketMessage(BaseModel):
-    type: str  # "join_room", "code_update", "cursor_update", "user_joined", "user_left"
+    type: str  # "join_room", "code_update", "code_delta", "cursor_update", "execute", "autocomplete", "user_joined", "user_left"
     roomId: str
     userId: Optional[str] = None
     data: Optional[Dict[str, Any]] = None
\ No newline at end of file
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+from app.config import settings
+from app.schemas.autocomplete import AutocompleteRequest, AutocompleteResponse
+from app.services.autocomplete_service import AutocompleteService
+from app.services.document import Rope
+
+logger = logging.getLogger(__name__)
+
+Reply = Callable[[AutocompleteResponse], Awaitable[None]]
+
+
+class AutocompleteScheduler:
+    """Keeps at most one autocomplete request per client in flight.
+
+    Clients ask for a suggestion on every keystroke, so a new request from
+    the same client cancels the one still running, upstream call included.
+    Requests arriving within debounce seconds of the previous one wait out
+    that window first, so a burst of typing costs one completion. Requests
+    carry an increasing sequence number; ones older than the latest seen
+    are dropped.
+    """
+
+    def __init__(self, debounce: float = 0.05):
+        self.debounce = debounce
+        self.requests = 0
+        self.completed = 0
+        self.superseded = 0
+        self.stale = 0
+        self._pending: Dict[Hashable, asyncio.Task] = {}
+        self._latest_seq: Dict[Hashable, int] = {}
+        self._last_request: Dict[Hashable, float] = {}
+
+    def submit(
+        self,
+        client: Hashable,
+        request: AutocompleteRequest,
+        reply: Reply,
+        seq: Optional[int] = None,
+        document: Optional[Rope] = None
+    ) -> bool:
+        """Schedule a request for client; returns False if it was already superseded.
+
+        With a document (a room's live buffer) the suggestion is computed
+        against its contents when the request runs, not request.code.
+        """
+        self.requests += 1
+        latest = self._latest_seq.get(client)
+        if seq is not None and latest is not None and seq <= latest:
+            self.stale += 1
+            return False
+        if seq is not None:
+            self._latest_seq[client] = seq
+
+        previous = self._pending.pop(client, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+
+        # The first request after a pause runs at once, the rest of a burst waits
+        now = time.monotonic()
+        last = self._last_request.get(client)
+        delay = self.debounce if last is not None and now - last < self.debounce else 0.0
+        self._last_request[client] = now
+
+        self._pending[client] = asyncio.create_task(self._run(client, request, reply, delay, document))
+        return True
+
+    async def _run(self, client: Hashable, request: AutocompleteRequest, reply: Reply, delay: float, document: Optional[Rope]):
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            response = await AutocompleteService.get_autocomplete_suggestion(request, document)
+            await reply(response)
+            self.completed += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Autocomplete request failed")
+        finally:
+            if self._pending.get(client) is asyncio.current_task():
+                del self._pending[client]
+
+    def forget(self, client: Hashable):
+        """Cancel a departed client's request and drop its sequencing state"""
+        task = self._pending.pop(client, None)
+        if task is not None:
+            task.cancel()
+        self._latest_seq.pop(client, None)
+        self._last_request.pop(client, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "completed": self.completed,
+            "superseded": self.superseded,
+            "stale": self.stale,
+            "pending": len(self._pending),
+        }
+
+
+# Global scheduler for autocomplete requests sent over room sockets
+autocomplete_scheduler = AutocompleteScheduler(debounce=settings.autocomplete_debounce)
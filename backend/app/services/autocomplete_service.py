@@ -1,85 +1,254 @@
-import requests
-import json
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from app.config import settings
+from app.services.bracket_tracker import tracker_for_document
 from app.schemas.autocomplete import AutocompleteRequest, AutocompleteResponse
+from app.services.completion_client import completion_client
+from app.services.document import LineIndex, Rope
+from app.services.symbol_index import index_for_document, index_for_text
+from app.services.ttl_cache import TTLCache
+
+# Longest suggestion ever returned, so the furthest a user can type into one
+MAX_SUGGESTION_LENGTH = 100
+# Lines either side of the cursor indexed for symbols when the code came with the request
+SYMBOL_WINDOW_LINES = 500
+# Shortest word at the cursor that identifiers and keywords are suggested for
+MIN_SYMBOL_PREFIX = 2
+
+_WORD_BEFORE = re.compile(r"(?<![A-Za-z0-9_])[A-Za-z_][A-Za-z0-9_]*$")
+_WORD_AFTER = re.compile(r"[A-Za-z0-9_]")
+
+
+class CursorContext:
+    """The cursor's line and the lines just above it, read once per request"""
+
+    # Lines above the cursor line included in the context window
+    LINES_BEFORE = 2
+
+    def __init__(self, document: Union[LineIndex, Rope], cursor_position: int):
+        line, column = document.offset_to_line_col(cursor_position)
+        line_start = document.line_start(line)
+        window_start = document.line_start(max(0, line - CursorContext.LINES_BEFORE))
+        line_end = document.line_end(line)
+
+        self.document = document
+        self.line = line
+        self.current_line = document.slice(line_start, line_end)
+        self.current_text = self.current_line[:column]
+        self.context = document.slice(window_start, line_end)
+        # The window up to the cursor, and the rest of the cursor line
+        self.before = self.context[:line_start - window_start + column]
+        self.after = self.current_line[column:]
 
 
 class AutocompleteService:
-    # Free Hugging Face API endpoint
-    HF_API_URL = "https://api-inference.huggingface.co/models/microsoft/DialoGPT-medium"
-    
+    prefix_hits = 0
+
+    @staticmethod
+    def context_key(language: str, before: str, after: str) -> Tuple[str, str, str]:
+        """Cache key for a cursor context; whitespace at line ends doesn't matter"""
+        lines = before.split('\n')
+        # Keep the text right before the cursor exact, it decides how suggestions are trimmed
+        normalized = [line.rstrip() for line in lines[:-1]] + lines[-1:]
+        return language.lower(), '\n'.join(normalized), after.rstrip()
+
+    @staticmethod
+    def _cached_suggestion(key: Tuple[str, str, str], typed_limit: int) -> Optional[Tuple[str, float]]:
+        """Look up a cursor context, or a cached one the user has since typed into.
+
+        If "def get_na" was cached with suggestion "me(self):" and the user
+        has now typed "def get_nam", the answer is "e(self):".
+        """
+        entry = suggestion_cache.get(key)
+        if entry is not None:
+            return entry
+
+        language, before, after = key
+        for typed in range(1, min(typed_limit, MAX_SUGGESTION_LENGTH) + 1):
+            entry = suggestion_cache.peek((language, before[:-typed], after))
+            if entry is None:
+                continue
+            suggestion, confidence = entry
+            if len(suggestion) > typed and suggestion.startswith(before[-typed:]):
+                AutocompleteService.prefix_hits += 1
+                entry = (suggestion[typed:], confidence)
+                suggestion_cache.set(key, entry)
+                return entry
+        return None
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Suggestion cache metrics; prefix hits are counted as cache misses there"""
+        cache = suggestion_cache.stats()
+        lookups = cache["hits"] + cache["misses"]
+        served = cache["hits"] + AutocompleteService.prefix_hits
+        return {
+            "cache": cache,
+            "prefixHits": AutocompleteService.prefix_hits,
+            "hitRate": round(served / lookups, 3) if lookups else 0.0,
+        }
+
     @staticmethod
-    def get_autocomplete_suggestion(request: AutocompleteRequest) -> AutocompleteResponse:
-        """Generate free AI-powered autocomplete suggestion using Hugging Face"""
+    async def get_autocomplete_suggestion(
+        request: AutocompleteRequest,
+        document: Optional[Rope] = None
+    ) -> AutocompleteResponse:
+        """Generate free AI-powered autocomplete suggestion using Hugging Face
+
+        Pass a room's live buffer as document to complete it in place of
+        request.code, without materializing the whole text.
+        """
+        # Get context around cursor position
+        source = document if document is not None else LineIndex(request.code)
+        cursor = CursorContext(source, request.cursorPosition)
+        
         try:
-            # Get context around cursor position
-            lines = request.code.split('\n')
-            cursor_line = request.code[:request.cursorPosition].count('\n')
-            
-            if cursor_line < len(lines):
-                current_line = lines[cursor_line]
-                line_position = request.cursorPosition - sum(len(line) + 1 for line in lines[:cursor_line])
-                current_text = current_line[:line_position] if line_position >= 0 else ""
-            else:
-                current_text = ""
-            
-            # Get surrounding context (2 lines before)
-            start_line = max(0, cursor_line - 2)
-            context_lines = lines[start_line:cursor_line + 1]
-            context = "\n".join(context_lines)
+            key = AutocompleteService.context_key(request.language, cursor.before, cursor.after)
+            result = AutocompleteService._local_suggestion(request, cursor, key)
             
-            # Create prompt for code completion
-            prompt = f"Complete this {request.language} code: {context}"
+            if result is None:
+                # Call the upstream model for complex completions; None means it
+                # is disabled, unavailable, failing or too busy right now
+                prompt = AutocompleteService._prompt(request, cursor)
+                generated = None
+                if settings.autocomplete_model_enabled:
+                    generated = await completion_client.complete(prompt, max_length=50)
+                result = AutocompleteService._model_suggestion(key, prompt, generated)
             
-            # First check for syntax completion
-            syntax_suggestion = AutocompleteService._check_syntax_completion(current_text, request.language)
-            if syntax_suggestion:
+            if result is not None:
                 return AutocompleteResponse(
-                    suggestion=syntax_suggestion,
+                    suggestion=result[0],
                     insertPosition=request.cursorPosition,
-                    confidence=0.95
+                    confidence=result[1]
                 )
             
-            # Call free Hugging Face API for complex completions
-            response = requests.post(
-                AutocompleteService.HF_API_URL,
-                headers={"Content-Type": "application/json"},
-                json={"inputs": prompt, "parameters": {"max_length": 50}},
-                timeout=3
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if isinstance(result, list) and len(result) > 0:
-                    suggestion = result[0].get('generated_text', '').replace(prompt, '').strip()
-                    if suggestion:
-                        return AutocompleteResponse(
-                            suggestion=suggestion[:100],
-                            insertPosition=request.cursorPosition,
-                            confidence=0.8
-                        )
-            
-            # Fallback to smart suggestions
-            return AutocompleteService._smart_suggestion(request)
+            # Fallback to smart suggestions; not cached, so the model is
+            # asked again once it is reachable
+            return AutocompleteService._smart_suggestion(request, cursor)
             
         except Exception as e:
-            print(f"Hugging Face API error: {e}")
-            return AutocompleteService._smart_suggestion(request)
+            print(f"Autocomplete error: {e}")
+            return AutocompleteService._smart_suggestion(request, cursor)
     
     @staticmethod
-    def _smart_suggestion(request: AutocompleteRequest) -> AutocompleteResponse:
-        """Smart syntax-aware suggestions"""
-        lines = request.code.split('\n')
-        cursor_line = request.code[:request.cursorPosition].count('\n')
+    async def get_batch_suggestions(requests: List[AutocompleteRequest]) -> Tuple[List[Tuple[AutocompleteResponse, float]], int]:
+        """Suggestions for several cursors at once, in request order, with seconds spent on each.
+
+        Requests on the same code share one line index and lexer state, and
+        identical cursor contexts are worked out once. Everything the local
+        rules can't answer goes to the model in a single combined call.
+        Also returns how many requests reused another one's result.
+        """
+        documents: Dict[str, LineIndex] = {}
+        computed: Dict[Tuple[Tuple[str, str, str], str], Optional[Tuple[str, float]]] = {}
+        cursors: List[CursorContext] = []
+        results: List[Optional[Tuple[str, float]]] = []
+        durations: List[float] = []
+        waiting: Dict[str, List[Tuple[int, Tuple[str, str, str]]]] = {}  # prompt -> items needing the model
+        deduplicated = 0
         
-        if cursor_line < len(lines):
-            current_line = lines[cursor_line]
-            line_position = request.cursorPosition - sum(len(line) + 1 for line in lines[:cursor_line])
-            current_text = current_line[:line_position] if line_position >= 0 else ""
-        else:
-            current_text = ""
+        for index, request in enumerate(requests):
+            start = time.perf_counter()
+            document = documents.get(request.code)
+            if document is None:
+                document = documents[request.code] = LineIndex(request.code)
+            cursor = CursorContext(document, request.cursorPosition)
+            cursors.append(cursor)
+            result = None
+            try:
+                key = AutocompleteService.context_key(request.language, cursor.before, cursor.after)
+                if (key, request.code) in computed:
+                    deduplicated += 1
+                    result = computed[(key, request.code)]
+                else:
+                    result = computed[(key, request.code)] = AutocompleteService._local_suggestion(request, cursor, key)
+                if result is None:
+                    waiting.setdefault(AutocompleteService._prompt(request, cursor), []).append((index, key))
+            except Exception as e:
+                print(f"Autocomplete error: {e}")
+            results.append(result)
+            durations.append(time.perf_counter() - start)
+        
+        if waiting and settings.autocomplete_model_enabled:
+            prompts = list(waiting)
+            start = time.perf_counter()
+            generated = await completion_client.complete_many(prompts, max_length=50)
+            elapsed = time.perf_counter() - start
+            for prompt, text in zip(prompts, generated):
+                for index, key in waiting[prompt]:
+                    results[index] = AutocompleteService._model_suggestion(key, prompt, text)
+                    durations[index] += elapsed
+        
+        responses = []
+        for request, cursor, result, duration in zip(requests, cursors, results, durations):
+            if result is None:
+                start = time.perf_counter()
+                response = AutocompleteService._smart_suggestion(request, cursor)
+                duration += time.perf_counter() - start
+            else:
+                response = AutocompleteResponse(
+                    suggestion=result[0],
+                    insertPosition=request.cursorPosition,
+                    confidence=result[1]
+                )
+            responses.append((response, duration))
+        return responses, deduplicated
+    
+    @staticmethod
+    def _local_suggestion(
+        request: AutocompleteRequest,
+        cursor: CursorContext,
+        key: Tuple[str, str, str]
+    ) -> Optional[Tuple[str, float]]:
+        """Suggestion and confidence from the cache and local rules, or None to ask the model"""
+        # Close what is left open first; not cached, because that depends on
+        # the whole document rather than the cursor context
+        closing = AutocompleteService._closing_sequence(cursor, request.language)
+        if closing:
+            return closing, 0.95
+        
+        # Serve repeated and typed-ahead contexts without running the pipeline
+        cached = AutocompleteService._cached_suggestion(key, len(cursor.current_text))
+        if cached is not None:
+            return cached
+        
+        # Finish the identifier being typed from the document's own symbols
+        symbol_suggestion = AutocompleteService._symbol_suggestion(request, cursor)
+        if symbol_suggestion:
+            return symbol_suggestion, 0.85
+        
+        # Then check for syntax completion
+        syntax_suggestion = AutocompleteService._check_syntax_completion(cursor, request.language)
+        if syntax_suggestion:
+            return syntax_suggestion, 0.95
+        return None
+    
+    @staticmethod
+    def _prompt(request: AutocompleteRequest, cursor: CursorContext) -> str:
+        # Create prompt for code completion
+        return f"Complete this {request.language} code: {cursor.context}"
+    
+    @staticmethod
+    def _model_suggestion(key: Tuple[str, str, str], prompt: str, generated: Optional[str]) -> Optional[Tuple[str, float]]:
+        """Suggestion from the model's output for prompt, cached for the cursor context"""
+        if not generated:
+            return None
+        suggestion = generated.replace(prompt, '').strip()[:MAX_SUGGESTION_LENGTH]
+        if not suggestion:
+            return None
+        suggestion_cache.set(key, (suggestion, 0.8))
+        return suggestion, 0.8
+    
+    @staticmethod
+    def _smart_suggestion(request: AutocompleteRequest, cursor: Optional[CursorContext] = None) -> AutocompleteResponse:
+        """Smart syntax-aware suggestions"""
+        if cursor is None:
+            cursor = CursorContext(LineIndex(request.code), request.cursorPosition)
+        current_text = cursor.current_text
         
         # Check for syntax completion needs
-        suggestion = AutocompleteService._check_syntax_completion(current_text, request.language)
+        suggestion = AutocompleteService._check_syntax_completion(cursor, request.language)
         if suggestion:
             return AutocompleteResponse(
                 suggestion=suggestion,
@@ -97,48 +266,57 @@ class AutocompleteService:
         )
     
     @staticmethod
-    def _check_syntax_completion(text: str, language: str) -> str:
-        """Check for incomplete syntax and suggest completion"""
-        text = text.strip()
+    def _symbol_suggestion(request: AutocompleteRequest, cursor: CursorContext) -> str:
+        """Rest of the best-ranked known identifier starting with the word at the cursor"""
+        word = _WORD_BEFORE.search(cursor.current_text)
+        if word is None or len(word.group()) < MIN_SYMBOL_PREFIX or _WORD_AFTER.match(cursor.after):
+            return ""
+        prefix = word.group()
         
-        if language.lower() == 'python':
-            # Check for unclosed parentheses
-            open_parens = text.count('(') - text.count(')')
-            if open_parens > 0:
-                return ')' * open_parens
-            
-            # Check for unclosed brackets
-            open_brackets = text.count('[') - text.count(']')
-            if open_brackets > 0:
-                return ']' * open_brackets
-            
-            # Check for unclosed braces
-            open_braces = text.count('{') - text.count('}')
-            if open_braces > 0:
-                return '}' * open_braces
-            
-            # Check for unclosed quotes
-            if text.count('"') % 2 == 1:
-                return '"'
-            if text.count("'") % 2 == 1:
-                return "'"
-            
-            # Check for print statement without closing
-            if text.endswith('print(') or 'print(' in text and text.count('(') > text.count(')'):
-                return ')'
-            
-        elif language.lower() == 'cpp':
-            # Check for unclosed parentheses
-            open_parens = text.count('(') - text.count(')')
-            if open_parens > 0:
-                return ')' * open_parens
-            
-            # Check for unclosed braces
-            open_braces = text.count('{') - text.count('}')
-            if open_braces > 0:
-                return '}' * open_braces
-            
+        document = cursor.document
+        if isinstance(document, Rope):
+            # Room buffers keep an incrementally updated index
+            index = index_for_document(document, request.language)
+            line = cursor.line
+        else:
+            first = max(0, cursor.line - SYMBOL_WINDOW_LINES)
+            last = cursor.line + SYMBOL_WINDOW_LINES
+            index = index_for_text(document.slice(document.line_start(first), document.line_end(last)), request.language)
+            line = cursor.line - first
+        
+        # Keywords only start a statement; attribute names after a dot are
+        # never keywords or builtins either
+        before_word = cursor.current_text[:word.start()]
+        names = index.complete(
+            prefix,
+            line,
+            limit=1,
+            keywords=not before_word.strip(),
+            builtins=not before_word.endswith(".")
+        )
+        return names[0][len(prefix):] if names else ""
+    
+    @staticmethod
+    def _closing_sequence(cursor: CursorContext, language: str) -> str:
+        """Close the strings, comments and brackets left open at the cursor"""
+        # Room buffers, and code shared by a batch, keep the lexer state of
+        # each line between requests
+        tracker = tracker_for_document(cursor.document, language)
+        if tracker is None:
+            return ""
+        return tracker.closing(cursor.document, cursor.line, len(cursor.current_text))
+    
+    @staticmethod
+    def _check_syntax_completion(cursor: CursorContext, language: str) -> str:
+        """Close what is left open at the cursor, or end a C++ statement"""
+        language = language.lower()
+        closing = AutocompleteService._closing_sequence(cursor, language)
+        if closing:
+            return closing
+        
+        if language == 'cpp':
             # Check for missing semicolon
+            text = cursor.current_text.strip()
             if text and not text.endswith((';', '{', '}', ':')) and not text.startswith(('#', '//', '/*')):
                 return ';'
         
@@ -172,4 +350,11 @@ class AutocompleteService:
             else:
                 return "// TODO"
         else:
-            return "// Complete this"
\ No newline at end of file
+            return "// Complete this"
+
+
+# Recent suggestions by cursor context; a TTL of 0 disables caching
+suggestion_cache = TTLCache(
+    max_entries=settings.autocomplete_cache_size if settings.autocomplete_cache_ttl > 0 else 0,
+    ttl=settings.autocomplete_cache_ttl
+)
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.redis_protocol import RedisConnection, read_reply
+
+logger = logging.getLogger(__name__)
+
+EnvelopeHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class Backplane(ABC):
+    """Relays room messages between server processes.
+
+    Every worker publishes envelopes (plain JSON-able dicts) and receives the
+    envelopes published by every worker, its own included. An envelope with
+    a target is only delivered to that worker. Envelopes that could not be
+    sent are passed to on_dropped, if set.
+    """
+
+    def __init__(self):
+        self._handler: Optional[EnvelopeHandler] = None
+        self.worker_id: Optional[str] = None
+        self.on_dropped: Optional[EnvelopeHandler] = None
+
+    async def start(self, handler: EnvelopeHandler, worker_id: str = None):
+        self._handler = handler
+        self.worker_id = worker_id
+
+    @abstractmethod
+    async def publish(self, envelope: Dict[str, Any], target: str = None):
+        """Send an envelope to every worker, or only to target"""
+
+    async def stop(self):
+        self._handler = None
+
+    async def _dropped(self, envelopes: List[Dict[str, Any]]):
+        if self.on_dropped is None:
+            return
+        for envelope in envelopes:
+            try:
+                await self.on_dropped(envelope)
+            except Exception as e:
+                logger.warning(f"Backplane drop handler failed: {e}")
+
+
+class InProcessBackplane(Backplane):
+    """Backplane between managers living in the same process.
+
+    Envelopes published while others are being delivered are queued, so
+    every member sees all envelopes of a channel in the same order.
+    """
+
+    _hubs: Dict[str, List["InProcessBackplane"]] = {}
+    _queues: Dict[str, Deque[Tuple[Dict[str, Any], Optional[str]]]] = {}
+
+    def __init__(self, channel: str = "codepair"):
+        super().__init__()
+        self.channel = channel
+
+    async def start(self, handler: EnvelopeHandler, worker_id: str = None):
+        await super().start(handler, worker_id)
+        self._hubs.setdefault(self.channel, []).append(self)
+
+    async def publish(self, envelope: Dict[str, Any], target: str = None):
+        queue = self._queues.get(self.channel)
+        if queue is not None:
+            # Another publish is delivering; it picks this one up next
+            queue.append((envelope, target))
+            return
+        queue = self._queues[self.channel] = deque([(envelope, target)])
+        try:
+            while queue:
+                envelope, target = queue.popleft()
+                for member in list(self._hubs.get(self.channel, [])):
+                    if target is not None and member.worker_id != target:
+                        continue
+                    if member._handler is not None:
+                        try:
+                            await member._handler(envelope)
+                        except Exception as e:
+                            logger.warning(f"Backplane handler failed: {e}")
+        finally:
+            del self._queues[self.channel]
+
+    async def stop(self):
+        members = self._hubs.get(self.channel, [])
+        if self in members:
+            members.remove(self)
+        await super().stop()
+
+
+class RedisBackplane(Backplane):
+    """Backplane over Redis-protocol PUBLISH/SUBSCRIBE.
+
+    Publishes are queued and pipelined by a single pump task, so callers
+    never wait on a network round trip.
+    """
+
+    def __init__(self, url: str, channel: str = "codepair", max_pending: int = 10000):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._publisher: Optional[RedisConnection] = None
+        self._subscribed: Optional[asyncio.Event] = None
+
+    async def start(self, handler: EnvelopeHandler, worker_id: str = None):
+        await super().start(handler, worker_id)
+        self._outbox = asyncio.Queue()
+        self._subscribed = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._subscribe_loop()),
+            asyncio.create_task(self._publish_loop()),
+        ]
+        # Don't announce ourselves before we can hear the replies
+        try:
+            await asyncio.wait_for(self._subscribed.wait(), timeout=5.0)
+        except asyncio.TimeoutError:
+            logger.warning(f"Backplane at {self.url} is not reachable yet")
+
+    def _channel_for(self, worker_id: str = None) -> str:
+        return f"{self.channel}.{worker_id}" if worker_id else self.channel
+
+    async def publish(self, envelope: Dict[str, Any], target: str = None):
+        if self._outbox is None:
+            return
+        if self._outbox.qsize() >= self.max_pending:
+            self.dropped += 1
+            await self._dropped([envelope])
+            return
+        self._outbox.put_nowait((self._channel_for(target), json.dumps(envelope), envelope))
+
+    async def stop(self):
+        # Give queued publishes (e.g. a goodbye) a moment to go out
+        if self._outbox is not None:
+            for _ in range(20):
+                if self._outbox.empty():
+                    break
+                await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._publisher is not None:
+            await self._publisher.close()
+            self._publisher = None
+        await super().stop()
+
+    async def _subscribe_loop(self):
+        delay = 0.5
+        while True:
+            connection = None
+            try:
+                connection = await RedisConnection.open(self.url)
+                channels = [self.channel]
+                if self.worker_id:
+                    channels.append(self._channel_for(self.worker_id))
+                # Pipelined so both subscribe confirmations are read here
+                await connection.pipeline([("SUBSCRIBE", channel) for channel in channels])
+                self._subscribed.set()
+                delay = 0.5
+                while True:
+                    reply = await read_reply(connection.reader)
+                    if isinstance(reply, list) and len(reply) == 3 and reply[0] == b"message":
+                        envelope = json.loads(reply[2])
+                        if self._handler is not None:
+                            await self._handler(envelope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Backplane subscription lost: {e}; retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10.0)
+            finally:
+                if connection is not None:
+                    await connection.close()
+
+    async def _publish_loop(self):
+        while True:
+            payload = await self._outbox.get()
+            batch = [payload]
+            while not self._outbox.empty() and len(batch) < 256:
+                batch.append(self._outbox.get_nowait())
+            try:
+                if self._publisher is None:
+                    self._publisher = await RedisConnection.open(self.url)
+                await self._publisher.pipeline([("PUBLISH", channel, data) for channel, data, _ in batch])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Backplane publish failed, dropped {len(batch)} message(s): {e}")
+                self.dropped += len(batch)
+                if self._publisher is not None:
+                    await self._publisher.close()
+                    self._publisher = None
+                await self._dropped([envelope for _, _, envelope in batch])
+                await asyncio.sleep(0.5)
+
+
+def create_backplane() -> Backplane:
+    """Build the backplane selected by settings.backplane"""
+    if settings.backplane == "redis":
+        return RedisBackplane(settings.backplane_url, settings.backplane_channel)
+    if settings.backplane == "memory":
+        return InProcessBackplane(settings.backplane_channel)
+    raise ValueError(f"Unknown backplane: {settings.backplane}")
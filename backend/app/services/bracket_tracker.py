@@ -0,0 +1,147 @@
+import re
+import weakref
+from typing import List, NamedTuple, Optional, Tuple, Union
+from app.services.document import LineIndex, Rope
+
+CLOSERS = {"(": ")", "[": "]", "{": "}"}
+
+# Everything the lexer reacts to; the rest of a line is skipped by the regex
+_PYTHON_TOKENS = re.compile(r'\\.|"""|\'\'\'|["\'#()\[\]{}]')
+_C_LIKE_TOKENS = re.compile(r'\\.|/\*|\*/|//|["\'`()\[\]{}]')
+
+LANGUAGES = {
+    "python": (_PYTHON_TOKENS, ("#",), ('"""', "'''")),
+    "cpp": (_C_LIKE_TOKENS, ("//",), ()),
+    "javascript": (_C_LIKE_TOKENS, ("//",), ("`",)),
+    "typescript": (_C_LIKE_TOKENS, ("//",), ("`",)),
+}
+
+
+class LexState(NamedTuple):
+    """Where the lexer stands: open brackets with the line each was opened on,
+    the delimiter of an unterminated string and any comment in progress"""
+    brackets: Tuple[Tuple[str, int], ...] = ()
+    string: Optional[str] = None
+    comment: Optional[str] = None  # "line" or "block"
+
+
+def scan(language: str, text: str, state: LexState, line: int) -> LexState:
+    """Advance state over text, a piece of a single line"""
+    tokens, line_comments, multiline_strings = LANGUAGES[language]
+    brackets = list(state.brackets)
+    string = state.string
+    comment = state.comment
+    if comment == "line":
+        return state
+
+    for match in tokens.finditer(text):
+        token = match.group()
+        if comment == "block":
+            if token == "*/":
+                comment = None
+        elif string is not None:
+            # '"' followed by '""' still ends a '"' string, leaving an empty one
+            if token == string or (len(string) == 1 and token == string * 3):
+                string = None
+        elif token in line_comments:
+            comment = "line"
+            break
+        elif token == "/*":
+            comment = "block"
+        elif token in CLOSERS:
+            brackets.append((token, line))
+        elif token in (")", "]", "}"):
+            # Pop back to the matching bracket; a stray closer is ignored
+            for index in range(len(brackets) - 1, -1, -1):
+                if CLOSERS[brackets[index][0]] == token:
+                    del brackets[index:]
+                    break
+        elif token in ('"', "'", "`", '"""', "'''"):
+            string = token
+        # Escapes and "*/" outside a comment mean nothing here
+
+    return LexState(tuple(brackets), string, comment)
+
+
+def end_of_line(language: str, state: LexState) -> LexState:
+    """The state a new line starts in; only block comments and multi-line strings carry over"""
+    _, _, multiline_strings = LANGUAGES[language]
+    comment = state.comment if state.comment == "block" else None
+    string = state.string if state.string in multiline_strings else None
+    if comment == state.comment and string == state.string:
+        return state
+    return LexState(state.brackets, string, comment)
+
+
+def closing_sequence(language: str, state: LexState, line: int) -> str:
+    """Text that closes everything left open at the cursor, innermost first.
+
+    Python brackets always continue onto the next line, so all of them are
+    closed. In brace languages a "{" opened on an earlier line is a block
+    the cursor is inside of, so closing stops there.
+    """
+    if state.comment == "line":
+        return ""
+    if state.comment == "block":
+        return "*/"
+    closing = state.string or ""
+    for bracket, opened in reversed(state.brackets):
+        if bracket == "{" and opened < line and language != "python":
+            break
+        closing += CLOSERS[bracket]
+    return closing
+
+
+def _line(document: Union[LineIndex, Rope], number: int) -> str:
+    return document.slice(document.line_start(number), document.line_end(number))
+
+
+class BracketTracker:
+    """Lexer states at the start of each line of a document, computed lazily.
+
+    Editing a line only drops the cached states after it, so typing on the
+    cursor line rescans just that line. Lines are read from the document
+    as they are scanned.
+    """
+
+    def __init__(self, language: str):
+        self.language = language.lower()
+        self._version: Optional[int] = None  # document version the states hold for
+        self._states: List[LexState] = [LexState()]  # state at the start of each scanned line
+
+    def sync(self, document: Union[LineIndex, Rope]):
+        if document.version == self._version:
+            return
+        changed = document.changes_since(self._version) if self._version is not None else None
+        self._version = document.version
+        # States up to and including the start of the first changed line still hold
+        del self._states[(changed[0] if changed is not None else 0) + 1:]
+
+    def state_at(self, document: Union[LineIndex, Rope], line: int, column: int) -> LexState:
+        line = min(line, document.line_count - 1)
+        while len(self._states) <= line:
+            number = len(self._states) - 1
+            state = scan(self.language, _line(document, number), self._states[number], number)
+            self._states.append(end_of_line(self.language, state))
+        return scan(self.language, _line(document, line)[:column], self._states[line], line)
+
+    def closing(self, document: Union[LineIndex, Rope], line: int, column: int) -> str:
+        """Closing sequence for a cursor at (line, column)"""
+        return closing_sequence(self.language, self.state_at(document, line, column), line)
+
+
+# One tracker per live document, dropped along with it: room buffers live
+# as long as the room, a request's LineIndex as long as the request
+_trackers: "weakref.WeakKeyDictionary[Union[LineIndex, Rope], BracketTracker]" = weakref.WeakKeyDictionary()
+
+
+def tracker_for_document(document: Union[LineIndex, Rope], language: str) -> Optional[BracketTracker]:
+    """The up-to-date tracker of a document, or None for unknown languages"""
+    if language.lower() not in LANGUAGES:
+        return None
+    tracker = _trackers.get(document)
+    if tracker is None or tracker.language != language.lower():
+        tracker = BracketTracker(language)
+        _trackers[document] = tracker
+    tracker.sync(document)
+    return tracker
@@ -0,0 +1,171 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Union
+from fastapi import WebSocket
+from app.services.metrics import LatencyStats
+from app.services.wire_protocol import JSON_CODEC, Codec
+
+
+# Application close code sent to consumers that cannot keep up with their room
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+
+class ClientConnection:
+    """A websocket with its own bounded outbound queue drained by a writer task"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user_id: str,
+        max_queue: int = 256,
+        high_water: int = 64,
+        slow_consumer_grace: float = 5.0,
+        send_timeout: float = 2.0,
+        delivery_stats: Optional[LatencyStats] = None,
+        codec: Codec = JSON_CODEC,
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.codec = codec  # wire format the client negotiated
+        self.max_queue = max_queue
+        self.high_water = high_water
+        self.slow_consumer_grace = slow_consumer_grace
+        self.send_timeout = send_timeout
+        self.delivery_stats = delivery_stats
+        self.closed = False
+        self.dropped_frames = 0
+
+        # Each entry is [coalesce_key, payload, enqueued_at]; entries with a key
+        # are indexed so a newer frame can replace a stale one still waiting
+        self._queue: Deque[List] = deque()
+        self._pending: Dict[str, List] = {}
+        self._ready = asyncio.Event()
+        self._over_high_water_since: Optional[float] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the writer task"""
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._writer())
+
+    @property
+    def queue_size(self) -> int:
+        return len(self._queue)
+
+    def send(self, payload: Union[str, bytes], coalesce_key: str = None) -> bool:
+        """Queue a frame encoded with self.codec; returns False if the connection is gone or was evicted"""
+        if self.closed:
+            return False
+
+        if coalesce_key is not None:
+            entry = self._pending.get(coalesce_key)
+            if entry is not None:
+                # Replace the stale frame in place, keeping its queue position
+                entry[1] = payload
+                self.dropped_frames += 1
+                return True
+
+        if len(self._queue) >= self.max_queue:
+            if coalesce_key is not None:
+                # Droppable frame and no room for it
+                self.dropped_frames += 1
+                return True
+            self._evict("Outbound queue overflow")
+            return False
+
+        entry = [coalesce_key, payload, time.perf_counter()]
+        self._queue.append(entry)
+        if coalesce_key is not None:
+            self._pending[coalesce_key] = entry
+        self._ready.set()
+
+        return self._check_high_water()
+
+    def _check_high_water(self) -> bool:
+        """Evict consumers that stay above the high-water mark for too long"""
+        if len(self._queue) <= self.high_water:
+            self._over_high_water_since = None
+            return True
+
+        now = time.monotonic()
+        if self._over_high_water_since is None:
+            self._over_high_water_since = now
+        elif now - self._over_high_water_since > self.slow_consumer_grace:
+            self._evict("Slow consumer")
+            return False
+        return True
+
+    async def _writer(self):
+        """Drain the outbound queue onto the websocket"""
+        try:
+            while not self.closed:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+
+                coalesce_key, payload, enqueued_at = self._queue.popleft()
+                if coalesce_key is not None:
+                    self._pending.pop(coalesce_key, None)
+                if len(self._queue) <= self.high_water:
+                    self._over_high_water_since = None
+
+                send = self.websocket.send_bytes if isinstance(payload, bytes) else self.websocket.send_text
+                try:
+                    await asyncio.wait_for(send(payload), timeout=self.send_timeout)
+                except asyncio.TimeoutError:
+                    self._evict("Send timeout")
+                    return
+                except:
+                    # Connection is closed; the receive loop will clean up
+                    self.stop()
+                    return
+
+                if self.delivery_stats is not None:
+                    self.delivery_stats.record(time.perf_counter() - enqueued_at)
+        except asyncio.CancelledError:
+            pass
+
+    def _evict(self, reason: str):
+        """Drop queued frames and close the socket with the slow-consumer code"""
+        if self.closed:
+            return
+        self.stop()
+        asyncio.create_task(self.close(SLOW_CONSUMER_CLOSE_CODE, reason))
+
+    def stop(self):
+        """Stop the writer and discard anything still queued"""
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        if self._writer_task is not None and self._writer_task is not asyncio.current_task():
+            self._writer_task.cancel()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        """Stop the writer and close the underlying websocket"""
+        self.stop()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=self.send_timeout)
+        except:
+            pass
+
+
+class RemoteSocket:
+    """Websocket-like handle for a client whose socket lives on another worker.
+
+    Frames are relayed over the backplane to the worker holding the real
+    socket, which queues them on its own ClientConnection.
+    """
+
+    def __init__(self, publish: Callable[..., Awaitable[None]], worker_id: str, room_id: str, user_id: str):
+        self._publish = publish
+        self.worker_id = worker_id
+        self.room_id = room_id
+        self.user_id = user_id
+
+    async def send_text(self, payload: str):
+        await self._publish("deliver", target=self.worker_id, roomId=self.room_id, userId=self.user_id, payload=payload)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        await self._publish("close", target=self.worker_id, roomId=self.room_id, userId=self.user_id, code=code, reason=reason)
@@ -0,0 +1,213 @@
+import contextlib
+import hashlib
+import logging
+import os
+import shlex
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from app.config import settings
+from app.services.execution_engine import execution_engine, ExecutionResult
+from app.services.metrics import LatencyStats
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which a .partial file is taken to be left by a crashed compile
+PARTIAL_MAX_AGE = 60.0
+
+
+class CompiledProgram:
+    """A binary from the cache, or the failed compile that should have produced it"""
+
+    def __init__(self, path: Optional[str], compile_result: Optional[ExecutionResult], cached: bool):
+        self.path = path
+        self.compile_result = compile_result
+        self.cached = cached
+
+    @property
+    def ok(self) -> bool:
+        return self.path is not None
+
+
+class CompileCache:
+    """Content-addressed on-disk cache of compiled C++ binaries.
+
+    Binaries are keyed on the SHA-256 of the compiler, its flags and the
+    source, so re-running unchanged code skips compilation. The cache is
+    bounded by total size and evicts least recently used binaries first;
+    binaries that are currently running are never evicted. Concurrent
+    requests for the same source share one compile.
+
+    Workers may share the directory, but each one sizes and pins only the
+    binaries it knows about, so another worker can evict a binary this one
+    is about to run; callers treat a binary missing at run time as a miss.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, compiler: str = "g++", flags: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.compiler = compiler
+        self.flags = shlex.split(flags)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.compile_stats = LatencyStats()
+        # key -> size in bytes, least recently used first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._pins: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._loaded = False
+        self._flight = SingleFlight()
+
+    def key(self, source: str) -> str:
+        digest = hashlib.sha256()
+        for part in [self.compiler, *self.flags]:
+            digest.update(part.encode())
+            digest.update(b"\0")
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _load(self):
+        """Index binaries left by a previous run, least recently used first"""
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if name.endswith(".partial"):
+                # Leftover output from an interrupted compile; recent ones may
+                # still be on their way in from another worker
+                with contextlib.suppress(OSError):
+                    if now - os.stat(path).st_mtime > PARTIAL_MAX_AGE:
+                        os.unlink(path)
+                continue
+            if len(name) != 64:
+                continue
+            with contextlib.suppress(OSError):
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    @contextlib.asynccontextmanager
+    async def program(self, source: str):
+        """Yield the compiled program for source, compiling it on a miss.
+
+        The binary is pinned, and so safe from eviction, until the block exits.
+        """
+        self._load()
+        key = self.key(source)
+        self._pin(key)
+        try:
+            if key in self._entries and self._touch(key):
+                self.hits += 1
+                self._entries.move_to_end(key)
+                yield CompiledProgram(self._path(key), None, cached=True)
+                return
+
+            self.misses += 1
+            compile_result = await self._flight.do(key, lambda: self._compile(key, source))
+            if key in self._entries:
+                yield CompiledProgram(self._path(key), compile_result, cached=False)
+            else:
+                yield CompiledProgram(None, compile_result, cached=False)
+        finally:
+            self._unpin(key)
+
+    async def _compile(self, key: str, source: str) -> ExecutionResult:
+        start = time.perf_counter()
+        with tempfile.TemporaryDirectory() as workdir:
+            source_file = os.path.join(workdir, "main.cpp")
+            with open(source_file, "w") as f:
+                f.write(source)
+            output = os.path.join(workdir, "main")
+            # Relative paths keep compiler messages free of the temp directory
+            result = await execution_engine.run([self.compiler, *self.flags, "-o", "main", "main.cpp"], cwd=workdir)
+            self.compile_stats.record(time.perf_counter() - start)
+            if result.timed_out or result.returncode != 0:
+                return result
+
+            size = os.path.getsize(output)
+            # Move in under a temporary name, then rename, so a crash never
+            # leaves a truncated binary under a valid key
+            partial = self._path(f"{key}.{os.getpid()}.partial")
+            shutil.move(output, partial)
+            os.replace(partial, self._path(key))
+
+        if key in self._entries:
+            self._total_bytes -= self._entries.pop(key)
+        self._entries[key] = size
+        self._total_bytes += size
+        self._evict()
+        return result
+
+    def _touch(self, key: str) -> bool:
+        """Bump a binary's mtime so LRU order survives a restart; False if it is gone"""
+        try:
+            os.utime(self._path(key))
+            return True
+        except FileNotFoundError:
+            self._total_bytes -= self._entries.pop(key)
+            return False
+
+    def _pin(self, key: str):
+        self._pins[key] = self._pins.get(key, 0) + 1
+
+    def _unpin(self, key: str):
+        remaining = self._pins.get(key, 0) - 1
+        if remaining > 0:
+            self._pins[key] = remaining
+        else:
+            self._pins.pop(key, None)
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently used, unpinned binaries until under max_bytes"""
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                return
+            if key in self._pins:
+                continue
+            self._total_bytes -= self._entries.pop(key)
+            self.evictions += 1
+            try:
+                os.unlink(self._path(key))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not evict cached binary {key}: {e}")
+
+    def stats(self) -> Dict[str, object]:
+        """Cache metrics for the status endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "maxBytes": self.max_bytes,
+            "sharedCompiles": self._flight.shared,
+            "compileTime": self.compile_stats.snapshot(),
+        }
+
+
+# Global C++ compile cache
+compile_cache = CompileCache(
+    directory=settings.compile_cache_dir or os.path.join(tempfile.gettempdir(), "codepair-cpp-cache"),
+    max_bytes=settings.compile_cache_max_mb * 1024 * 1024,
+    compiler=settings.cpp_compiler,
+    flags=settings.cpp_flags
+)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Union
+import httpx
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stops calling an upstream that keeps failing or answering slowly.
+
+    After failure_threshold consecutive failures (slow calls count as
+    failures) the breaker opens and every call is refused for reset_timeout
+    seconds. Then a single trial call is let through: success closes the
+    breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, slow_call_threshold: float = 2.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_threshold = slow_call_threshold
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        """Whether a call may go to the upstream now"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+        # Half open: only one trial call at a time
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def release(self):
+        """Forget a call that was abandoned before the upstream answered"""
+        self._trial_in_flight = False
+
+    def record(self, ok: bool, duration: float):
+        """Record the outcome of a call that allow() let through"""
+        self._trial_in_flight = False
+        if ok and duration <= self.slow_call_threshold:
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class CompletionClient:
+    """Async client for the upstream code-completion model.
+
+    Requests share one pooled keep-alive HTTP client. At most
+    max_concurrency calls are in flight; callers beyond that, and all
+    callers while the circuit breaker is open, get None straight away so
+    they can fall back to local suggestions.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 3.0,
+        max_connections: int = 20,
+        max_concurrency: int = 10,
+        breaker: CircuitBreaker = None,
+        api_token: str = "",
+    ):
+        self.url = url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.api_token = api_token
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.saturated = 0
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            headers = {"Content-Type": "application/json"}
+            if self.api_token:
+                headers["Authorization"] = f"Bearer {self.api_token}"
+            self._client = httpx.AsyncClient(
+                headers=headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0,
+                ),
+            )
+        return self._client
+
+    async def complete(self, prompt: str, max_length: int = 50) -> Optional[str]:
+        """Return the model's generated text, or None if it is unavailable"""
+        result = await self._post(prompt, max_length)
+        return self._generated_text(result)
+
+    async def complete_many(self, prompts: List[str], max_length: int = 50) -> List[Optional[str]]:
+        """Generate text for several prompts in one upstream call, in order"""
+        result = await self._post(prompts, max_length)
+        if not isinstance(result, list) or len(result) != len(prompts):
+            return [None] * len(prompts)
+        return [self._generated_text(item) for item in result]
+
+    @staticmethod
+    def _generated_text(result: Any) -> Optional[str]:
+        # One prompt answers [{"generated_text": ...}], or just the dict inside a batch
+        if isinstance(result, list) and len(result) > 0:
+            result = result[0]
+        if isinstance(result, dict):
+            return result.get("generated_text", "")
+        return None
+
+    async def _post(self, inputs: Union[str, List[str]], max_length: int) -> Any:
+        """Send inputs to the upstream and return the decoded JSON, or None"""
+        if self.in_flight >= self.max_concurrency:
+            self.saturated += 1
+            return None
+        if not self.breaker.allow():
+            self.short_circuited += 1
+            return None
+
+        self.in_flight += 1
+        self.calls += 1
+        start = time.monotonic()
+        # True/False once the upstream answered or failed; None if the caller gave up
+        ok: Optional[bool] = False
+        try:
+            response = await self._get_client().post(
+                self.url,
+                json={"inputs": inputs, "parameters": {"max_length": max_length}},
+            )
+            if response.status_code != 200:
+                logger.warning(f"Completion upstream returned {response.status_code}")
+                return None
+            result = response.json()
+            ok = True
+            return result
+        except asyncio.CancelledError:
+            ok = None
+            raise
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Completion upstream error: {e!r}")
+            return None
+        finally:
+            self.in_flight -= 1
+            if ok is None:
+                self.breaker.release()
+            else:
+                if not ok:
+                    self.failures += 1
+                self.breaker.record(ok, time.monotonic() - start)
+
+    async def stop(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, object]:
+        """Upstream call metrics for the status endpoint"""
+        return {
+            "breaker": self.breaker.state,
+            "breakerOpened": self.breaker.times_opened,
+            "inFlight": self.in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "shortCircuited": self.short_circuited,
+            "saturated": self.saturated,
+        }
+
+
+# Global completion client
+completion_client = CompletionClient(
+    url=settings.autocomplete_api_url,
+    timeout=settings.autocomplete_timeout,
+    max_connections=settings.autocomplete_max_connections,
+    max_concurrency=settings.autocomplete_max_concurrency,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.autocomplete_breaker_failures,
+        reset_timeout=settings.autocomplete_breaker_reset,
+        slow_call_threshold=settings.autocomplete_slow_call
+    ),
+    api_token=settings.autocomplete_api_token
+)
@@ -0,0 +1,418 @@
+import random
+from bisect import bisect_right
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+# Chunks are kept between these sizes where possible; small edits are
+# spliced into an existing chunk instead of creating new nodes
+MAX_CHUNK = 1024
+BUILD_CHUNK = 512
+# Edits remembered for readers that catch up on the lines they touched
+CHANGE_LOG_SIZE = 256
+
+
+class _Node:
+    __slots__ = ("text", "priority", "left", "right", "length", "newlines", "count", "text_newlines")
+
+    def __init__(self, text: str, priority: float = None):
+        self.text = text
+        self.priority = random.random() if priority is None else priority
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+        self.text_newlines = text.count("\n")
+        self.length = len(text)
+        self.newlines = self.text_newlines
+        self.count = 1
+
+
+def _update(node: _Node):
+    length = len(node.text)
+    newlines = node.text_newlines
+    count = 1
+    if node.left is not None:
+        length += node.left.length
+        newlines += node.left.newlines
+        count += node.left.count
+    if node.right is not None:
+        length += node.right.length
+        newlines += node.right.newlines
+        count += node.right.count
+    node.length = length
+    node.newlines = newlines
+    node.count = count
+
+
+def _set_text(node: _Node, text: str):
+    node.text = text
+    node.text_newlines = text.count("\n")
+
+
+def _split(node: Optional[_Node], offset: int) -> Tuple[Optional[_Node], Optional[_Node]]:
+    """Split a tree so the first `offset` characters end up on the left"""
+    if node is None:
+        return None, None
+
+    left_length = node.left.length if node.left is not None else 0
+    if offset <= left_length:
+        left, right = _split(node.left, offset)
+        node.left = right
+        _update(node)
+        return left, node
+
+    text_end = left_length + len(node.text)
+    if offset >= text_end:
+        left, right = _split(node.right, offset - text_end)
+        node.right = left
+        _update(node)
+        return node, right
+
+    # The cut falls inside this node's chunk; the tail takes over its right
+    # subtree and keeps its priority so the heap order still holds
+    cut = offset - left_length
+    tail = _Node(node.text[cut:], node.priority)
+    tail.right = node.right
+    _update(tail)
+    _set_text(node, node.text[:cut])
+    node.right = None
+    _update(node)
+    return node, tail
+
+
+def _merge(left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+    if left is None:
+        return right
+    if right is None:
+        return left
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        _update(left)
+        return left
+    right.left = _merge(left, right.left)
+    _update(right)
+    return right
+
+
+def _build(chunks: List[str]) -> Optional[_Node]:
+    """Build a balanced tree whose priorities satisfy the heap order"""
+    if not chunks:
+        return None
+
+    def build(lo: int, hi: int) -> Optional[_Node]:
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        node = _Node(chunks[mid])
+        node.left = build(lo, mid)
+        node.right = build(mid + 1, hi)
+        return node
+
+    root = build(0, len(chunks))
+
+    # Hand out random priorities largest-first in breadth-first order
+    priorities = sorted((random.random() for _ in chunks), reverse=True)
+    level = [root]
+    index = 0
+    while level:
+        next_level = []
+        for node in level:
+            node.priority = priorities[index]
+            index += 1
+            if node.left is not None:
+                next_level.append(node.left)
+            if node.right is not None:
+                next_level.append(node.right)
+        level = next_level
+
+    def finish(node: Optional[_Node]):
+        if node is not None:
+            finish(node.left)
+            finish(node.right)
+            _update(node)
+
+    finish(root)
+    return root
+
+
+def _chunks(text: str) -> List[str]:
+    return [text[i:i + BUILD_CHUNK] for i in range(0, len(text), BUILD_CHUNK)]
+
+
+class Rope:
+    """Editable text buffer for a room's document.
+
+    Text is stored as chunks in an implicit treap, so inserts, deletes and
+    offset/line conversions are O(log n). The full string is materialized
+    on demand and cached until the next edit.
+    """
+
+    def __init__(self, text: str = ""):
+        self._root = _build(_chunks(text))
+        self._snapshot: Optional[str] = text
+        # Bumped by every edit; _changes holds (first line, lines after) of the latest ones
+        self.version = 0
+        self._changes: Deque[Tuple[int, int]] = deque(maxlen=CHANGE_LOG_SIZE)
+
+    def __len__(self) -> int:
+        return self._root.length if self._root is not None else 0
+
+    def __str__(self) -> str:
+        return self.text()
+
+    @property
+    def line_count(self) -> int:
+        return (self._root.newlines if self._root is not None else 0) + 1
+
+    def text(self) -> str:
+        """Return the whole document, cached until the next edit"""
+        if self._snapshot is None:
+            parts: List[str] = []
+            self._collect(self._root, parts)
+            self._snapshot = "".join(parts)
+        return self._snapshot
+
+    def _collect(self, node: Optional[_Node], parts: List[str]):
+        while node is not None:
+            self._collect(node.left, parts)
+            parts.append(node.text)
+            node = node.right
+
+    def slice(self, start: int, end: int) -> str:
+        """Return text[start:end] without materializing the document"""
+        start = max(0, start)
+        end = min(len(self), end)
+        if start >= end:
+            return ""
+        if self._snapshot is not None:
+            return self._snapshot[start:end]
+        parts: List[str] = []
+        self._collect_range(self._root, start, end, 0, parts)
+        return "".join(parts)
+
+    def _collect_range(self, node: Optional[_Node], start: int, end: int, base: int, parts: List[str]):
+        while node is not None:
+            left_length = node.left.length if node.left is not None else 0
+            text_start = base + left_length
+            text_end = text_start + len(node.text)
+            if start < text_start:
+                self._collect_range(node.left, start, end, base, parts)
+            if start < text_end and end > text_start:
+                parts.append(node.text[max(0, start - text_start):end - text_start])
+            if end <= text_end:
+                return
+            base = text_end
+            node = node.right
+
+    def insert(self, offset: int, text: str):
+        """Insert text at offset"""
+        if not text:
+            return
+        if not 0 <= offset <= len(self):
+            raise ValueError("Insert offset is outside the document")
+        self._record_change(offset, offset)
+        self._snapshot = None
+
+        if len(text) <= MAX_CHUNK and self._splice(offset, 0, text):
+            return
+
+        left, right = _split(self._root, offset)
+        self._root = _merge(_merge(left, _build(_chunks(text))), right)
+        self._maybe_rebuild()
+
+    def delete(self, offset: int, length: int):
+        """Delete length characters starting at offset"""
+        if length <= 0:
+            return
+        if offset < 0 or offset + length > len(self):
+            raise ValueError("Delete range is outside the document")
+        self._record_change(offset, offset + length)
+        self._snapshot = None
+
+        if self._splice(offset, length, ""):
+            return
+
+        left, rest = _split(self._root, offset)
+        _, right = _split(rest, length)
+        self._root = _merge(left, right)
+        self._maybe_rebuild()
+
+    def apply_edits(self, edits: List[Dict[str, Any]]):
+        """Apply sorted, non-overlapping range edits given in original positions"""
+        for edit in reversed(edits):
+            pos = edit["pos"]
+            self.delete(pos, edit.get("delete", 0))
+            self.insert(pos, edit.get("insert", ""))
+
+    def _record_change(self, start: int, end: int):
+        """Log an edit of the text between offsets start and end, before it is made"""
+        first = self._newlines_before(start)
+        last = first if end == start else self._newlines_before(end)
+        self._changes.append((first, self.line_count - 1 - last))
+        self.version += 1
+
+    def changes_since(self, version: int) -> Optional[Tuple[int, int]]:
+        """Lines edited after version, as (unchanged lines at the start, unchanged lines at the end).
+
+        Returns None once the edits since version are no longer all logged.
+        """
+        behind = self.version - version
+        if not 0 <= behind <= len(self._changes):
+            return None
+        head = tail = self.line_count
+        for first, after in list(self._changes)[len(self._changes) - behind:]:
+            head = min(head, first)
+            tail = min(tail, after)
+        return head, tail
+
+    def _splice(self, offset: int, length: int, text: str) -> bool:
+        """Edit a single chunk in place; returns False if the edit spans chunks"""
+        node = self._root
+        path: List[_Node] = []
+        while node is not None:
+            path.append(node)
+            left_length = node.left.length if node.left is not None else 0
+            if offset < left_length or (offset == left_length and length == 0 and node.left is not None):
+                node = node.left
+                continue
+            offset -= left_length
+            if offset + length <= len(node.text) and (length == 0 or offset < len(node.text)):
+                new_text = node.text[:offset] + text + node.text[offset + length:]
+                if not new_text or len(new_text) > MAX_CHUNK:
+                    return False
+                _set_text(node, new_text)
+                for ancestor in reversed(path):
+                    _update(ancestor)
+                return True
+            if offset < len(node.text):
+                return False
+            offset -= len(node.text)
+            node = node.right
+        return False
+
+    def _maybe_rebuild(self):
+        """Re-chunk the tree once edits have fragmented it into many small nodes"""
+        root = self._root
+        if root is not None and root.count > 64 and root.count * BUILD_CHUNK > 4 * root.length:
+            self._root = _build(_chunks(self.text()))
+
+    def offset_to_line_col(self, offset: int) -> Tuple[int, int]:
+        """Convert a character offset into a 0-based (line, column) pair"""
+        offset = max(0, min(offset, len(self)))
+        line = self._newlines_before(offset)
+        return line, offset - self.line_start(line)
+
+    def line_col_to_offset(self, line: int, column: int) -> int:
+        """Convert a 0-based (line, column) pair into a character offset"""
+        start = self.line_start(line)
+        return min(start + column, self.line_end(line))
+
+    def _newlines_before(self, offset: int) -> int:
+        node = self._root
+        newlines = 0
+        while node is not None:
+            left_length = node.left.length if node.left is not None else 0
+            if offset <= left_length:
+                node = node.left
+                continue
+            if node.left is not None:
+                newlines += node.left.newlines
+            offset -= left_length
+            if offset <= len(node.text):
+                return newlines + node.text.count("\n", 0, offset)
+            newlines += node.text_newlines
+            offset -= len(node.text)
+            node = node.right
+        return newlines
+
+    def line_start(self, line: int) -> int:
+        """Offset of the first character of a 0-based line"""
+        if line <= 0:
+            return 0
+        if line >= self.line_count:
+            return len(self)
+        node = self._root
+        base = 0
+        remaining = line
+        while node is not None:
+            left_newlines = node.left.newlines if node.left is not None else 0
+            if remaining <= left_newlines:
+                node = node.left
+                continue
+            remaining -= left_newlines
+            base += node.left.length if node.left is not None else 0
+            if remaining <= node.text_newlines:
+                index = -1
+                for _ in range(remaining):
+                    index = node.text.index("\n", index + 1)
+                return base + index + 1
+            remaining -= node.text_newlines
+            base += len(node.text)
+            node = node.right
+        return len(self)
+
+    def line_end(self, line: int) -> int:
+        """Offset just past the last character of a line, excluding the newline"""
+        if line + 1 >= self.line_count:
+            return len(self)
+        return self.line_start(line + 1) - 1
+
+
+class LineIndex:
+    """Line start offsets of a fixed string, for O(log n) offset/line lookups.
+
+    Offers the same lookups as Rope, so code that reads lines around a
+    cursor can take either a request's code or a room's live buffer.
+    """
+
+    # The text never changes
+    version = 0
+
+    def __init__(self, text: str):
+        self._text = text
+        starts = [0]
+        find = text.find
+        index = find("\n")
+        while index != -1:
+            starts.append(index + 1)
+            index = find("\n", index + 1)
+        self._starts = starts
+
+    def __len__(self) -> int:
+        return len(self._text)
+
+    @property
+    def line_count(self) -> int:
+        return len(self._starts)
+
+    def text(self) -> str:
+        return self._text
+
+    def changes_since(self, version: int) -> Optional[Tuple[int, int]]:
+        return (self.line_count, 0) if version == 0 else None
+
+    def slice(self, start: int, end: int) -> str:
+        return self._text[max(0, start):end]
+
+    def offset_to_line_col(self, offset: int) -> Tuple[int, int]:
+        """Convert a character offset into a 0-based (line, column) pair"""
+        offset = max(0, min(offset, len(self._text)))
+        line = bisect_right(self._starts, offset) - 1
+        return line, offset - self._starts[line]
+
+    def line_col_to_offset(self, line: int, column: int) -> int:
+        """Convert a 0-based (line, column) pair into a character offset"""
+        return min(self.line_start(line) + column, self.line_end(line))
+
+    def line_start(self, line: int) -> int:
+        """Offset of the first character of a 0-based line"""
+        if line <= 0:
+            return 0
+        if line >= len(self._starts):
+            return len(self._text)
+        return self._starts[line]
+
+    def line_end(self, line: int) -> int:
+        """Offset just past the last character of a line, excluding the newline"""
+        if line + 1 >= len(self._starts):
+            return len(self._text)
+        return self._starts[line + 1] - 1
@@ -0,0 +1,321 @@
+import asyncio
+import codecs
+import contextlib
+import logging
+import os
+import signal
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+from app.config import settings
+from app.services.metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+# Seconds to keep reading a killed program's pipes for output it wrote before
+PIPE_DRAIN_TIMEOUT = 1.0
+
+
+class ExecutionQueueFull(Exception):
+    """Raised when too many executions are already waiting for a slot"""
+
+
+# Receives ("stdout" | "stderr", text) for each flushed chunk of a streaming run
+OutputCallback = Callable[[str, str], Awaitable[None]]
+
+
+class OutputCollector:
+    """Caps a run's output and batches it into chunks for a streaming consumer.
+
+    Everything up to `limit` bytes is kept for the final result. With an
+    on_output callback, output is also flushed to it whenever flush_bytes
+    are pending or flush_interval seconds after the first unflushed byte,
+    whichever comes first.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        on_output: Optional[OutputCallback] = None,
+        flush_bytes: int = 4096,
+        flush_interval: float = 0.05,
+    ):
+        self.limit = limit
+        self.on_output = on_output
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.total = 0
+        self.truncated = False
+        self._buffers = {"stdout": bytearray(), "stderr": bytearray()}
+        self._decoders = {name: codecs.getincrementaldecoder("utf-8")("replace") for name in self._buffers}
+        self._pending: List[Tuple[str, bytearray]] = []
+        self._pending_bytes = 0
+        self._flush_lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+
+    async def feed(self, stream: str, data: bytes) -> bool:
+        """Take a chunk of output; returns False once the output cap is exceeded"""
+        room = self.limit - self.total
+        accepted = data[:room]
+        if accepted:
+            self.total += len(accepted)
+            self._buffers[stream] += accepted
+            if self.on_output is not None:
+                if self._pending and self._pending[-1][0] == stream:
+                    self._pending[-1][1].extend(accepted)
+                else:
+                    self._pending.append((stream, bytearray(accepted)))
+                self._pending_bytes += len(accepted)
+                if self._pending_bytes >= self.flush_bytes:
+                    await self.flush()
+                elif self._timer is None:
+                    self._timer = asyncio.create_task(self._flush_later())
+        if len(data) > room:
+            self.truncated = True
+            return False
+        return True
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Send everything pending to the callback, in order"""
+        async with self._flush_lock:
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                self._timer.cancel()
+                self._timer = None
+            pending, self._pending, self._pending_bytes = self._pending, [], 0
+            for stream, data in pending:
+                text = self._decoders[stream].decode(bytes(data))
+                if text:
+                    await self.on_output(stream, text)
+
+    async def close(self):
+        """Flush what is left, including any incomplete UTF-8 sequence"""
+        if self.on_output is None:
+            return
+        await self.flush()
+        for stream, decoder in self._decoders.items():
+            text = decoder.decode(b"", final=True)
+            if text:
+                await self.on_output(stream, text)
+
+    def text(self, stream: str) -> str:
+        return self._buffers[stream].decode(errors="replace")
+
+
+class ExecutionResult:
+    """Outcome of running one child process"""
+
+    def __init__(
+        self,
+        stdout: str,
+        stderr: str,
+        returncode: Optional[int],
+        timed_out: bool,
+        duration: float,
+        truncated: bool = False,
+    ):
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+        self.timed_out = timed_out
+        self.duration = duration
+        self.truncated = truncated
+
+
+class ExecutionEngine:
+    """Runs user programs as asyncio subprocesses without blocking the event loop.
+
+    At most max_concurrency programs run at once; further requests wait in a
+    FIFO queue of at most max_queue entries. Every child is started in its
+    own process group so a timeout kills everything it spawned.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 4,
+        max_queue: int = 32,
+        timeout: float = 10.0,
+        output_limit: int = 65536,
+        flush_bytes: int = 4096,
+        flush_interval: float = 0.05,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.output_limit = output_limit
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.running = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.wait_stats = LatencyStats()
+        self.run_stats = LatencyStats()
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._processes: Set[asyncio.subprocess.Process] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Hold one execution slot, waiting in FIFO order for it if needed"""
+        enqueued_at = time.perf_counter()
+        if self.running >= self.max_concurrency or self._waiters:
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise ExecutionQueueFull("Execution queue is full, try again shortly")
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif not waiter.cancelled():
+                    # The slot was handed to us as we were cancelled; pass it on
+                    self._release()
+                raise
+        else:
+            self.running += 1
+        self.wait_stats.record(time.perf_counter() - enqueued_at)
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self):
+        # Hand the slot straight to the next waiter so nobody can jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    def collector(self, on_output: Optional[OutputCallback] = None) -> OutputCollector:
+        """Output collector using this engine's cap and flush policy"""
+        return OutputCollector(self.output_limit, on_output, self.flush_bytes, self.flush_interval)
+
+    async def run(
+        self,
+        argv: List[str],
+        timeout: float = None,
+        cwd: str = None,
+        on_output: Optional[OutputCallback] = None,
+    ) -> ExecutionResult:
+        """Run a command to completion; the caller must hold a slot.
+
+        Output beyond output_limit stops the program. With on_output, output
+        is also streamed to the callback while the program runs.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        process = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True,
+        )
+        self._processes.add(process)
+        collector = self.collector(on_output)
+
+        async def pump(reader: asyncio.StreamReader, stream: str):
+            capped = False
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    return
+                if not capped and not await collector.feed(stream, data):
+                    # Over the output cap; stop the program, but keep draining
+                    # the pipe so the process can be reaped
+                    capped = True
+                    self._kill(process)
+
+        timed_out = False
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr"), process.wait()),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+            self.timeouts += 1
+        finally:
+            # Kill the group even if the child itself has exited: anything it
+            # left running in the background would keep holding the pipes
+            self._kill(process)
+            await process.wait()
+            self._processes.discard(process)
+        if timed_out:
+            # Read what was written before the kill, until the pipes close
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    asyncio.gather(pump(process.stdout, "stdout"), pump(process.stderr, "stderr")),
+                    timeout=PIPE_DRAIN_TIMEOUT,
+                )
+        await collector.close()
+
+        duration = time.perf_counter() - start
+        self.completed += 1
+        self.run_stats.record(duration)
+        return ExecutionResult(
+            collector.text("stdout"),
+            collector.text("stderr"),
+            process.returncode,
+            timed_out,
+            duration,
+            truncated=collector.truncated,
+        )
+
+    def _kill(self, process: asyncio.subprocess.Process):
+        """Kill the whole process group started for a child"""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        except PermissionError:
+            process.kill()
+
+    async def stop(self):
+        """Kill every running child, e.g. on shutdown"""
+        for process in list(self._processes):
+            self._kill(process)
+        for process in list(self._processes):
+            try:
+                await asyncio.wait_for(process.wait(), timeout=2.0)
+            except asyncio.TimeoutError:
+                logger.warning(f"Child process {process.pid} did not exit after SIGKILL")
+
+    def stats(self) -> Dict[str, object]:
+        """Queue and run metrics for the status endpoint"""
+        return {
+            "running": self.running,
+            "queueDepth": self.queue_depth,
+            "maxConcurrency": self.max_concurrency,
+            "maxQueue": self.max_queue,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "queueWait": self.wait_stats.snapshot(),
+            "runTime": self.run_stats.snapshot(),
+        }
+
+
+# Global execution engine instance
+execution_engine = ExecutionEngine(
+    max_concurrency=settings.execution_max_concurrency,
+    max_queue=settings.execution_max_queue,
+    timeout=settings.execution_timeout,
+    output_limit=settings.execution_output_limit,
+    flush_bytes=settings.execution_flush_bytes,
+    flush_interval=settings.execution_flush_interval
+)
\ No newline at end of file
@@ -0,0 +1,249 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from app.config import settings
+from app.services.compile_cache import compile_cache
+from app.services.execution_engine import execution_engine, ExecutionResult, OutputCallback
+from app.services.python_pool import python_pool
+from app.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Programs mentioning any of these may print something different on every
+# run (randomness, clocks, process ids, hash-seeded set order, threads), so
+# their results are never served from the result cache. This is a best-effort
+# deny-list, which is why the cache is off unless EXECUTION_RESULT_CACHE_TTL
+# is set; braces without a colon catch set literals (and, harmlessly, f-strings)
+NONDETERMINISTIC = {
+    "python": re.compile(
+        r"\b(random|secrets|uuid|time|datetime|urandom|getpid|hash|id|set|frozenset|"
+        r"threading|multiprocessing|asyncio|socket|urllib|requests)\b|\{[^{}:]*\}"
+    ),
+    "cpp": re.compile(
+        r"\b(rand|srand|random_device|mt19937|time|clock|chrono|getpid|thread|async|"
+        r"unordered_map|unordered_set)\b"
+    ),
+}
+
+
+class _SharedRun:
+    """One in-flight execution shared by every caller asking for the same code"""
+
+    def __init__(self):
+        self.chunks: List[Tuple[str, str]] = []
+        self.listeners: List[OutputCallback] = []
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+
+    async def publish(self, stream: str, text: str):
+        self.chunks.append((stream, text))
+        for listener in list(self.listeners):
+            try:
+                await listener(stream, text)
+            except Exception as e:
+                # One broken consumer must not stop the run for the others
+                logger.warning(f"Dropping execution output listener: {e}")
+                if listener in self.listeners:
+                    self.listeners.remove(listener)
+
+    async def follow(self, listener: OutputCallback):
+        """Replay the output so far to a late caller, then stream the rest to it"""
+        sent = 0
+        while sent < len(self.chunks):
+            await listener(*self.chunks[sent])
+            sent += 1
+        self.listeners.append(listener)
+
+
+class ExecutionService:
+    """Runs submitted code and shapes the outcome for HTTP and WebSocket clients.
+
+    Identical requests (same language and code) that arrive while a run is
+    in flight share that run, output stream included. When the result cache
+    is enabled, results of programs that look deterministic are also kept
+    for a few seconds, so repeated presses of Run in a room don't start new
+    processes.
+    """
+
+    languages = ("python", "cpp")
+    deduplicated = 0
+    _live_runs: Dict[str, _SharedRun] = {}
+
+    @staticmethod
+    def run_key(language: str, code: str) -> str:
+        return hashlib.sha256(f"{language}\0{code}".encode()).hexdigest()
+
+    @staticmethod
+    def is_cacheable(language: str, code: str) -> bool:
+        """Best-effort check that a program prints the same thing every run"""
+        pattern = NONDETERMINISTIC.get(language)
+        return pattern is not None and not pattern.search(code)
+
+    @staticmethod
+    async def execute(language: str, code: str, on_output: Optional[OutputCallback] = None) -> Dict[str, Any]:
+        """Run code to completion, optionally streaming its output to on_output.
+
+        Returns output, error, execution_time, exit_code, truncated and cached.
+        Raises ValueError for an unsupported language and ExecutionQueueFull
+        when too many runs are already waiting.
+        """
+        if language not in ExecutionService.languages:
+            raise ValueError(f"Unsupported language: {language}")
+
+        start_time = time.time()
+        key = ExecutionService.run_key(language, code)
+        cached = result_cache.get(key)
+        if cached is not None:
+            result, chunks = cached
+            if on_output is not None:
+                for stream, text in chunks:
+                    await on_output(stream, text)
+            # Nothing ran, so report the time this request took, not the original run's
+            return {**result, "execution_time": time.time() - start_time, "cached": True}
+
+        run = ExecutionService._live_runs.get(key)
+        if run is None:
+            run = _SharedRun()
+            ExecutionService._live_runs[key] = run
+            run.task = asyncio.create_task(ExecutionService._run_shared(key, run, language, code))
+        else:
+            ExecutionService.deduplicated += 1
+
+        run.waiters += 1
+        try:
+            if on_output is not None:
+                await run.follow(on_output)
+            return {**await asyncio.shield(run.task), "cached": False}
+        finally:
+            run.waiters -= 1
+            if on_output in run.listeners:
+                run.listeners.remove(on_output)
+            # Nobody is waiting for the output any more; later callers must
+            # start a new run rather than join the cancelled one
+            if run.waiters == 0 and not run.task.done():
+                if ExecutionService._live_runs.get(key) is run:
+                    del ExecutionService._live_runs[key]
+                run.task.cancel()
+
+    @staticmethod
+    async def _run_shared(key: str, run: _SharedRun, language: str, code: str) -> Dict[str, Any]:
+        try:
+            result = await ExecutionService._execute(language, code, run.publish)
+        finally:
+            if ExecutionService._live_runs.get(key) is run:
+                del ExecutionService._live_runs[key]
+
+        if result["exit_code"] is not None and ExecutionService.is_cacheable(language, code):
+            result_cache.set(key, (result, run.chunks))
+        return result
+
+    @staticmethod
+    def stats() -> Dict[str, Any]:
+        """Deduplication and result cache metrics"""
+        return {
+            "inFlight": len(ExecutionService._live_runs),
+            "deduplicated": ExecutionService.deduplicated,
+            "resultCache": result_cache.stats(),
+        }
+
+    @staticmethod
+    async def _execute(language: str, code: str, on_output: Optional[OutputCallback]) -> Dict[str, Any]:
+        start_time = time.time()
+        if language == "python":
+            return await ExecutionService._execute_python(code, start_time, on_output)
+        elif language == "cpp":
+            return await ExecutionService._execute_cpp(code, start_time, on_output)
+        else:
+            raise ValueError(f"Unsupported language: {language}")
+
+    @staticmethod
+    def _timeout_result(result: Optional[ExecutionResult] = None) -> Dict[str, Any]:
+        return {
+            "output": result.stdout if result is not None else "",
+            "error": f"Execution timeout ({execution_engine.timeout:g} seconds)",
+            "execution_time": execution_engine.timeout,
+            "exit_code": None,
+            "truncated": False,
+        }
+
+    @staticmethod
+    def _run_result(result: ExecutionResult, start_time: float) -> Dict[str, Any]:
+        if result.timed_out:
+            return ExecutionService._timeout_result(result)
+
+        error = None
+        if result.truncated:
+            error = f"{result.stderr}\n" if result.stderr else ""
+            error += f"Output limit exceeded ({execution_engine.output_limit} bytes), program stopped"
+        elif result.returncode != 0:
+            error = result.stderr
+
+        return {
+            "output": result.stdout,
+            "error": error,
+            "execution_time": time.time() - start_time,
+            "exit_code": result.returncode,
+            "truncated": result.truncated,
+        }
+
+    @staticmethod
+    async def _execute_python(code: str, start_time: float, on_output: Optional[OutputCallback]) -> Dict[str, Any]:
+        if python_pool.enabled:
+            async with execution_engine.slot():
+                result = await python_pool.run(code, on_output=on_output)
+            return ExecutionService._run_result(result, start_time)
+
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
+            f.write(code)
+            temp_file = f.name
+
+        try:
+            async with execution_engine.slot():
+                result = await execution_engine.run(['python3', temp_file], on_output=on_output)
+            return ExecutionService._run_result(result, start_time)
+
+        finally:
+            os.unlink(temp_file)
+
+    @staticmethod
+    async def _execute_cpp(code: str, start_time: float, on_output: Optional[OutputCallback]) -> Dict[str, Any]:
+        # Hold one slot for both steps so a queued request can't starve between them
+        async with execution_engine.slot():
+            # Compile, or reuse the binary built for identical source. Another
+            # worker sharing the cache may evict it before it starts, in which
+            # case the next lookup misses and compiles it again
+            for attempt in range(2):
+                async with compile_cache.program(code) as program:
+                    if not program.ok:
+                        if program.compile_result.timed_out:
+                            return ExecutionService._timeout_result()
+                        return {
+                            "output": "",
+                            "error": f"Compilation error: {program.compile_result.stderr}",
+                            "execution_time": time.time() - start_time,
+                            "exit_code": None,
+                            "truncated": False,
+                        }
+
+                    # Execute
+                    try:
+                        run_result = await execution_engine.run([program.path], on_output=on_output)
+                        break
+                    except FileNotFoundError:
+                        if attempt:
+                            raise
+                        logger.info("Cached binary was evicted before it ran, compiling again")
+
+        return ExecutionService._run_result(run_result, start_time)
+
+
+# Short-lived results of deterministic programs; a TTL of 0 disables caching
+result_cache = TTLCache(
+    max_entries=settings.execution_result_cache_size if settings.execution_result_cache_ttl > 0 else 0,
+    ttl=settings.execution_result_cache_ttl
+)
@@ -0,0 +1,28 @@
+from typing import Dict
+
+
+class LatencyStats:
+    """Running latency statistics for a single operation"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds: float):
+        """Record one observation in seconds"""
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        """Return the statistics in milliseconds"""
+        return {
+            "count": self.count,
+            "avgMs": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "maxMs": round(self.max * 1000, 3),
+            "lastMs": round(self.last * 1000, 3),
+        }
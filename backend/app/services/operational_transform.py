@@ -0,0 +1,213 @@
+from typing import Any, Dict, List, Tuple, Union
+
+
+class TextOperation:
+    """A sequence of retain / insert / delete components over a whole document.
+
+    Components are stored the way ot.js stores them: a positive int retains
+    that many characters, a negative int deletes that many, and a str is
+    inserted. Positions are counted in Unicode code points.
+    """
+
+    def __init__(self):
+        self.ops: List[Union[int, str]] = []
+        self.base_length = 0
+        self.target_length = 0
+
+    def retain(self, n: int) -> "TextOperation":
+        if n <= 0:
+            return self
+        self.base_length += n
+        self.target_length += n
+        if self.ops and isinstance(self.ops[-1], int) and self.ops[-1] > 0:
+            self.ops[-1] += n
+        else:
+            self.ops.append(n)
+        return self
+
+    def insert(self, text: str) -> "TextOperation":
+        if not text:
+            return self
+        self.target_length += len(text)
+        ops = self.ops
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += text
+        elif ops and isinstance(ops[-1], int) and ops[-1] < 0:
+            # Keep inserts before deletes so equal operations compare equal
+            if len(ops) > 1 and isinstance(ops[-2], str):
+                ops[-2] += text
+            else:
+                ops.insert(len(ops) - 1, text)
+        else:
+            ops.append(text)
+        return self
+
+    def delete(self, n: int) -> "TextOperation":
+        if n <= 0:
+            return self
+        self.base_length += n
+        if self.ops and isinstance(self.ops[-1], int) and self.ops[-1] < 0:
+            self.ops[-1] -= n
+        else:
+            self.ops.append(-n)
+        return self
+
+    def is_noop(self) -> bool:
+        return all(isinstance(op, int) and op > 0 for op in self.ops)
+
+    @classmethod
+    def from_edits(cls, edits: List[Dict[str, Any]], base_length: int) -> "TextOperation":
+        """Build an operation from range edits against a document of base_length.
+
+        Each edit is {"pos": int, "delete": int, "insert": str}; edits must be
+        sorted by position and must not overlap.
+        """
+        operation = cls()
+        cursor = 0
+        if not isinstance(edits, list):
+            raise ValueError("Edits must be a list")
+        for edit in edits:
+            if not isinstance(edit, dict):
+                raise ValueError("Each edit must be an object")
+            pos = edit.get("pos", 0)
+            delete = edit.get("delete", 0)
+            text = edit.get("insert", "") or ""
+            if not all(isinstance(n, int) and not isinstance(n, bool) for n in (pos, delete)):
+                raise ValueError("Edit pos and delete must be integers")
+            if not isinstance(text, str):
+                raise ValueError("Edit insert must be a string")
+            if pos < cursor or delete < 0:
+                raise ValueError("Edits must be sorted and non-overlapping")
+            if pos + delete > base_length:
+                raise ValueError("Edit range is outside the document")
+            operation.retain(pos - cursor)
+            operation.insert(text)
+            operation.delete(delete)
+            cursor = pos + delete
+        operation.retain(base_length - cursor)
+        return operation
+
+    @classmethod
+    def from_ops(cls, ops: List[Union[int, str]]) -> "TextOperation":
+        """Rebuild an operation from its ops list"""
+        operation = cls()
+        for op in ops:
+            if isinstance(op, str):
+                operation.insert(op)
+            elif op < 0:
+                operation.delete(-op)
+            else:
+                operation.retain(op)
+        return operation
+
+    @classmethod
+    def from_diff(cls, old: str, new: str) -> "TextOperation":
+        """Build a single-range operation turning old into new"""
+        limit = min(len(old), len(new))
+        prefix = 0
+        while prefix < limit and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while suffix < limit - prefix and old[-1 - suffix] == new[-1 - suffix]:
+            suffix += 1
+
+        operation = cls()
+        operation.retain(prefix)
+        operation.insert(new[prefix:len(new) - suffix])
+        operation.delete(len(old) - prefix - suffix)
+        operation.retain(suffix)
+        return operation
+
+    def to_edits(self) -> List[Dict[str, Any]]:
+        """Express the operation as sorted range edits against its base document"""
+        edits: List[Dict[str, Any]] = []
+        pos = 0
+        for op in self.ops:
+            if isinstance(op, str):
+                if edits and edits[-1]["pos"] + edits[-1]["delete"] == pos:
+                    edits[-1]["insert"] += op
+                else:
+                    edits.append({"pos": pos, "delete": 0, "insert": op})
+            elif op < 0:
+                if edits and edits[-1]["pos"] + edits[-1]["delete"] == pos:
+                    edits[-1]["delete"] -= op
+                else:
+                    edits.append({"pos": pos, "delete": -op, "insert": ""})
+                pos -= op
+            else:
+                pos += op
+        return edits
+
+    def apply(self, text: str) -> str:
+        """Apply the operation to a string"""
+        if len(text) != self.base_length:
+            raise ValueError("Operation base length does not match the document")
+        parts = []
+        pos = 0
+        for op in self.ops:
+            if isinstance(op, str):
+                parts.append(op)
+            elif op > 0:
+                parts.append(text[pos:pos + op])
+                pos += op
+            else:
+                pos -= op
+        return "".join(parts)
+
+    @staticmethod
+    def transform(a: "TextOperation", b: "TextOperation") -> Tuple["TextOperation", "TextOperation"]:
+        """Transform concurrent operations a and b so that
+        b'.apply(a.apply(doc)) == a'.apply(b.apply(doc)).
+
+        When both insert at the same position, a's text ends up first.
+        """
+        if a.base_length != b.base_length:
+            raise ValueError("Both operations must have the same base length")
+
+        a_prime = TextOperation()
+        b_prime = TextOperation()
+        ops1, ops2 = a.ops, b.ops
+        i1 = i2 = 0
+        op1 = ops1[0] if ops1 else None
+        op2 = ops2[0] if ops2 else None
+
+        while op1 is not None or op2 is not None:
+            if isinstance(op1, str):
+                a_prime.insert(op1)
+                b_prime.retain(len(op1))
+                i1 += 1
+                op1 = ops1[i1] if i1 < len(ops1) else None
+                continue
+            if isinstance(op2, str):
+                a_prime.retain(len(op2))
+                b_prime.insert(op2)
+                i2 += 1
+                op2 = ops2[i2] if i2 < len(ops2) else None
+                continue
+            if op1 is None or op2 is None:
+                raise ValueError("Operations do not cover the same document")
+
+            if op1 > 0 and op2 > 0:
+                n = min(op1, op2)
+                a_prime.retain(n)
+                b_prime.retain(n)
+            elif op1 < 0 and op2 < 0:
+                # Both deleted the same characters
+                n = min(-op1, -op2)
+            elif op1 < 0:
+                n = min(-op1, op2)
+                a_prime.delete(n)
+            else:
+                n = min(op1, -op2)
+                b_prime.delete(n)
+
+            op1 = op1 - n if op1 > 0 else op1 + n
+            op2 = op2 - n if op2 > 0 else op2 + n
+            if op1 == 0:
+                i1 += 1
+                op1 = ops1[i1] if i1 < len(ops1) else None
+            if op2 == 0:
+                i2 += 1
+                op2 = ops2[i2] if i2 < len(ops2) else None
+
+        return a_prime, b_prime
@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+from app.config import settings
+from app.services.execution_engine import ExecutionResult, OutputCallback, OutputCollector
+from app.services.metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+RUNNER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "python_runner.py")
+
+
+class _Worker:
+    """One warm interpreter started from python_runner.py"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.runs = 0
+
+    async def request(self, job: Dict, collector: OutputCollector) -> Dict:
+        """Send a job, feed its output to the collector and return the final status"""
+        self.process.stdin.write((json.dumps(job) + "\n").encode())
+        await self.process.stdin.drain()
+        while True:
+            line = await self.process.stdout.readline()
+            if not line:
+                raise ConnectionError("Python worker exited")
+            message = json.loads(line)
+            if "stream" in message:
+                await collector.feed(message["stream"], message["data"].encode("latin-1"))
+            else:
+                return message
+
+    async def kill(self):
+        """Kill the worker together with any child it is running"""
+        if self.process.returncode is None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                self.process.kill()
+        await self.process.wait()
+
+
+class PythonWorkerPool:
+    """Pool of pre-started Python interpreters for running user code.
+
+    Each worker imports the preload modules once and then forks a fresh
+    child per run, so a run only pays for fork() instead of interpreter
+    start-up. Children run with CPU, memory and output limits; a worker
+    is replaced after max_runs runs or whenever a run times out.
+    """
+
+    def __init__(
+        self,
+        size: int = 4,
+        max_runs: int = 100,
+        preload: List[str] = None,
+        memory_limit_mb: int = 256,
+        output_limit: int = 65536,
+        timeout: float = 10.0,
+        flush_bytes: int = 4096,
+        flush_interval: float = 0.05,
+    ):
+        self.size = size if os.name == "posix" else 0
+        self.max_runs = max_runs
+        self.preload = preload or []
+        self.memory_limit_mb = memory_limit_mb
+        self.output_limit = output_limit
+        self.timeout = timeout
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.spawned = 0
+        self.recycled = 0
+        self.timeouts = 0
+        self.run_stats = LatencyStats()
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: List[_Worker] = []
+        self._spawning: List[asyncio.Task] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self._idle is not None
+
+    async def start(self):
+        """Start and warm up the workers"""
+        if self.size <= 0 or self._idle is not None:
+            return
+        self._idle = asyncio.Queue()
+        workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)), return_exceptions=True)
+        for worker in workers:
+            if isinstance(worker, Exception):
+                logger.warning(f"Python worker failed to start: {worker}")
+                self._replace()
+            else:
+                self._idle.put_nowait(worker)
+
+    async def _spawn(self) -> _Worker:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, RUNNER, *self.preload,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True,
+            # An output line carries up to 64 KiB of JSON-escaped bytes
+            limit=1024 * 1024,
+        )
+        worker = _Worker(process)
+        try:
+            ready = await asyncio.wait_for(process.stdout.readline(), timeout=30.0)
+            if not ready:
+                raise ConnectionError("Python worker exited during warm-up")
+        except BaseException:
+            await worker.kill()
+            raise
+        self._workers.append(worker)
+        self.spawned += 1
+        return worker
+
+    def _replace(self, worker: _Worker = None):
+        """Retire a worker and start its replacement in the background"""
+        if worker is not None:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self.recycled += 1
+            asyncio.create_task(worker.kill())
+        if self._idle is None:
+            return
+
+        async def respawn():
+            delay = 0.5
+            while self._idle is not None:
+                try:
+                    self._idle.put_nowait(await self._spawn())
+                    return
+                except Exception as e:
+                    logger.warning(f"Python worker failed to start: {e}; retrying in {delay}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 10.0)
+
+        task = asyncio.create_task(respawn())
+        self._spawning.append(task)
+        task.add_done_callback(self._spawning.remove)
+
+    async def run(self, code: str, timeout: float = None, on_output: Optional[OutputCallback] = None) -> ExecutionResult:
+        """Run code on a warm worker; the caller must hold an execution slot.
+
+        With on_output, output is streamed to the callback while the code runs.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        worker = await self._idle.get()
+        start = time.perf_counter()
+        job = {
+            "code": code,
+            "cpu": max(1, int(timeout + 0.999)),
+            "memory": self.memory_limit_mb * 1024 * 1024,
+            "output": self.output_limit,
+        }
+        collector = OutputCollector(self.output_limit, on_output, self.flush_bytes, self.flush_interval)
+        try:
+            reply = await asyncio.wait_for(worker.request(job, collector), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._replace(worker)
+            await collector.close()
+            return ExecutionResult(
+                collector.text("stdout"),
+                collector.text("stderr"),
+                None,
+                True,
+                time.perf_counter() - start,
+            )
+        except BaseException:
+            # Broken pipe, a dead worker or a cancelled request: the worker's
+            # state is unknown, so never hand it out again
+            self._replace(worker)
+            raise
+
+        worker.runs += 1
+        if worker.runs >= self.max_runs:
+            self._replace(worker)
+        else:
+            self._idle.put_nowait(worker)
+
+        await collector.close()
+        duration = time.perf_counter() - start
+        self.run_stats.record(duration)
+        # RLIMIT_CPU ends the child with SIGXCPU, which is still a timeout to the user
+        return ExecutionResult(
+            collector.text("stdout"),
+            collector.text("stderr"),
+            reply["returncode"],
+            reply["returncode"] == -signal.SIGXCPU,
+            duration,
+            truncated=reply["truncated"] or collector.truncated,
+        )
+
+    async def stop(self):
+        """Kill every worker"""
+        self._idle = None
+        for task in list(self._spawning):
+            task.cancel()
+        for worker in list(self._workers):
+            await worker.kill()
+        self._workers = []
+
+    def stats(self) -> Dict[str, object]:
+        """Pool metrics for the status endpoint"""
+        return {
+            "size": self.size,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "spawned": self.spawned,
+            "recycled": self.recycled,
+            "timeouts": self.timeouts,
+            "runTime": self.run_stats.snapshot(),
+        }
+
+
+# Global warm interpreter pool
+python_pool = PythonWorkerPool(
+    size=settings.python_pool_size,
+    max_runs=settings.python_pool_max_runs,
+    preload=[name.strip() for name in settings.python_pool_preload.split(",") if name.strip()],
+    memory_limit_mb=settings.execution_memory_limit_mb,
+    output_limit=settings.execution_output_limit,
+    timeout=settings.execution_timeout,
+    flush_bytes=settings.execution_flush_bytes,
+    flush_interval=settings.execution_flush_interval
+)
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+Warm Python worker for the execution pool.
+
+Started once by PythonWorkerPool and kept alive between runs. It imports
+the preload modules up front, then reads one JSON job per line on stdin
+and forks a child per job to run the code under resource limits. While
+the child runs, its output is relayed as JSON lines on stdout
+({"stream", "data"}, with bytes carried as latin-1), followed by one
+{"returncode", "truncated"} line. User code only ever runs in the forked
+child, so nothing leaks from one run into the next.
+
+This file is executed as a script and must only use the standard library.
+"""
+
+import importlib
+import json
+import linecache
+import os
+import resource
+import selectors
+import signal
+import sys
+import traceback
+
+FILENAME = "main.py"
+
+
+def _apply_limits(job):
+    cpu = job.get("cpu")
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    memory = job.get("memory")
+    if memory:
+        resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+
+
+def _run_child(job, out_w, err_w):
+    """Body of the forked child; never returns"""
+    code = 1
+    try:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.closerange(3, 256)
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        _apply_limits(job)
+
+        sys.argv = [FILENAME]
+        source = job["code"]
+        linecache.cache[FILENAME] = (len(source), None, source.splitlines(True), FILENAME)
+        namespace = {"__name__": "__main__", "__file__": FILENAME, "__builtins__": __builtins__}
+        try:
+            exec(compile(source, FILENAME, "exec"), namespace)
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            etype, value, tb = sys.exc_info()
+            # Drop this runner's frame so tracebacks look like a plain run
+            traceback.print_exception(etype, value, tb.tb_next)
+            code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except BaseException:
+            pass
+        os._exit(code)
+
+
+def _run_job(job, send):
+    out_r, out_w = os.pipe()
+    err_r, err_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(out_r)
+        os.close(err_r)
+        _run_child(job, out_w, err_w)
+    os.close(out_w)
+    os.close(err_w)
+
+    limit = job.get("output", 65536)
+    streams = {out_r: "stdout", err_r: "stderr"}
+    total = 0
+    truncated = False
+    selector = selectors.DefaultSelector()
+    for fd in streams:
+        selector.register(fd, selectors.EVENT_READ)
+    open_fds = len(streams)
+    while open_fds:
+        for key, _ in selector.select():
+            data = os.read(key.fd, 65536)
+            if not data:
+                selector.unregister(key.fd)
+                open_fds -= 1
+                continue
+            room = limit - total
+            if room > 0:
+                send({"stream": streams[key.fd], "data": data[:room].decode("latin-1")})
+                total += min(len(data), room)
+            if len(data) > room and not truncated:
+                # Over the output cap: stop the program instead of relaying more
+                truncated = True
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+    selector.close()
+    os.close(out_r)
+    os.close(err_r)
+
+    _, status = os.waitpid(pid, 0)
+    if os.WIFSIGNALED(status):
+        returncode = -os.WTERMSIG(status)
+    else:
+        returncode = os.WEXITSTATUS(status)
+    return {"returncode": returncode, "truncated": truncated}
+
+
+def main():
+    # Keep the protocol channel away from anything that writes to fd 1
+    channel = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    for name in sys.argv[1:]:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+    def send(message):
+        channel.write(json.dumps(message) + "\n")
+        channel.flush()
+
+    send({"ready": True})
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        send(_run_job(json.loads(line), send))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlparse
+
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+def encode_command(*args: Any) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        else:
+            data = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader) -> Any:
+    """Read one RESP reply; bulk strings are returned as bytes"""
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by server")
+    prefix, payload = line[:1], line[1:-2]
+
+    if prefix == b"+":
+        return payload.decode()
+    if prefix == b"-":
+        raise RedisError(payload.decode())
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = await reader.readexactly(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise RedisError(f"Unknown reply type: {line!r}")
+
+
+def parse_url(url: str) -> Tuple[str, int, Optional[str], int]:
+    """Split redis://[:password@]host[:port][/db] into its parts"""
+    parsed = urlparse(url)
+    db = int(parsed.path.lstrip("/") or 0)
+    return parsed.hostname or "localhost", parsed.port or 6379, parsed.password, db
+
+
+class RedisConnection:
+    """Minimal asyncio client for a Redis-protocol server"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, url: str, timeout: float = 5.0) -> "RedisConnection":
+        host, port, password, db = parse_url(url)
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=timeout)
+        connection = cls(reader, writer)
+        if password:
+            await connection.execute("AUTH", password)
+        if db:
+            await connection.execute("SELECT", db)
+        return connection
+
+    async def execute(self, *args: Any) -> Any:
+        """Send a command and wait for its reply"""
+        async with self._lock:
+            self.writer.write(encode_command(*args))
+            await self.writer.drain()
+            return await read_reply(self.reader)
+
+    async def pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        """Send several commands in one write and return their replies in order"""
+        async with self._lock:
+            self.writer.write(b"".join(encode_command(*command) for command in commands))
+            await self.writer.drain()
+            replies = []
+            for _ in commands:
+                try:
+                    replies.append(await read_reply(self.reader))
+                except RedisError as e:
+                    replies.append(e)
+            return replies
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except Exception:
+            pass
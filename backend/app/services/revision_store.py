@@ -0,0 +1,191 @@
+import difflib
+import json
+import logging
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.revision import RoomRevision
+from app.services.operational_transform import TextOperation
+from app.services.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def line_diff(old: str, new: str) -> TextOperation:
+    """An operation turning old into new that only touches the lines that changed"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    operation = TextOperation()
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            operation.retain(sum(len(line) for line in old_lines[i1:i2]))
+        else:
+            operation.insert("".join(new_lines[j1:j2]))
+            operation.delete(sum(len(line) for line in old_lines[i1:i2]))
+    return operation
+
+
+def encode_delta(operation: TextOperation) -> bytes:
+    return zlib.compress(json.dumps(operation.ops, separators=(",", ":")).encode())
+
+
+def decode_delta(data: bytes) -> TextOperation:
+    return TextOperation.from_ops(json.loads(zlib.decompress(data)))
+
+
+class _Head(NamedTuple):
+    """The latest revision recorded for a room by this process"""
+    revision: int
+    code: str
+    language: str
+    since_snapshot: int  # deltas written since the last snapshot
+
+
+class RevisionStore:
+    """Version history of room code, as periodic snapshots plus deltas.
+
+    Every snapshot_interval-th revision of a room stores the whole code;
+    the ones in between store a compressed line diff from the revision
+    before. Reading a revision applies the deltas after the nearest
+    snapshot at or before it.
+    """
+
+    def __init__(self, snapshot_interval: int = 50, max_rooms: int = 1024):
+        self.snapshot_interval = snapshot_interval
+        # room_id -> _Head; a room without one starts over with a snapshot
+        self._heads = TTLCache(max_entries=max_rooms, ttl=float("inf"))
+        self.snapshots = 0
+        self.deltas = 0
+        self.bytes_written = 0
+
+    async def record(self, db: AsyncSession, rooms: Dict[str, Tuple[str, str]]):
+        """Record the current (code, language) of rooms whose code or language changed"""
+        heads = {room_id: self._heads.get(room_id) for room_id in rooms}
+        unknown = [room_id for room_id, head in heads.items() if head is None]
+        latest: Dict[str, int] = {}
+        if unknown:
+            result = await db.execute(
+                select(RoomRevision.room_id, func.max(RoomRevision.revision))
+                .where(RoomRevision.room_id.in_(unknown))
+                .group_by(RoomRevision.room_id)
+            )
+            latest = dict(result.all())
+
+        new_heads: Dict[str, _Head] = {}
+        for room_id, (code, language) in rooms.items():
+            head = heads[room_id]
+            if head is not None and head.code == code and head.language == language:
+                continue
+            is_snapshot = head is None or head.since_snapshot + 1 >= self.snapshot_interval
+            if is_snapshot:
+                revision = (head.revision if head else latest.get(room_id, 0)) + 1
+                data = zlib.compress(code.encode())
+                new_heads[room_id] = _Head(revision, code, language, 0)
+                self.snapshots += 1
+            else:
+                revision = head.revision + 1
+                data = encode_delta(line_diff(head.code, code))
+                new_heads[room_id] = _Head(revision, code, language, head.since_snapshot + 1)
+                self.deltas += 1
+            self.bytes_written += len(data)
+            db.add(RoomRevision(
+                room_id=room_id,
+                revision=revision,
+                is_snapshot=is_snapshot,
+                language=language,
+                data=data,
+                code_length=len(code)
+            ))
+
+        if not new_heads:
+            return
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Another worker recorded some of these rooms too; start them over
+            await db.rollback()
+            for room_id in new_heads:
+                self._heads.pop(room_id)
+            logger.warning(f"Revision conflict for rooms {list(new_heads)}, will snapshot them next time")
+            return
+        for room_id, head in new_heads.items():
+            self._heads.set(room_id, head)
+
+    def forget(self, room_id: str):
+        """Drop a room's head, e.g. while another worker records it; it restarts with a snapshot"""
+        self._heads.pop(room_id)
+
+    async def list_revisions(self, db: AsyncSession, room_id: str, limit: int = 100,
+                             before: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Revisions of a room, newest first, without their content"""
+        query = select(
+            RoomRevision.revision,
+            RoomRevision.is_snapshot,
+            RoomRevision.language,
+            RoomRevision.code_length,
+            RoomRevision.created_at
+        ).where(RoomRevision.room_id == room_id)
+        if before is not None:
+            query = query.where(RoomRevision.revision < before)
+        result = await db.execute(query.order_by(RoomRevision.revision.desc()).limit(limit))
+        return [
+            {
+                "revision": row.revision,
+                "snapshot": row.is_snapshot,
+                "language": row.language,
+                "codeLength": row.code_length,
+                "createdAt": row.created_at
+            }
+            for row in result
+        ]
+
+    async def get_revision(self, db: AsyncSession, room_id: str, revision: int) -> Optional[Dict[str, Any]]:
+        """The code of one revision, rebuilt from the nearest snapshot before it"""
+        snapshot = (
+            select(func.max(RoomRevision.revision))
+            .where(
+                RoomRevision.room_id == room_id,
+                RoomRevision.is_snapshot.is_(True),
+                RoomRevision.revision <= revision
+            )
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            select(RoomRevision)
+            .where(
+                RoomRevision.room_id == room_id,
+                RoomRevision.revision >= snapshot,
+                RoomRevision.revision <= revision
+            )
+            .order_by(RoomRevision.revision)
+        )
+        rows = result.scalars().all()
+        if not rows or rows[-1].revision != revision:
+            return None
+
+        code = zlib.decompress(rows[0].data).decode()
+        for row in rows[1:]:
+            code = decode_delta(row.data).apply(code)
+        return {
+            "roomId": room_id,
+            "revision": revision,
+            "language": rows[-1].language,
+            "code": code,
+            "createdAt": rows[-1].created_at
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rooms": len(self._heads),
+            "snapshots": self.snapshots,
+            "deltas": self.deltas,
+            "bytesWritten": self.bytes_written,
+        }
+
+
+# Global revision store instance
+revision_store = RevisionStore(snapshot_interval=settings.revision_snapshot_interval)
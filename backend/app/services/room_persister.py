@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.services.revision_store import revision_store
+from app.services.room_service import RoomService
+
+logger = logging.getLogger(__name__)
+
+
+class RoomPersister:
+    """Write-behind persistence of live room code to the rooms table.
+
+    Edits only mark a room dirty. Dirty rooms are written together, in one
+    bulk UPDATE, every flush_interval seconds or as soon as flush_after_edits
+    edits have piled up, and once more on shutdown.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, flush_after_edits: int = 200):
+        self.flush_interval = flush_interval
+        self.flush_after_edits = flush_after_edits
+        # room_id -> live room state ({"document", "language", ...}) awaiting a write
+        self._dirty: Dict[str, Dict[str, Any]] = {}
+        self._pending_edits = 0
+        self._flush_requested: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.flush_count = 0
+        self.rooms_written = 0
+        # Whether this process records a room's revision history. Every worker
+        # holding a room saves its code, but only one should add revisions
+        self.records_history: Callable[[str], bool] = lambda room_id: True
+
+    def start(self):
+        """Start the background flush loop"""
+        if self._task is None:
+            self._flush_requested = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write everything still dirty"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def mark_dirty(self, room_id: str, state: Dict[str, Any]):
+        """Record that a room's live state differs from the database"""
+        self._dirty[room_id] = state
+        self._pending_edits += 1
+        if self._pending_edits >= self.flush_after_edits and self._flush_requested is not None:
+            self._flush_requested.set()
+
+    def forget(self, room_id: str):
+        """Drop a room's unwritten state, e.g. after another worker took it over"""
+        self._dirty.pop(room_id, None)
+
+    def pending_state(self, room_id: str) -> Optional[Dict[str, Any]]:
+        """Live state of a room that has not been written yet, if any"""
+        return self._dirty.get(room_id)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write all dirty rooms in one bulk UPDATE"""
+        if not self._dirty:
+            return
+
+        lock = self._flush_lock or asyncio.Lock()
+        async with lock:
+            dirty, self._dirty = self._dirty, {}
+            self._pending_edits = 0
+            rooms: Dict[str, Tuple[str, str]] = {
+                room_id: (state["document"].text(), state["language"])
+                for room_id, state in dirty.items()
+            }
+
+            try:
+                async with AsyncSessionLocal() as db:
+                    written = await RoomService.bulk_update_room_code(db, rooms)
+            except Exception as e:
+                logger.error(f"Room persistence flush failed: {e}")
+                # Retry on the next flush unless the room was edited again meanwhile
+                for room_id, state in dirty.items():
+                    self._dirty.setdefault(room_id, state)
+                return
+
+            self.flush_count += 1
+            self.rooms_written += len(written)
+
+            # History is only kept for rooms that exist, by one worker each
+            recorded = {room_id for room_id in written if self.records_history(room_id)}
+            for room_id in written - recorded:
+                revision_store.forget(room_id)
+            rooms = {room_id: rooms[room_id] for room_id in recorded}
+            if settings.revision_history and rooms:
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await revision_store.record(db, rooms)
+                except Exception as e:
+                    # The code itself is saved; only this point in its history is lost
+                    logger.error(f"Recording room revisions failed: {e}")
+
+    async def load(self, room_id: str) -> Optional[Tuple[str, str]]:
+        """Load (code, language) for a room, preferring unwritten live state"""
+        state = self.pending_state(room_id)
+        if state is not None:
+            return state["document"].text(), state["language"]
+
+        # Another worker may have saved the room since it was cached here,
+        # so only a single process can trust the cache
+        use_cache = settings.backplane == "memory"
+        try:
+            async with AsyncSessionLocal() as db:
+                room = await RoomService.get_room_info(db, room_id, use_cache=use_cache)
+        except Exception as e:
+            logger.error(f"Failed to load room {room_id}: {e}")
+            return None
+        if room is None:
+            return None
+        return room["codeContent"], room["language"] or "python"
+
+
+# Global room persister instance
+room_persister = RoomPersister(
+    flush_interval=settings.persist_flush_interval,
+    flush_after_edits=settings.persist_flush_edits
+)
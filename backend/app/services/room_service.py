@@ -1,11 +1,53 @@
+import hashlib
+import time
 import uuid
+from typing import Any, Dict, Optional, Set, Tuple
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import bindparam, func, select, update
+from app.config import settings
 from app.models.room import Room
 from app.schemas.room import RoomCreate
+from app.services.ttl_cache import TTLCache
+
+
+def room_etag(language: str, code: str) -> str:
+    """Entity tag for a room's language and code"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(language.encode())
+    digest.update(b"\0")
+    digest.update(code.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _room_info(room: Room) -> Dict[str, Any]:
+    return {
+        "roomId": room.room_id,
+        "language": room.language,
+        "codeContent": room.code_content or "",
+        "createdAt": room.created_at,
+        "updatedAt": room.updated_at,
+        "etag": room_etag(room.language or "", room.code_content or "")
+    }
 
 
 class RoomService:
+    # Rooms are never deleted, so a count read from the database only goes
+    # stale by the rooms other workers have created since; it is re-read
+    # every room_count_refresh seconds and bumped locally in between
+    _room_count: Optional[int] = None
+    _room_count_at = 0.0
+
+    @classmethod
+    async def count_rooms(cls, db: AsyncSession) -> int:
+        """Number of rooms, from a cached COUNT(*) refreshed periodically"""
+        now = time.monotonic()
+        if cls._room_count is None or now - cls._room_count_at >= settings.room_count_refresh:
+            result = await db.execute(select(func.count()).select_from(Room))
+            cls._room_count = result.scalar_one()
+            cls._room_count_at = now
+        return cls._room_count
+
     @staticmethod
     async def create_room(db: AsyncSession, room_data: RoomCreate) -> Room:
         """Create a new room with validation and limits"""
@@ -15,32 +57,29 @@ class RoomService:
             raise ValueError(f"Invalid language. Must be one of: {valid_languages}")
         
         # Check room count limit
-        result = await db.execute(select(Room))
-        room_count = len(result.scalars().all())
-        if room_count >= 100:
+        if await RoomService.count_rooms(db) >= settings.room_limit:
             raise ValueError("Server at capacity. Please try again later.")
         
-        room_id = str(uuid.uuid4())[:8]
-        
-        # Ensure room ID is unique (max 10 attempts)
-        attempts = 0
-        while await RoomService.get_room_by_id(db, room_id) and attempts < 10:
-            room_id = str(uuid.uuid4())[:8]
-            attempts += 1
-        
-        if attempts >= 10:
-            raise ValueError("Unable to generate unique room ID")
-        
-        room = Room(
-            room_id=room_id,
-            language=room_data.language,
-            code_content=""
-        )
+        # The unique index on room_id catches collisions, so a fresh ID is
+        # only drawn when an insert actually conflicts
+        for _ in range(10):
+            room = Room(
+                room_id=uuid.uuid4().hex[:8],
+                language=room_data.language,
+                code_content=""
+            )
+            db.add(room)
+            try:
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+                continue
+            await db.refresh(room)
+            RoomService._room_count += 1
+            room_cache.set(room.room_id, _room_info(room))
+            return room
         
-        db.add(room)
-        await db.commit()
-        await db.refresh(room)
-        return room
+        raise ValueError("Unable to generate unique room ID")
     
     @staticmethod
     async def get_room_by_id(db: AsyncSession, room_id: str) -> Room | None:
@@ -48,6 +87,23 @@ class RoomService:
         result = await db.execute(select(Room).where(Room.room_id == room_id))
         return result.scalar_one_or_none()
     
+    @staticmethod
+    async def get_room_info(db: AsyncSession, room_id: str, use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        """Saved room metadata and code as a dict, read through room_cache.
+        
+        The dict is shared with the cache and must not be modified.
+        """
+        if use_cache:
+            info = room_cache.get(room_id)
+            if info is not None:
+                return info
+        room = await RoomService.get_room_by_id(db, room_id)
+        if room is None:
+            return None
+        info = _room_info(room)
+        room_cache.set(room_id, info)
+        return info
+    
     @staticmethod
     async def update_room_code(db: AsyncSession, room_id: str, code_content: str) -> Room | None:
         """Update room's code content"""
@@ -56,4 +112,45 @@ class RoomService:
             room.code_content = code_content
             await db.commit()
             await db.refresh(room)
-        return room
\ No newline at end of file
+            room_cache.pop(room_id)
+        return room
+    
+    @staticmethod
+    async def bulk_update_room_code(db: AsyncSession, rooms: Dict[str, Tuple[str, str]]) -> Set[str]:
+        """Write code and language for many rooms with a single executemany UPDATE.
+
+        Returns the IDs of the rooms that exist and were written.
+        """
+        if not rooms:
+            return set()
+        # Sockets can open any room ID; only saved rooms are written
+        result = await db.execute(select(Room.room_id).where(Room.room_id.in_(list(rooms))))
+        existing = set(result.scalars())
+        if not existing:
+            return existing
+        rooms_table = Room.__table__
+        statement = (
+            update(rooms_table)
+            .where(rooms_table.c.room_id == bindparam("b_room_id"))
+            .values(
+                code_content=bindparam("b_code_content"),
+                language=bindparam("b_language"),
+                updated_at=func.now()
+            )
+        )
+        await db.execute(statement, [
+            {"b_room_id": room_id, "b_code_content": rooms[room_id][0], "b_language": rooms[room_id][1]}
+            for room_id in existing
+        ])
+        await db.commit()
+        for room_id in existing:
+            room_cache.pop(room_id)
+        return existing
+
+
+# Saved rooms by room_id. Writes made through this process invalidate their
+# entry; writes by other workers only show up once it expires
+room_cache = TTLCache(
+    max_entries=settings.room_cache_size if settings.room_cache_ttl > 0 else 0,
+    ttl=settings.room_cache_ttl
+)
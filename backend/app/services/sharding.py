@@ -0,0 +1,63 @@
+import bisect
+import hashlib
+from typing import Dict, List, Optional
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent-hash ring mapping room ids to worker ids.
+
+    Each worker is placed on the ring at `replicas` virtual points, so adding
+    or removing a worker only moves the rooms adjacent to its points.
+    """
+
+    def __init__(self, replicas: int = 64):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        self._nodes: set = set()
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(self._nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    def add(self, node: str) -> bool:
+        """Add a worker; returns False if it was already on the ring"""
+        if node in self._nodes:
+            return False
+        self._nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            # Resolve the (very unlikely) collision deterministically
+            if point in self._owners and self._owners[point] < node:
+                continue
+            if point not in self._owners:
+                bisect.insort(self._points, point)
+            self._owners[point] = node
+        return True
+
+    def remove(self, node: str) -> bool:
+        """Remove a worker; returns False if it was not on the ring"""
+        if node not in self._nodes:
+            return False
+        self._nodes.discard(node)
+        remaining = sorted(self._nodes)
+        self._points = []
+        self._owners = {}
+        for other in remaining:
+            self._nodes.discard(other)
+            self.add(other)
+        return True
+
+    def owner(self, key: str) -> Optional[str]:
+        """Worker that owns a key, or None when the ring is empty"""
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[self._points[index]]
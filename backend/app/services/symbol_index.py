@@ -0,0 +1,202 @@
+import keyword
+import math
+import re
+import weakref
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional
+from app.services.document import Rope
+
+# Identifiers, skipping those inside single-line strings and comments
+_TOKEN = {
+    "python": re.compile(r'#[^\n]*|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|([A-Za-z_][A-Za-z0-9_]*)'),
+    "cpp": re.compile(r'//[^\n]*|/\*.*?\*/|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|([A-Za-z_][A-Za-z0-9_]*)'),
+}
+_TOKEN["javascript"] = _TOKEN["typescript"] = _TOKEN["cpp"]
+
+# Words that start a statement or declaration
+KEYWORDS = {
+    "python": sorted(set(keyword.kwlist) - {"True", "False", "None"}),
+    "cpp": sorted({
+        "auto", "bool", "break", "case", "catch", "char", "class", "const", "constexpr", "continue",
+        "default", "delete", "double", "else", "enum", "float", "for", "if", "include",
+        "inline", "int", "long", "namespace", "private", "protected", "public",
+        "return", "short", "signed", "static", "struct", "switch", "template",
+        "throw", "try", "typedef", "typename", "unsigned", "using", "virtual", "void", "while",
+    }),
+}
+
+# Names that also make sense in the middle of an expression
+BUILTINS = {
+    "python": sorted({
+        "True", "False", "None", "print", "len", "range", "enumerate", "zip", "sorted", "reversed",
+        "isinstance", "str", "int", "float", "list", "dict", "tuple", "min", "max", "sum", "abs",
+        "open", "input", "super", "self",
+    }),
+    "cpp": sorted({
+        "false", "true", "new", "nullptr", "sizeof", "this",
+        "std", "cout", "cin", "endl", "string", "vector", "map", "set", "pair", "size_t",
+    }),
+}
+
+# Lines either side of the cursor whose identifiers count as nearby
+NEARBY_LINES = 30
+# Candidates sharing a prefix that are ranked before giving up
+MAX_CANDIDATES = 200
+
+
+class SymbolIndex:
+    """Identifier counts for one document, kept per line so edits re-scan little.
+
+    update() diffs the new text against the last one by line, and sync()
+    asks a room buffer which lines it edited; either way only the lines in
+    between the unchanged head and tail are re-tokenized.
+    Candidates for a prefix come from a sorted list of known names and are
+    ranked by how often they occur and how close to the cursor line.
+    """
+
+    def __init__(self, language: str = "python"):
+        self.language = language.lower()
+        self._token = _TOKEN.get(self.language, _TOKEN["cpp"])
+        self._text: Optional[str] = None
+        self._version: Optional[int] = None  # buffer version the index last synced to
+        self._lines: List[str] = []
+        self._line_tokens: List[List[str]] = []
+        self._counts: Dict[str, int] = {}
+        self._names: List[str] = []  # sorted keys of _counts
+
+    def _tokenize(self, line: str) -> List[str]:
+        return [name for name in self._token.findall(line) if name]
+
+    def update(self, text: str):
+        """Bring the index up to date with the document's current text"""
+        if text is self._text:
+            return
+        self._text = text
+        old_lines = self._lines
+        new_lines = text.split("\n")
+
+        # Skip the unchanged lines at both ends
+        head = 0
+        limit = min(len(old_lines), len(new_lines))
+        while head < limit and old_lines[head] == new_lines[head]:
+            head += 1
+        tail = 0
+        limit -= head
+        while tail < limit and old_lines[-1 - tail] == new_lines[-1 - tail]:
+            tail += 1
+        self._replace(head, len(old_lines) - tail, new_lines[head:len(new_lines) - tail])
+
+    def sync(self, document: Rope):
+        """Bring the index up to date with a room buffer, reading only the lines edited since the last sync"""
+        if document.version == self._version:
+            return
+        changed = document.changes_since(self._version) if self._version is not None else None
+        self._version = document.version
+        if changed is None:
+            self.update(document.text())
+            return
+        head, tail = changed
+        end = document.line_count - tail
+        lines = document.slice(document.line_start(head), document.line_end(end - 1)).split("\n") if end > head else []
+        self._text = None
+        self._replace(head, len(self._lines) - tail, lines)
+
+    def _replace(self, head: int, end: int, lines: List[str]):
+        """Replace the lines from head up to end with lines, and re-index them"""
+        counts = self._counts
+        added: List[str] = []
+        removed: List[str] = []
+        for tokens in self._line_tokens[head:end]:
+            for name in tokens:
+                counts[name] -= 1
+                if counts[name] == 0:
+                    del counts[name]
+                    removed.append(name)
+        changed = [self._tokenize(line) for line in lines]
+        for tokens in changed:
+            for name in tokens:
+                if name in counts:
+                    counts[name] += 1
+                else:
+                    counts[name] = 1
+                    added.append(name)
+
+        self._lines[head:end] = lines
+        self._line_tokens[head:end] = changed
+
+        if len(added) + len(removed) > 64:
+            self._names = sorted(counts)
+        else:
+            for name in removed:
+                if name not in counts:
+                    index = bisect_left(self._names, name)
+                    if index < len(self._names) and self._names[index] == name:
+                        del self._names[index]
+            for name in added:
+                index = bisect_left(self._names, name)
+                if index == len(self._names) or self._names[index] != name:
+                    insort(self._names, name)
+
+    def _with_prefix(self, names: List[str], prefix: str) -> List[str]:
+        start = bisect_left(names, prefix)
+        matches = []
+        for name in names[start:start + MAX_CANDIDATES]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+        return matches
+
+    def complete(self, prefix: str, line: int, limit: int = 5, keywords: bool = True,
+                 builtins: bool = True) -> List[str]:
+        """Names starting with prefix, best first, for a cursor on the given line"""
+        if not prefix:
+            return []
+        candidates = set(self._with_prefix(self._names, prefix))
+        if keywords:
+            candidates.update(self._with_prefix(KEYWORDS.get(self.language, []), prefix))
+        else:
+            # The document's own keywords are no better a fit than the list's
+            candidates.difference_update(KEYWORDS.get(self.language, []))
+        if builtins:
+            candidates.update(self._with_prefix(BUILTINS.get(self.language, []), prefix))
+        candidates.discard(prefix)
+        if not candidates:
+            return []
+
+        # Distance in lines to the nearest occurrence around the cursor
+        distance: Dict[str, int] = {}
+        first = max(0, line - NEARBY_LINES)
+        for number, tokens in enumerate(self._line_tokens[first:line + NEARBY_LINES + 1], first):
+            gap = abs(number - line)
+            for name in tokens:
+                if name in candidates and gap < distance.get(name, NEARBY_LINES + 1):
+                    distance[name] = gap
+
+        def score(name: str) -> float:
+            value = math.log1p(self._counts.get(name, 0))
+            if name in distance:
+                value += 2.0 / (1 + distance[name])
+            return value
+
+        return sorted(candidates, key=lambda name: (-score(name), len(name), name))[:limit]
+
+
+# One index per live room buffer, dropped along with the room state
+_room_indexes: "weakref.WeakKeyDictionary[Rope, SymbolIndex]" = weakref.WeakKeyDictionary()
+
+
+def index_for_document(document: Rope, language: str) -> SymbolIndex:
+    """The up-to-date symbol index of a room's buffer"""
+    index = _room_indexes.get(document)
+    if index is None or index.language != language.lower():
+        index = SymbolIndex(language)
+        _room_indexes[document] = index
+    index.sync(document)
+    return index
+
+
+def index_for_text(text: str, language: str) -> SymbolIndex:
+    """A throwaway index for code that arrived with a request"""
+    index = SymbolIndex(language)
+    index.update(text)
+    return index
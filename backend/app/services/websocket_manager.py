@@ -1,57 +1,198 @@
 import json
 import uuid
 import time
+import zlib
 import asyncio
-from typing import Dict, List
+import logging
+from collections import deque
+from itertools import islice
+from typing import Any, Deque, Dict, List, Optional, Union
 from fastapi import WebSocket
+from app.config import settings
 from app.schemas.websocket import WebSocketMessage
+from app.schemas.autocomplete import AutocompleteRequest, AutocompleteResponse
+from app.services.autocomplete_scheduler import autocomplete_scheduler
+from app.services.backplane import Backplane
+from app.services.client_connection import ClientConnection, RemoteSocket
+from app.services.document import Rope
+from app.services.execution_engine import ExecutionQueueFull
+from app.services.execution_service import ExecutionService
+from app.services.metrics import LatencyStats
+from app.services.operational_transform import TextOperation
+from app.services.room_persister import room_persister
+from app.services.sharding import HashRing
+from app.services.ttl_cache import TTLCache
+from app.services.wire_protocol import JSON_CODEC, Codec
+
+logger = logging.getLogger(__name__)
 
 
 class WebSocketManager:
     def __init__(self):
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
-        self.room_states: Dict[str, Dict[str, str]] = {}
+        self.active_connections: Dict[str, Dict[str, ClientConnection]] = {}
+        self.room_states: Dict[str, Dict[str, Any]] = {}
+        self.room_history: Dict[str, Deque[TextOperation]] = {}  # recent ops, newest last
         self.room_users: Dict[str, Dict[str, str]] = {}  # room_id -> {user_id: display_name}
         self.room_last_activity: Dict[str, float] = {}
         self.max_rooms = 100
         self.room_timeout = 3600  # 1 hour
+        self.send_timeout = settings.ws_send_timeout
+        self.queue_max_size = settings.ws_queue_max_size
+        self.queue_high_water = settings.ws_queue_high_water
+        self.slow_consumer_grace = settings.ws_slow_consumer_grace
+        self.history_size = settings.ot_history_size
+        self.room_fanout_stats: Dict[str, LatencyStats] = {}
+        self.room_runs: Dict[str, asyncio.Task] = {}  # room_id -> code run streaming to the room
+        
+        # Cross-worker relay; rooms may have members connected to other processes
+        self.worker_id = uuid.uuid4().hex[:8]
+        self.backplane: Optional[Backplane] = None
+        self.remote_users: Dict[str, Dict[str, Dict[str, str]]] = {}  # room_id -> {worker_id: {user_id: name}}
+        self.worker_last_seen: Dict[str, float] = {}
+        self.heartbeat_interval = settings.backplane_heartbeat_interval
+        self._state_requests: Dict[str, tuple] = {}  # room_id -> (request_id, future)
+        self._buffered_edits: Dict[str, List[Dict[str, Any]]] = {}  # edits waiting for a room snapshot
+        self._heartbeat_task = None
+        
+        # Sharded mode: each room lives on the worker the hash ring assigns it
+        # to; other workers proxy their clients' sockets to that owner
+        self.sharded = settings.room_routing == "sharded"
+        self.ring = HashRing()
+        self.ring.add(self.worker_id)
+        self.proxied_connections: Dict[str, Dict[str, ClientConnection]] = {}
+        self.proxy_users: Dict[str, Dict[str, str]] = {}  # room_id -> {user_id: display_name}
+        self.proxy_owners: Dict[str, str] = {}  # room_id -> owner the proxies are attached to
+        # The owner relays a frame once per proxied user; each is re-encoded
+        # for compact clients only once. JSON payload -> {codec: frame}
+        self._relayed_frames = TTLCache(max_entries=16, ttl=float("inf"))
         
         # Cleanup task will be started when needed
         self._cleanup_task = None
     
-    async def connect(self, websocket: WebSocket, room_id: str, display_name: str = "Anonymous") -> str:
+    async def start(self, backplane: Backplane):
+        """Join the backplane so rooms are shared with other workers"""
+        self.backplane = backplane
+        backplane.on_dropped = self._on_dropped
+        room_persister.records_history = self._records_history
+        await backplane.start(self._on_backplane_message, self.worker_id)
+        await self._publish("hello")
+        await self._publish_heartbeat()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+    
+    async def stop(self):
+        """Leave the backplane"""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        if self.backplane is not None:
+            if self.sharded:
+                await self._hand_off_all()
+            else:
+                # Workers still hosting a room keep persisting it themselves
+                for room_id in self.room_states:
+                    if self.remote_users.get(room_id):
+                        room_persister.forget(room_id)
+            await self._publish("goodbye")
+            await self.backplane.stop()
+            self.backplane = None
+    
+    async def _hand_off_all(self):
+        """Give every room hosted here to the worker that owns it once this one is gone"""
+        self.ring.remove(self.worker_id)
+        if not self.ring.nodes:
+            # Last worker standing; the final flush saves the rooms
+            self.ring.add(self.worker_id)
+            return
+        await self._rebalance()
+    
+        # Sockets held here are about to close; drop them from their rooms and
+        # let the clients reconnect to a worker that is staying
+        for room_id in list(self.proxied_connections):
+            owner = self.proxy_owners.get(room_id)
+            for user_id in list(self.proxied_connections[room_id]):
+                connection = self._drop_proxy(room_id, user_id)
+                await self._publish("detach", target=owner, roomId=room_id, userId=user_id)
+                await connection.close(code=1012, reason="Server restarting")
+    
+    def _new_connection(self, websocket: WebSocket, user_id: str, codec: Codec = JSON_CODEC) -> ClientConnection:
+        """Wrap a websocket in a queued connection and start its writer"""
+        connection = ClientConnection(
+            websocket,
+            user_id,
+            max_queue=self.queue_max_size,
+            high_water=self.queue_high_water,
+            slow_consumer_grace=self.slow_consumer_grace,
+            send_timeout=self.send_timeout,
+            codec=codec
+        )
+        connection.start()
+        return connection
+    
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        display_name: str = "Anonymous",
+        codec: Codec = JSON_CODEC,
+        subprotocol: str = None
+    ) -> str:
         """Connect a user to a room and return user_id"""
-        await websocket.accept()
+        await websocket.accept(subprotocol=subprotocol)
         
         user_id = str(uuid.uuid4())[:8]
+        connection = self._new_connection(websocket, user_id, codec)
+        
+        # In sharded mode the room may be owned by another worker
+        owner = self.get_room_owner(room_id)
+        if owner != self.worker_id:
+            await self._attach_proxy(room_id, user_id, display_name, connection, owner)
+            return user_id
+        
+        if not await self._join(room_id, user_id, display_name, connection):
+            return None
+        return user_id
+    
+    async def _join(self, room_id: str, user_id: str, display_name: str, connection: ClientConnection) -> bool:
+        """Add a connection to a room hosted by this worker and announce it"""
+        # Take the room over from another worker, or rehydrate it from the
+        # database, the first time someone joins it here
+        saved = None
+        if room_id not in self.active_connections and self.remote_users.get(room_id):
+            saved = await self._request_remote_state(room_id)
+        if room_id not in self.active_connections and saved is None:
+            saved = await room_persister.load(room_id)
         
         if room_id not in self.active_connections:
-            self.active_connections[room_id] = {}
-            self.room_states[room_id] = {"code": "", "language": "python"}
-            self.room_users[room_id] = {}
+            code, language = saved or ("", "python")
+            self._create_room(room_id, code, language)
         
         # Check room limit
         if len(self.active_connections) >= self.max_rooms and room_id not in self.active_connections:
-            await websocket.close(code=1008, reason="Server at capacity")
-            return None
+            await connection.close(code=1008, reason="Server at capacity")
+            return False
         
-        self.active_connections[room_id][user_id] = websocket
+        connection.delivery_stats = self.room_fanout_stats.setdefault(room_id, LatencyStats())
+        self.active_connections[room_id][user_id] = connection
         self.room_users[room_id][user_id] = display_name
         self.room_last_activity[room_id] = time.time()
         
+        if not self.sharded:
+            await self._publish("join", roomId=room_id, userId=user_id, displayName=display_name)
+        
         # Send complete room state to the new user
-        current_user_count = len(self.active_connections[room_id])
-        connected_users = list(self.room_users[room_id].values())
-        await self.send_personal_message({
+        current_user_count = self.get_room_user_count(room_id)
+        connected_users = self.get_room_users(room_id)
+        await self.send_to_user({
             "type": "room_state",
             "roomId": room_id,
             "data": {
-                "code": self.room_states[room_id]["code"],
+                "code": self.room_states[room_id]["document"].text(),
                 "language": self.room_states[room_id]["language"],
+                "revision": self.room_states[room_id]["revision"],
                 "userCount": current_user_count,
                 "connectedUsers": connected_users
             }
-        }, websocket)
+        }, room_id, user_id)
         
         # Notify ALL users (including the new one) about the updated user count
         # Do NOT exclude anyone - everyone needs to see the updated count
@@ -66,74 +207,143 @@ class WebSocketManager:
             }
         }, room_id, exclude_user=None)
         
-        return user_id
+        return True
     
-    def disconnect(self, room_id: str, user_id: str):
-        """Disconnect a user from a room"""
-        if room_id in self.active_connections and user_id in self.active_connections[room_id]:
-            del self.active_connections[room_id][user_id]
-            if room_id in self.room_users and user_id in self.room_users[room_id]:
-                del self.room_users[room_id][user_id]
-            
-            # Clean up empty rooms
-            if not self.active_connections[room_id]:
-                del self.active_connections[room_id]
-                if room_id in self.room_states:
-                    del self.room_states[room_id]
-                if room_id in self.room_users:
-                    del self.room_users[room_id]
-                if room_id in self.room_last_activity:
-                    del self.room_last_activity[room_id]
-    
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        """Send a message to a specific websocket"""
-        try:
-            await websocket.send_text(json.dumps(message))
-        except:
-            pass  # Connection might be closed
+    def _create_room(self, room_id: str, code: str, language: str, revision: int = 0, epoch: str = None):
+        """Set up in-memory state for a room hosted by this worker.
+        
+        epoch names the copy of the room the state descends from, so copies
+        loaded separately on two workers are never mistaken for one another.
+        """
+        self.active_connections[room_id] = {}
+        self.room_states[room_id] = {
+            "document": Rope(code),
+            "language": language,
+            "revision": revision,
+            "epoch": epoch or uuid.uuid4().hex[:8]
+        }
+        self.room_history[room_id] = deque(maxlen=self.history_size)
+        self.room_users[room_id] = {}
+    
+    def disconnect(self, room_id: str, user_id: str) -> bool:
+        """Disconnect a user from a room; returns False if they were already gone"""
+        if room_id not in self.active_connections or user_id not in self.active_connections[room_id]:
+            return False
+        
+        self.active_connections[room_id].pop(user_id).stop()
+        autocomplete_scheduler.forget((room_id, user_id))
+        if room_id in self.room_users and user_id in self.room_users[room_id]:
+            del self.room_users[room_id][user_id]
+        
+        # Clean up empty rooms
+        if not self.active_connections[room_id]:
+            del self.active_connections[room_id]
+            if room_id in self.room_states:
+                del self.room_states[room_id]
+            if room_id in self.room_history:
+                del self.room_history[room_id]
+            if room_id in self.room_users:
+                del self.room_users[room_id]
+            if room_id in self.room_last_activity:
+                del self.room_last_activity[room_id]
+            if room_id in self.room_fanout_stats:
+                del self.room_fanout_stats[room_id]
+            self._cancel_run(room_id)
+        return True
+    
+    async def leave_room(self, room_id: str, user_id: str):
+        """Disconnect a user and tell the rest of the room they left"""
+        if user_id in self.proxied_connections.get(room_id, {}):
+            self._drop_proxy(room_id, user_id).stop()
+            await self._publish("detach", target=self.proxy_owners.get(room_id), roomId=room_id, userId=user_id)
+            return
+        
+        if not self.disconnect(room_id, user_id):
+            return
+        
+        if not self.sharded:
+            await self._publish("leave", roomId=room_id, userId=user_id)
+        
+        remaining_users = self.get_room_users(room_id)
+        await self.broadcast_to_room({
+            "type": "user_left",
+            "roomId": room_id,
+            "userId": user_id,
+            "data": {
+                "userCount": self.get_room_user_count(room_id),
+                "connectedUsers": remaining_users
+            }
+        }, room_id)
+    
+    async def send_to_user(self, message: dict, room_id: str, user_id: str):
+        """Queue a message for a single connected user"""
+        connection = (
+            self.active_connections.get(room_id, {}).get(user_id)
+            or self.proxied_connections.get(room_id, {}).get(user_id)
+        )
+        if connection and not connection.send(connection.codec.encode(message)):
+            await self.leave_room(room_id, user_id)
     
     async def broadcast_to_room(self, message: dict, room_id: str, exclude_user: str = None):
-        """Broadcast a message to all users in a room"""
+        """Broadcast a message to all users in a room, on every worker"""
+        await self._deliver_local(message, room_id, exclude_user)
+        if not self.sharded:
+            await self._publish("broadcast", roomId=room_id, excludeUser=exclude_user, message=message)
+    
+    async def _deliver_local(self, message: dict, room_id: str, exclude_user: str = None):
+        """Deliver a message to the users of a room connected to this worker"""
         if room_id not in self.active_connections:
             return
         
+        # Serialize once per wire format; each connection's writer task delivers it
+        payloads: Dict[Codec, Union[str, bytes]] = {}
+        
+        # Only the latest cursor position from a user matters, so stale ones are coalesced
+        coalesce_key = None
+        if message.get("type") == "cursor_update":
+            coalesce_key = f"cursor_update:{message.get('userId')}"
+        
         disconnected_users = []
         
-        for user_id, websocket in self.active_connections[room_id].items():
+        for user_id, connection in self.active_connections[room_id].items():
             if exclude_user and user_id == exclude_user:
                 continue
             
-            try:
-                await websocket.send_text(json.dumps(message))
-            except:
-                # Connection is closed, mark for removal
+            payload = payloads.get(connection.codec)
+            if payload is None:
+                payload = payloads[connection.codec] = connection.codec.encode(message)
+            if not connection.send(payload, coalesce_key):
+                # Connection is closed or was evicted, mark for removal
                 disconnected_users.append(user_id)
         
         # Clean up disconnected users
         for user_id in disconnected_users:
-            self.disconnect(room_id, user_id)
+            await self.leave_room(room_id, user_id)
     
     async def handle_message(self, message: WebSocketMessage, user_id: str):
         """Handle incoming WebSocket messages"""
         room_id = message.roomId
         
-        if message.type == "code_update":
+        if user_id in self.proxied_connections.get(room_id, {}):
+            # The room is owned by another worker
+            await self._publish(
+                "client_message",
+                target=self.proxy_owners.get(room_id),
+                roomId=room_id,
+                userId=user_id,
+                message=message.model_dump()
+            )
+            return
+        
+        if message.type in ("code_update", "code_delta", "language_change"):
             # Update room activity
             self.room_last_activity[room_id] = time.time()
             
-            # Update room state
-            if room_id in self.room_states and message.data:
-                self.room_states[room_id]["code"] = message.data.get("code", "")
-                if "language" in message.data:
-                    self.room_states[room_id]["language"] = message.data["language"]
-            
-            # Broadcast to other users in the room
-            await self.broadcast_to_room({
-                "type": "code_update",
-                "roomId": room_id,
-                "userId": user_id,
-                "data": message.data
-            }, room_id, exclude_user=user_id)
+            if self.sharded or self.backplane is None:
+                # This worker holds the only copy of the room
+                await self._apply_edit(room_id, user_id, message.type, message.data or {})
+            else:
+                await self._publish_edit(room_id, user_id, message.type, message.data or {})
         
         elif message.type == "cursor_update":
             # Broadcast cursor position to other users
@@ -143,22 +353,211 @@ class WebSocketManager:
                 "userId": user_id,
                 "data": message.data
             }, room_id, exclude_user=user_id)
-        
-        elif message.type == "language_change":
-            # Update room activity
+    
+        elif message.type == "execute":
             self.room_last_activity[room_id] = time.time()
+            await self._start_run(room_id, user_id, message.data or {})
+        
+        elif message.type == "autocomplete":
+            await self._request_suggestion(room_id, user_id, message.data or {})
+    
+    async def _request_suggestion(self, room_id: str, user_id: str, data: Dict[str, Any]):
+        """Queue an autocomplete request, replacing the user's previous one"""
+        state = self.room_states.get(room_id)
+        if state is None:
+            return
+        
+        # Complete the code as the client sent it, or else read the room's
+        # buffer in place
+        code = data.get("code")
+        document = state["document"] if code is None else None
+        try:
+            request = AutocompleteRequest(
+                code=code if code is not None else "",
+                cursorPosition=data.get("cursorPosition"),
+                language=data.get("language") or state["language"]
+            )
+        except ValueError as e:
+            await self.send_to_user({
+                "type": "error",
+                "message": f"Invalid autocomplete request: {e}"
+            }, room_id, user_id)
+            return
+        
+        seq = data.get("seq")
+        seq = seq if isinstance(seq, int) else None
+        
+        async def reply(response: AutocompleteResponse):
+            await self.send_to_user({
+                "type": "autocomplete_suggestion",
+                "roomId": room_id,
+                "data": {"seq": seq, **response.model_dump()}
+            }, room_id, user_id)
+        
+        autocomplete_scheduler.submit((room_id, user_id), request, reply, seq, document)
+    
+    async def _start_run(self, room_id: str, user_id: str, data: Dict[str, Any]):
+        """Run code for the room, streaming its output to every member"""
+        if room_id not in self.room_states:
+            return
+        if room_id in self.room_runs:
+            await self.send_to_user({
+                "type": "error",
+                "message": "Code is already running in this room"
+            }, room_id, user_id)
+            return
+        
+        # Run the code as the client sent it, or else the room's current code
+        state = self.room_states[room_id]
+        code = data.get("code")
+        if code is None:
+            code = state["document"].text()
+        language = data.get("language") or state["language"]
+        if language not in ExecutionService.languages:
+            await self.send_to_user({
+                "type": "error",
+                "message": f"Unsupported language: {language}"
+            }, room_id, user_id)
+            return
+        
+        run_id = uuid.uuid4().hex[:8]
+        self.room_runs[room_id] = asyncio.create_task(self._run_code(room_id, user_id, run_id, language, code))
+    
+    async def _run_code(self, room_id: str, user_id: str, run_id: str, language: str, code: str):
+        await self.broadcast_to_room({
+            "type": "execution_started",
+            "roomId": room_id,
+            "userId": user_id,
+            "data": {
+                "runId": run_id,
+                "language": language,
+                "userName": self.room_users.get(room_id, {}).get(user_id, "Someone")
+            }
+        }, room_id)
+        
+        async def on_output(stream: str, text: str):
+            await self.broadcast_to_room({
+                "type": "execution_output",
+                "roomId": room_id,
+                "data": {"runId": run_id, "stream": stream, "data": text}
+            }, room_id)
+        
+        try:
+            result = await ExecutionService.execute(language, code, on_output)
+            # The output itself has already been streamed
+            finished = {
+                "runId": run_id,
+                "error": result["error"],
+                "exitCode": result["exit_code"],
+                "executionTime": result["execution_time"],
+                "truncated": result["truncated"],
+                "cached": result["cached"]
+            }
+        except ExecutionQueueFull as e:
+            finished = {"runId": run_id, "error": str(e), "exitCode": None, "executionTime": 0.0, "truncated": False, "cached": False}
+        except Exception as e:
+            logger.exception(f"Run {run_id} in room {room_id} failed")
+            finished = {"runId": run_id, "error": f"Execution failed: {e}", "exitCode": None, "executionTime": 0.0, "truncated": False, "cached": False}
+        finally:
+            if self.room_runs.get(room_id) is asyncio.current_task():
+                del self.room_runs[room_id]
+        
+        await self.broadcast_to_room({
+            "type": "execution_finished",
+            "roomId": room_id,
+            "userId": user_id,
+            "data": finished
+        }, room_id)
+    
+    def _cancel_run(self, room_id: str):
+        """Stop a room's code run, e.g. once nobody is left to watch it"""
+        task = self.room_runs.pop(room_id, None)
+        if task is not None:
+            task.cancel()
+    
+    async def _publish_edit(self, room_id: str, user_id: str, kind: str, data: Dict[str, Any]):
+        """Send an edit through the backplane to every worker hosting the room.
+        
+        Workers, this one included, apply edits in the order the backplane
+        delivers them, so every copy of the room sees the same sequence and
+        stamps the same revisions. The epoch, revision and length of the room
+        here travel along so a worker whose copy disagrees notices.
+        """
+        state = self.room_states.get(room_id) if room_id not in self._buffered_edits else None
+        await self._publish(
+            "edit",
+            roomId=room_id,
+            userId=user_id,
+            type=kind,
+            data=data,
+            displayName=self.room_users.get(room_id, {}).get(user_id, "Someone"),
+            epoch=state["epoch"] if state else None,
+            revision=state["revision"] if state else None,
+            length=len(state["document"]) if state else None
+        )
+    
+    async def _on_edit(self, envelope: Dict[str, Any], room_id: str):
+        """Apply an edit in backplane order"""
+        if room_id in self._buffered_edits:
+            # A snapshot of the room is on its way; apply this on top of it
+            self._buffered_edits[room_id].append(envelope)
+            return
+        await self._apply_sequenced_edit(envelope, room_id)
+    
+    async def _apply_sequenced_edit(self, envelope: Dict[str, Any], room_id: str):
+        state = self.room_states.get(room_id)
+        if state is None:
+            return
+        if envelope.get("epoch") is not None and self._disagrees(
+                state, envelope["epoch"], envelope["revision"], lambda: len(state["document"]) != envelope["length"]):
+            self._on_divergence(room_id, envelope["origin"], envelope["revision"])
+        await self._apply_edit(
+            room_id,
+            envelope["userId"],
+            envelope["type"],
+            envelope.get("data") or {},
+            envelope.get("displayName")
+        )
+    
+    async def _apply_edit(self, room_id: str, user_id: str, kind: str, data: Dict[str, Any], user_name: str = None):
+        """Apply a client's edit to the room and pass it on to its users here"""
+        if kind == "code_update":
+            data = dict(data)
+            
+            # Update room state, recording the full replacement as an operation
+            # so clients using code_delta can transform against it
+            if room_id in self.room_states and data:
+                state = self.room_states[room_id]
+                self._replace_code(room_id, data.get("code", ""))
+                if "language" in data:
+                    state["language"] = data["language"]
+                data["revision"] = state["revision"]
+                room_persister.mark_dirty(room_id, state)
             
+            # Send to the other users in the room
+            await self._deliver_local({
+                "type": "code_update",
+                "roomId": room_id,
+                "userId": user_id,
+                "data": data
+            }, room_id, exclude_user=user_id)
+        
+        elif kind == "code_delta":
+            await self._apply_code_delta(room_id, user_id, data)
+        
+        elif kind == "language_change":
             # Update room state language
-            if room_id in self.room_states and message.data and "language" in message.data:
+            if room_id in self.room_states and "language" in data:
                 old_language = self.room_states[room_id]["language"]
-                new_language = message.data["language"]
+                new_language = data["language"]
                 self.room_states[room_id]["language"] = new_language
+                room_persister.mark_dirty(room_id, self.room_states[room_id])
                 
                 # Get user's display name
-                user_name = self.room_users.get(room_id, {}).get(user_id, "Someone")
+                user_name = user_name or self.room_users.get(room_id, {}).get(user_id, "Someone")
                 
-                # Broadcast to ALL users including the sender
-                await self.broadcast_to_room({
+                # Send to ALL users including the sender
+                await self._deliver_local({
                     "type": "language_change",
                     "roomId": room_id,
                     "userId": user_id,
@@ -169,13 +568,478 @@ class WebSocketManager:
                     }
                 }, room_id, exclude_user=None)
     
+    async def _apply_code_delta(self, room_id: str, user_id: str, data: Dict[str, Any]):
+        """Transform a client delta against concurrent ops, apply it and fan it out"""
+        state = self.room_states.get(room_id)
+        if state is None:
+            return
+        
+        history = self.room_history[room_id]
+        revision = state["revision"]
+        oldest_revision = revision - len(history)
+        base_revision = data.get("revision")
+        
+        if not isinstance(base_revision, int) or not oldest_revision <= base_revision <= revision:
+            # Too old (or bogus) to transform; the client has to start over
+            await self._send_resync(room_id, user_id)
+            return
+        
+        try:
+            concurrent = list(islice(history, base_revision - oldest_revision, None))
+            document = state["document"]
+            base_length = concurrent[0].base_length if concurrent else len(document)
+            operation = TextOperation.from_edits(data.get("ops") or [], base_length)
+            for applied in concurrent:
+                operation, _ = TextOperation.transform(operation, applied)
+            if operation.base_length != len(document):
+                raise ValueError("Operation does not match the room document")
+            edits = operation.to_edits()
+            document.apply_edits(edits)
+        except (TypeError, ValueError):
+            await self._send_resync(room_id, user_id)
+            return
+        
+        history.append(operation)
+        state["revision"] = revision + 1
+        room_persister.mark_dirty(room_id, state)
+        
+        await self.send_to_user({
+            "type": "code_delta_ack",
+            "roomId": room_id,
+            "data": {"revision": state["revision"]}
+        }, room_id, user_id)
+        
+        await self._deliver_local({
+            "type": "code_delta",
+            "roomId": room_id,
+            "userId": user_id,
+            "data": {
+                "revision": state["revision"],
+                "ops": edits
+            }
+        }, room_id, exclude_user=user_id)
+    
+    def _replace_code(self, room_id: str, code: str):
+        """Replace a room's code, recording the change as a single operation"""
+        state = self.room_states[room_id]
+        operation = TextOperation.from_diff(state["document"].text(), code)
+        if not operation.is_noop():
+            state["document"].apply_edits(operation.to_edits())
+            self.room_history[room_id].append(operation)
+            state["revision"] += 1
+    
+    async def _send_resync(self, room_id: str, user_id: str):
+        """Send a full snapshot to a client whose delta could not be applied"""
+        state = self.room_states[room_id]
+        await self.send_to_user({
+            "type": "resync",
+            "roomId": room_id,
+            "data": {
+                "code": state["document"].text(),
+                "language": state["language"],
+                "revision": state["revision"]
+            }
+        }, room_id, user_id)
+    
     def get_room_user_count(self, room_id: str) -> int:
-        """Get the number of users in a room"""
-        return len(self.active_connections.get(room_id, {}))
+        """Get the number of users in a room across all workers"""
+        remote = sum(len(users) for users in self.remote_users.get(room_id, {}).values())
+        return len(self.active_connections.get(room_id, {})) + remote
+    
+    def get_room_users(self, room_id: str) -> List[str]:
+        """Get display names of everyone in a room across all workers"""
+        names = list(self.room_users.get(room_id, {}).values())
+        for users in self.remote_users.get(room_id, {}).values():
+            names.extend(users.values())
+        return names
     
     def get_room_code(self, room_id: str) -> str:
         """Get the current code for a room"""
-        return self.room_states.get(room_id, {}).get("code", "")
+        state = self.room_states.get(room_id)
+        return state["document"].text() if state else ""
+    
+    def get_room_fanout_stats(self, room_id: str) -> Dict[str, float]:
+        """Get broadcast fan-out latency (enqueue to delivery) for a room"""
+        stats = self.room_fanout_stats.get(room_id)
+        return stats.snapshot() if stats else LatencyStats().snapshot()
+    
+    def _records_history(self, room_id: str) -> bool:
+        """Whether this worker records a room's revisions.
+        
+        In broadcast mode every worker with users in a room holds the same
+        copy; the one with the lowest id records it, and a worker whose users
+        have all left only does if nobody else still holds the room.
+        """
+        if self.sharded:
+            return True
+        others = [worker_id for worker_id, users in self.remote_users.get(room_id, {}).items() if users]
+        if not self.active_connections.get(room_id):
+            return not others
+        return all(self.worker_id < worker_id for worker_id in others)
+    
+    def get_room_owner(self, room_id: str) -> str:
+        """Worker that hosts a room; always this worker unless sharded"""
+        if not self.sharded:
+            return self.worker_id
+        return self.ring.owner(room_id)
+    
+    async def _publish(self, kind: str, target: str = None, **fields):
+        """Publish an envelope from this worker, to one worker or to all"""
+        if self.backplane is None:
+            return
+        envelope = {"kind": kind, "origin": self.worker_id, **fields}
+        try:
+            await self.backplane.publish(envelope, target)
+        except Exception as e:
+            logger.warning(f"Backplane publish failed: {e}")
+            await self._on_dropped(envelope)
+    
+    async def _on_dropped(self, envelope: Dict[str, Any]):
+        """Resync the author of an edit the backplane failed to send.
+        
+        Even this worker only applies an edit when it comes back from the
+        backplane, so a dropped one is lost and would never be acknowledged.
+        """
+        if envelope.get("kind") != "edit" or envelope.get("origin") != self.worker_id:
+            return
+        room_id, user_id = envelope["roomId"], envelope["userId"]
+        if room_id in self.room_states and user_id in self.active_connections.get(room_id, {}):
+            await self._send_resync(room_id, user_id)
+    
+    async def _publish_heartbeat(self):
+        """Announce which users are connected to this worker, and a checksum of each room"""
+        checksums = {
+            room_id: [state["epoch"], state["revision"], zlib.crc32(state["document"].text().encode())]
+            for room_id, state in self.room_states.items()
+            if room_id not in self._buffered_edits
+        } if not self.sharded else {}
+        await self._publish("heartbeat", rooms=self.room_users, checksums=checksums)
+    
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self._publish_heartbeat()
+                
+                # Forget workers that went away without saying goodbye
+                deadline = time.time() - 3 * self.heartbeat_interval
+                for worker_id, last_seen in list(self.worker_last_seen.items()):
+                    if last_seen < deadline:
+                        await self._forget_worker(worker_id)
+            except Exception as e:
+                logger.warning(f"Backplane heartbeat error: {e}")
+    
+    async def _forget_worker(self, worker_id: str):
+        self.worker_last_seen.pop(worker_id, None)
+        for room_id in list(self.remote_users):
+            self.remote_users[room_id].pop(worker_id, None)
+            if not self.remote_users[room_id]:
+                del self.remote_users[room_id]
+        if self.sharded and self.ring.remove(worker_id):
+            await self._rebalance(departed=worker_id)
+    
+    async def _request_remote_state(self, room_id: str, source: str = None) -> Optional[tuple]:
+        """Ask the workers already hosting a room (or just source) for its live code.
+        
+        The first reply replaces the room's state here where it arrives in
+        backplane order, and the edits delivered between the request and the
+        reply are applied on top of it.
+        """
+        pending = self._state_requests.get(room_id)
+        if pending is None:
+            request_id = uuid.uuid4().hex
+            pending = self._state_requests[room_id] = (request_id, asyncio.get_running_loop().create_future())
+            await self._publish("state_request", roomId=room_id, requestId=request_id, source=source)
+        try:
+            return await asyncio.wait_for(asyncio.shield(pending[1]), timeout=1.0)
+        except asyncio.TimeoutError:
+            if self._state_requests.get(room_id) is pending:
+                del self._state_requests[room_id]
+                await self._replay_edits(room_id)
+            return None
+    
+    def _adopt_state(self, room_id: str, envelope: Dict[str, Any]):
+        """Take over another worker's copy of a room, with its revision and history"""
+        if room_id not in self.room_states:
+            self._create_room(room_id, envelope["code"], envelope["language"], envelope["revision"], envelope["epoch"])
+        else:
+            state = self.room_states[room_id]
+            state["document"] = Rope(envelope["code"])
+            state["language"] = envelope["language"]
+            state["revision"] = envelope["revision"]
+            state["epoch"] = envelope["epoch"]
+        self.room_history[room_id] = deque(
+            (TextOperation.from_ops(ops) for ops in envelope.get("history") or []),
+            maxlen=self.history_size
+        )
+    
+    async def _replay_edits(self, room_id: str):
+        """Apply the edits held back while waiting for a room snapshot"""
+        # Edits arriving meanwhile keep queueing behind these
+        buffered = self._buffered_edits.get(room_id, [])
+        while buffered:
+            await self._apply_sequenced_edit(buffered.pop(0), room_id)
+        self._buffered_edits.pop(room_id, None)
+    
+    @staticmethod
+    def _disagrees(state: Dict[str, Any], epoch: str, revision: int, differs) -> bool:
+        """Whether another worker's view of a room contradicts ours.
+        
+        Their view may lag behind ours, so contents are only compared (by
+        calling differs) when the revisions match.
+        """
+        if epoch != state["epoch"]:
+            return True
+        return revision == state["revision"] and differs()
+    
+    def _on_divergence(self, room_id: str, other: str, other_revision: int):
+        """Another worker's copy of a room differs from ours"""
+        # Both workers notice through heartbeats. The copy that has seen more
+        # edits wins, the larger worker id gives way on a tie, so the two
+        # don't swap copies
+        revision = self.room_states[room_id]["revision"]
+        if (other_revision, self.worker_id) > (revision, other) and room_id not in self._state_requests:
+            logger.warning(f"Room {room_id} diverged from worker {other}, reloading it from there")
+            asyncio.create_task(self._resync_room(room_id, other))
+    
+    async def _on_backplane_message(self, envelope: Dict[str, Any]):
+        """Handle an envelope published by a worker"""
+        origin = envelope.get("origin")
+        kind = envelope.get("kind")
+        room_id = envelope.get("roomId")
+        if origin == self.worker_id:
+            # Our own edits are applied when the backplane sequences them, and
+            # our own state requests mark where the awaited snapshot is taken
+            if kind == "edit":
+                await self._on_edit(envelope, room_id)
+            elif kind == "state_request" and room_id in self._state_requests:
+                self._buffered_edits.setdefault(room_id, [])
+            return
+        
+        self.worker_last_seen[origin] = time.time()
+        
+        if self.sharded:
+            if kind == "goodbye":
+                await self._forget_worker(origin)
+                return
+            if self.ring.add(origin):
+                await self._rebalance()
+            if kind == "hello":
+                await self._publish_heartbeat()
+            else:
+                await self._on_shard_message(envelope, kind, room_id, origin)
+            return
+        
+        if kind == "broadcast":
+            await self._deliver_local(envelope["message"], room_id, envelope.get("excludeUser"))
+        
+        elif kind == "edit":
+            await self._on_edit(envelope, room_id)
+        
+        elif kind == "join":
+            self.remote_users.setdefault(room_id, {}).setdefault(origin, {})[envelope["userId"]] = envelope["displayName"]
+        
+        elif kind == "leave":
+            self.remote_users.get(room_id, {}).get(origin, {}).pop(envelope["userId"], None)
+        
+        elif kind == "heartbeat":
+            rooms = envelope.get("rooms") or {}
+            for known_room in list(self.remote_users):
+                if known_room not in rooms:
+                    self.remote_users[known_room].pop(origin, None)
+                    if not self.remote_users[known_room]:
+                        del self.remote_users[known_room]
+            for remote_room, users in rooms.items():
+                self.remote_users.setdefault(remote_room, {})[origin] = dict(users)
+            for remote_room, (epoch, revision, checksum) in (envelope.get("checksums") or {}).items():
+                state = self.room_states.get(remote_room)
+                if state is not None and remote_room not in self._buffered_edits and self._disagrees(
+                        state, epoch, revision, lambda: zlib.crc32(state["document"].text().encode()) != checksum):
+                    self._on_divergence(remote_room, origin, revision)
+        
+        elif kind == "hello":
+            await self._publish_heartbeat()
+        
+        elif kind == "goodbye":
+            await self._forget_worker(origin)
+        
+        elif kind == "state_request":
+            state = self.room_states.get(room_id)
+            if (state is not None and envelope.get("source") in (None, self.worker_id)
+                    and room_id not in self._buffered_edits):
+                await self._publish(
+                    "state_reply",
+                    roomId=room_id,
+                    requestId=envelope["requestId"],
+                    code=state["document"].text(),
+                    language=state["language"],
+                    revision=state["revision"],
+                    epoch=state["epoch"],
+                    history=[operation.ops for operation in self.room_history[room_id]]
+                )
+        
+        elif kind == "state_reply":
+            pending = self._state_requests.get(room_id)
+            if pending is not None and pending[0] == envelope.get("requestId"):
+                del self._state_requests[room_id]
+                self._adopt_state(room_id, envelope)
+                await self._replay_edits(room_id)
+                pending[1].set_result((envelope["code"], envelope["language"]))
+    
+    async def _on_shard_message(self, envelope: Dict[str, Any], kind: str, room_id: str, origin: str):
+        """Handle proxy traffic between a room's owner and the workers holding its sockets"""
+        user_id = envelope.get("userId")
+        
+        # Owner side: clients connected to other workers
+        if kind == "attach":
+            connection = self._new_connection(RemoteSocket(self._publish, origin, room_id, user_id), user_id)
+            await self._join(room_id, user_id, envelope["displayName"], connection)
+        
+        elif kind == "client_message":
+            if user_id in self.active_connections.get(room_id, {}):
+                await self.handle_message(WebSocketMessage(**envelope["message"]), user_id)
+        
+        elif kind == "detach":
+            await self.leave_room(room_id, user_id)
+        
+        elif kind == "handoff":
+            await self._accept_handoff(envelope, room_id)
+        
+        # Proxy side: frames for, or control of, sockets held here
+        elif kind == "deliver":
+            connection = self.proxied_connections.get(room_id, {}).get(user_id)
+            if connection is not None:
+                # The owner always encodes for its stand-in socket as JSON
+                payload = envelope["payload"]
+                if connection.codec is not JSON_CODEC:
+                    payload = self._reencode(payload, connection.codec)
+                if not connection.send(payload):
+                    await self.leave_room(room_id, user_id)
+        
+        elif kind == "close":
+            if user_id in self.proxied_connections.get(room_id, {}):
+                connection = self._drop_proxy(room_id, user_id)
+                await connection.close(envelope.get("code", 1000), envelope.get("reason", ""))
+    
+    def _reencode(self, payload: str, codec: Codec) -> Union[str, bytes]:
+        """Re-encode a JSON frame relayed from a room's owner, once per frame and codec"""
+        frames = self._relayed_frames.get(payload)
+        if frames is None:
+            frames = {}
+            self._relayed_frames.set(payload, frames)
+        frame = frames.get(codec)
+        if frame is None:
+            frame = frames[codec] = codec.encode(json.loads(payload))
+        return frame
+    
+    async def _attach_proxy(self, room_id: str, user_id: str, display_name: str, connection: ClientConnection, owner: str):
+        """Keep a client's socket here and join it to the room on its owner"""
+        self.proxied_connections.setdefault(room_id, {})[user_id] = connection
+        self.proxy_users.setdefault(room_id, {})[user_id] = display_name
+        self.proxy_owners[room_id] = owner
+        await self._publish("attach", target=owner, roomId=room_id, userId=user_id, displayName=display_name)
+    
+    def _drop_proxy(self, room_id: str, user_id: str) -> ClientConnection:
+        connection = self.proxied_connections[room_id].pop(user_id)
+        self.proxy_users[room_id].pop(user_id, None)
+        if not self.proxied_connections[room_id]:
+            del self.proxied_connections[room_id]
+            del self.proxy_users[room_id]
+            self.proxy_owners.pop(room_id, None)
+        return connection
+    
+    async def _rebalance(self, departed: str = None):
+        """Move rooms to their owners after the set of workers changed"""
+        # Rooms hosted here that now belong elsewhere are handed off, with
+        # their state and their members, to the new owner
+        for room_id in list(self.room_states):
+            owner = self.get_room_owner(room_id)
+            if owner != self.worker_id:
+                await self._hand_off(room_id, owner)
+        
+        # A live previous owner hands proxied rooms off itself, including the
+        # clients proxied from here; if it died, nobody will, so re-attach the
+        # local clients to whoever owns the room now
+        for room_id in list(self.proxied_connections):
+            owner = self.get_room_owner(room_id)
+            if self.proxy_owners.get(room_id) != departed:
+                self.proxy_owners[room_id] = owner
+                continue
+            users = dict(self.proxy_users[room_id])
+            connections = {user_id: self._drop_proxy(room_id, user_id) for user_id in users}
+            for user_id, display_name in users.items():
+                if owner == self.worker_id:
+                    await self._join(room_id, user_id, display_name, connections[user_id])
+                else:
+                    await self._attach_proxy(room_id, user_id, display_name, connections[user_id], owner)
+    
+    async def _hand_off(self, room_id: str, owner: str):
+        """Give a room hosted here to its new owner"""
+        state = self.room_states[room_id]
+        members = []
+        for user_id, connection in self.active_connections[room_id].items():
+            display_name = self.room_users[room_id].get(user_id, "Anonymous")
+            if isinstance(connection.websocket, RemoteSocket):
+                members.append({"userId": user_id, "worker": connection.websocket.worker_id, "displayName": display_name})
+                connection.stop()
+            else:
+                # The socket stays here and is proxied from now on
+                members.append({"userId": user_id, "worker": self.worker_id, "displayName": display_name})
+                self.proxied_connections.setdefault(room_id, {})[user_id] = connection
+                self.proxy_users.setdefault(room_id, {})[user_id] = display_name
+        if room_id in self.proxied_connections:
+            self.proxy_owners[room_id] = owner
+        
+        await self._publish(
+            "handoff",
+            target=owner,
+            roomId=room_id,
+            code=state["document"].text(),
+            language=state["language"],
+            revision=state["revision"],
+            epoch=state["epoch"],
+            members=members
+        )
+        
+        # The new owner persists the room from now on
+        room_persister.forget(room_id)
+        self._cancel_run(room_id)
+        for room_map in (self.active_connections, self.room_states, self.room_history,
+                         self.room_users, self.room_last_activity, self.room_fanout_stats):
+            room_map.pop(room_id, None)
+    
+    async def _accept_handoff(self, envelope: Dict[str, Any], room_id: str):
+        """Take over a room, with its members, from its previous owner"""
+        if room_id in self.room_states:
+            # Clients attached here early, before the state arrived
+            self._replace_code(room_id, envelope["code"])
+            self.room_states[room_id]["language"] = envelope["language"]
+        else:
+            self._create_room(room_id, envelope["code"], envelope["language"], envelope["revision"], envelope.get("epoch"))
+        
+        self.room_last_activity[room_id] = time.time()
+        stats = self.room_fanout_stats.setdefault(room_id, LatencyStats())
+        for member in envelope["members"]:
+            user_id = member["userId"]
+            if member["worker"] == self.worker_id:
+                if user_id not in self.proxied_connections.get(room_id, {}):
+                    continue
+                connection = self._drop_proxy(room_id, user_id)
+            else:
+                connection = self._new_connection(RemoteSocket(self._publish, member["worker"], room_id, user_id), user_id)
+            connection.delivery_stats = stats
+            self.active_connections[room_id][user_id] = connection
+            self.room_users[room_id][user_id] = member["displayName"]
+        
+        room_persister.mark_dirty(room_id, self.room_states[room_id])
+    
+    async def _resync_room(self, room_id: str, source: str = None):
+        """Reload a room's code from another worker and resync local clients"""
+        if await self._request_remote_state(room_id, source) is None or room_id not in self.room_states:
+            return
+        room_persister.mark_dirty(room_id, self.room_states[room_id])
+        for user_id in list(self.active_connections.get(room_id, {})):
+            await self._send_resync(room_id, user_id)
     
     async def cleanup_inactive_rooms(self):
         """Cleanup inactive rooms periodically"""
@@ -188,25 +1052,21 @@ class WebSocketManager:
                 ]
                 
                 for room_id in inactive_rooms:
-                    # Close all connections in inactive room
-                    if room_id in self.active_connections:
-                        for websocket in self.active_connections[room_id].values():
-                            try:
-                                await websocket.close(code=1000, reason="Room timeout")
-                            except:
-                                pass
-                        del self.active_connections[room_id]
-                    
-                    # Clean up room data
-                    if room_id in self.room_states:
-                        del self.room_states[room_id]
-                    if room_id in self.room_last_activity:
-                        del self.room_last_activity[room_id]
+                    await self._close_room(room_id, reason="Room timeout")
                 
                 await asyncio.sleep(300)  # Check every 5 minutes
             except Exception as e:
-                print(f"Cleanup error: {e}")
+                logger.error(f"Room cleanup failed: {e}")
                 await asyncio.sleep(60)
+    
+    async def _close_room(self, room_id: str, code: int = 1000, reason: str = ""):
+        """Disconnect everyone in a room here, which tears the room down as the last one goes"""
+        for user_id, connection in list(self.active_connections.get(room_id, {}).items()):
+            self.disconnect(room_id, user_id)
+            await connection.close(code=code, reason=reason)
+            if not self.sharded:
+                await self._publish("leave", roomId=room_id, userId=user_id)
+        self.room_last_activity.pop(room_id, None)
 
 
 # Global WebSocket manager instance
@@ -0,0 +1,119 @@
+import json
+import zlib
+from typing import Any, Dict, List, Optional, Tuple, Union
+import msgpack
+from app.config import settings
+
+JSON_SUBPROTOCOL = "codepair.json"
+COMPACT_SUBPROTOCOL = "codepair.msgpack.v1"
+
+# Type codes of the compact protocol: the position in this list. Append only
+MESSAGE_TYPES = [
+    "join_room", "code_update", "code_delta", "code_delta_ack", "cursor_update",
+    "language_change", "user_joined", "user_left", "room_state", "resync",
+    "execute", "execution_started", "execution_output", "execution_finished",
+    "autocomplete", "autocomplete_suggestion", "error",
+]
+_TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES)}
+
+# Leading byte of a compact frame
+_PLAIN = 0
+_DEFLATED = 1
+
+# Top-level fields with a slot of their own in compact frames
+_FRAME_FIELDS = ("type", "roomId", "userId", "data")
+
+
+class FrameError(ValueError):
+    """A frame that could not be decoded"""
+
+
+class JsonCodec:
+    """The original protocol: one JSON object per text frame"""
+
+    def encode(self, message: Dict[str, Any]) -> str:
+        return json.dumps(message)
+
+    def decode(self, frame: Union[str, bytes]) -> Dict[str, Any]:
+        try:
+            message = json.loads(frame)
+        except json.JSONDecodeError:
+            raise FrameError("Invalid JSON format")
+        if not isinstance(message, dict):
+            raise FrameError("Invalid JSON format")
+        return message
+
+
+class CompactCodec:
+    """Binary frames: a flag byte, then the msgpack array [type, data, userId, extra].
+
+    type is the message's code in MESSAGE_TYPES, or its name if it has none.
+    roomId is never sent because a socket only belongs to the room in its
+    URL, extra holds any other top-level fields, and trailing empty slots
+    are dropped. Frames over compress_threshold bytes are deflated when
+    that makes them smaller, so only large snapshots pay for compression.
+    """
+
+    def __init__(self, compress_threshold: int = 1024, level: int = 6):
+        self.compress_threshold = compress_threshold
+        self.level = level
+
+    def encode(self, message: Dict[str, Any]) -> bytes:
+        kind = message.get("type")
+        extra = {key: value for key, value in message.items() if key not in _FRAME_FIELDS}
+        fields = [_TYPE_CODES.get(kind, kind), message.get("data"), message.get("userId"), extra or None]
+        while len(fields) > 1 and fields[-1] is None:
+            fields.pop()
+        body = msgpack.packb(fields, use_bin_type=True)
+        if len(body) > self.compress_threshold:
+            deflated = zlib.compress(body, self.level)
+            if len(deflated) < len(body):
+                return bytes((_DEFLATED,)) + deflated
+        return bytes((_PLAIN,)) + body
+
+    def decode(self, frame: Union[str, bytes]) -> Dict[str, Any]:
+        if not isinstance(frame, bytes) or not frame:
+            raise FrameError("Expected a binary frame")
+        try:
+            if frame[0] == _PLAIN:
+                body = frame[1:]
+            elif frame[0] == _DEFLATED:
+                body = zlib.decompress(frame[1:])
+            else:
+                raise FrameError("Unknown frame flag")
+            fields = msgpack.unpackb(body, raw=False)
+        except FrameError:
+            raise
+        except Exception:
+            raise FrameError("Invalid frame")
+        if not isinstance(fields, list) or not 1 <= len(fields) <= 4:
+            raise FrameError("Invalid frame")
+
+        fields += [None] * (4 - len(fields))
+        kind, data, user_id, extra = fields
+        if isinstance(kind, int):
+            if not 0 <= kind < len(MESSAGE_TYPES):
+                raise FrameError("Unknown message type")
+            kind = MESSAGE_TYPES[kind]
+        message: Dict[str, Any] = dict(extra) if isinstance(extra, dict) else {}
+        message["type"] = kind
+        if data is not None:
+            message["data"] = data
+        if user_id is not None:
+            message["userId"] = user_id
+        return message
+
+
+Codec = Union[JsonCodec, CompactCodec]
+
+JSON_CODEC = JsonCodec()
+COMPACT_CODEC = CompactCodec(compress_threshold=settings.ws_compress_threshold)
+
+
+def negotiate(offered: List[str]) -> Tuple[Codec, Optional[str]]:
+    """Pick the codec for a socket and the subprotocol to accept it with"""
+    if COMPACT_SUBPROTOCOL in offered:
+        return COMPACT_CODEC, COMPACT_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON_CODEC, JSON_SUBPROTOCOL
+    return JSON_CODEC, None
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: editing a large room document as a plain str vs the Rope
+used for in-memory room state.
+
+Run from the backend directory:
+    python benchmarks/bench_document.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.document import Rope
+
+
+LINE = "    result = compute_value(alpha, beta) + offset  # keep going\n"
+
+
+def make_document(lines: int) -> str:
+    return LINE * lines
+
+
+def bench_str(text: str, edits):
+    start = time.perf_counter()
+    for kind, pos, payload in edits:
+        if kind == "insert":
+            text = text[:pos] + payload + text[pos:]
+        else:
+            text = text[:pos] + text[pos + payload:]
+    return time.perf_counter() - start
+
+
+def bench_rope(text: str, edits):
+    rope = Rope(text)
+    start = time.perf_counter()
+    for kind, pos, payload in edits:
+        if kind == "insert":
+            rope.insert(pos, payload)
+        else:
+            rope.delete(pos, payload)
+    return time.perf_counter() - start
+
+
+def bench_line_lookup(text: str, offsets):
+    rope = Rope(text)
+    start = time.perf_counter()
+    for offset in offsets:
+        text[:offset].count("\n")
+    str_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for offset in offsets:
+        rope.offset_to_line_col(offset)
+    rope_time = time.perf_counter() - start
+    return str_time, rope_time
+
+
+def make_edits(length: int, count: int):
+    """Typing-like workload: mostly single characters near a moving cursor"""
+    rng = random.Random(42)
+    cursor = length // 2
+    edits = []
+    for _ in range(count):
+        if rng.random() < 0.02:
+            cursor = rng.randint(0, length)
+        if rng.random() < 0.8:
+            edits.append(("insert", cursor, "x"))
+            cursor += 1
+            length += 1
+        elif cursor > 0:
+            cursor -= 1
+            edits.append(("delete", cursor, 1))
+            length -= 1
+    return edits
+
+
+def main():
+    print(f"{'lines':>8} {'chars':>10} {'edits':>6} {'str ms':>10} {'rope ms':>10} {'speedup':>8}")
+    for lines in (1_000, 5_000, 20_000, 100_000):
+        text = make_document(lines)
+        edits = make_edits(len(text), 2_000)
+        str_time = bench_str(text, edits)
+        rope_time = bench_rope(text, edits)
+        print(
+            f"{lines:>8} {len(text):>10} {len(edits):>6} "
+            f"{str_time * 1000:>10.2f} {rope_time * 1000:>10.2f} {str_time / rope_time:>7.1f}x"
+        )
+
+    print()
+    print(f"{'lines':>8} {'lookups':>8} {'str ms':>10} {'rope ms':>10}   (offset -> line/column)")
+    for lines in (5_000, 100_000):
+        text = make_document(lines)
+        rng = random.Random(7)
+        offsets = [rng.randint(0, len(text)) for _ in range(1_000)]
+        str_time, rope_time = bench_line_lookup(text, offsets)
+        print(f"{lines:>8} {len(offsets):>8} {str_time * 1000:>10.2f} {rope_time * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
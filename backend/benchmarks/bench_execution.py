@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: latency of small Python snippets started as a fresh
+python3 process vs run on the warm interpreter pool.
+
+Run from the backend directory:
+    python benchmarks/bench_execution.py
+"""
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.execution_engine import ExecutionEngine
+from app.services.python_pool import PythonWorkerPool
+
+
+SNIPPETS = {
+    "print": "print('hello')",
+    "loop": "print(sum(i * i for i in range(10000)))",
+    "imports": "import collections, json, re\nprint(json.dumps(collections.Counter('abracadabra')))",
+}
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+async def bench_cold(engine: ExecutionEngine, code: str, runs: int):
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_snippet.py")
+    with open(path, "w") as f:
+        f.write(code)
+    samples = []
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            await engine.run([sys.executable, path])
+            samples.append(time.perf_counter() - start)
+    finally:
+        os.unlink(path)
+    return samples
+
+
+async def bench_warm(pool: PythonWorkerPool, code: str, runs: int):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await pool.run(code)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def main():
+    runs = 50
+    engine = ExecutionEngine()
+    pool = PythonWorkerPool(size=2, preload=["collections", "json", "re"])
+    await pool.start()
+
+    print(f"{'snippet':>10} {'cold p50':>10} {'warm p50':>10} {'cold p95':>10} {'warm p95':>10} {'speedup':>8}")
+    try:
+        for name, code in SNIPPETS.items():
+            cold = await bench_cold(engine, code, runs)
+            warm = await bench_warm(pool, code, runs)
+            print(
+                f"{name:>10} {percentile(cold, 0.5) * 1000:>8.1f}ms {percentile(warm, 0.5) * 1000:>8.1f}ms "
+                f"{percentile(cold, 0.95) * 1000:>8.1f}ms {percentile(warm, 0.95) * 1000:>8.1f}ms "
+                f"{statistics.median(cold) / statistics.median(warm):>7.1f}x"
+            )
+    finally:
+        await pool.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
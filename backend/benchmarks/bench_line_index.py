@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: finding the autocomplete context window around a cursor
+by splitting and counting the whole request, with a LineIndex built per
+request, and in place on a room's Rope.
+
+Run from the backend directory:
+    python benchmarks/bench_line_index.py
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.autocomplete_service import CursorContext
+from app.services.document import LineIndex, Rope
+
+
+LINE = "    result = compute_value(alpha, beta) + offset  # keep going\n"
+
+
+def split_context(code: str, cursor_position: int) -> str:
+    """What the autocomplete service used to do on every request"""
+    lines = code.split('\n')
+    cursor_line = code[:cursor_position].count('\n')
+    current_line = lines[cursor_line]
+    line_position = cursor_position - sum(len(line) + 1 for line in lines[:cursor_line])
+    current_text = current_line[:line_position]
+    start_line = max(0, cursor_line - 2)
+    return "\n".join(lines[start_line:cursor_line + 1]) + current_text
+
+
+def bench(fn, offsets) -> float:
+    start = time.perf_counter()
+    for offset in offsets:
+        fn(offset)
+    return (time.perf_counter() - start) / len(offsets)
+
+
+def main():
+    print(f"{'lines':>8} {'chars':>10} {'split us':>10} {'index us':>10} {'rope us':>10}")
+    for lines in (1_000, 5_000, 20_000, 100_000):
+        code = LINE * lines
+        rope = Rope(code)
+        rng = random.Random(7)
+        offsets = [rng.randint(0, len(code)) for _ in range(200)]
+
+        split_time = bench(lambda offset: split_context(code, offset), offsets)
+        # A fresh index per request, as for POST /api/autocomplete
+        index_time = bench(lambda offset: CursorContext(LineIndex(code), offset), offsets)
+        # The room buffer keeps its own line counts, as for socket requests
+        rope_time = bench(lambda offset: CursorContext(rope, offset), offsets)
+        print(
+            f"{lines:>8} {len(code):>10} {split_time * 1e6:>10.1f} "
+            f"{index_time * 1e6:>10.1f} {rope_time * 1e6:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Load test: room throughput with 1, 2 and 4 sharded workers.
+
+Starts the local pub/sub relay and N uvicorn workers with
+ROOM_ROUTING=sharded, spreads clients for many rooms across the workers
+round-robin, and has every client send code_delta edits in a closed loop
+(send, wait for the ack, send again). Reports the number of frames
+delivered to clients per second.
+
+Throughput only scales with workers when the machine has spare cores.
+
+Run from the backend directory:
+    python benchmarks/load_sharding.py --workers 1 2 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for_port(url: str, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_cluster(workers: int, base_port: int, relay_port: int, database: str):
+    processes = [subprocess.Popen(
+        [sys.executable, "scripts/pubsub_relay.py", "--port", str(relay_port)],
+        cwd=BACKEND,
+    )]
+    time.sleep(0.3)
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite+aiosqlite:///{database}",
+        BACKPLANE="redis",
+        BACKPLANE_URL=f"redis://127.0.0.1:{relay_port}/0",
+        ROOM_ROUTING="sharded",
+        ENVIRONMENT="benchmark",
+    )
+    for i in range(workers):
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(base_port + i), "--log-level", "warning"],
+            cwd=BACKEND,
+            env=env,
+        ))
+        # One at a time, so only the first worker creates the tables
+        wait_for_port(f"http://127.0.0.1:{base_port + i}/health")
+    # Let every worker hear the others' hello so the rings agree
+    time.sleep(1.5)
+    return processes
+
+
+def stop_cluster(processes):
+    # Workers first, so their goodbyes still reach the relay
+    relay, workers = processes[0], processes[1:]
+    for group in (workers, [relay]):
+        for process in group:
+            process.terminate()
+        for process in group:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def run_client(url: str, room_id: str, edits: int, expected: int, ready: asyncio.Barrier, counts: list):
+    async with websockets.connect(url, max_size=None) as ws:
+        revision = 0
+        received = 0
+
+        async def read():
+            nonlocal revision, received
+            message = json.loads(await asyncio.wait_for(ws.recv(), timeout=30))
+            data = message.get("data") or {}
+            if "revision" in data:
+                revision = max(revision, data["revision"])
+            if message["type"] == "code_delta":
+                received += 1
+            return message["type"]
+
+        while await read() != "room_state":
+            pass
+        await ready.wait()
+
+        for _ in range(edits):
+            await ws.send(json.dumps({
+                "type": "code_delta",
+                "roomId": room_id,
+                "data": {"revision": revision, "ops": [{"pos": 0, "delete": 0, "insert": "x"}]},
+            }))
+            while await read() != "code_delta_ack":
+                pass
+            counts[0] += 1
+
+        # Drain the edits still in flight from the other clients
+        while received < expected:
+            await read()
+        counts[0] += received
+
+
+async def run_load(workers: int, base_port: int, rooms: int, clients: int, edits: int):
+    ready = asyncio.Barrier(rooms * clients + 1)
+    counts = [0]
+    tasks = []
+    index = 0
+    for room in range(rooms):
+        room_id = f"L{room:05d}"
+        for client in range(clients):
+            port = base_port + index % workers
+            index += 1
+            url = f"ws://127.0.0.1:{port}/ws/{room_id}?display_name=c{client}"
+            tasks.append(asyncio.create_task(
+                run_client(url, room_id, edits, edits * (clients - 1), ready, counts)
+            ))
+
+    await ready.wait()
+    start = time.perf_counter()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    return counts[0], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--clients", type=int, default=4, help="clients per room")
+    parser.add_argument("--edits", type=int, default=50, help="edits sent by each client")
+    parser.add_argument("--base-port", type=int, default=9100)
+    parser.add_argument("--relay-port", type=int, default=6390)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), {args.rooms} rooms x {args.clients} clients x {args.edits} edits")
+    print(f"{'workers':>8} {'frames':>10} {'seconds':>9} {'frames/s':>10}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as tmp:
+            processes = start_cluster(workers, args.base_port, args.relay_port, os.path.join(tmp, "load.db"))
+            try:
+                frames, elapsed = asyncio.run(
+                    run_load(workers, args.base_port, args.rooms, args.clients, args.edits)
+                )
+            finally:
+                stop_cluster(processes)
+        print(f"{workers:>8} {frames:>10} {elapsed:>9.2f} {frames / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,13 +7,31 @@ import os
 from app.database import init_db
 from app.routers import rooms, autocomplete, websocket, execute
 from app.middleware.rate_limiter import RateLimitMiddleware, rate_limiter
+from app.services.backplane import create_backplane
+from app.services.completion_client import completion_client
+from app.services.execution_engine import execution_engine
+from app.services.python_pool import python_pool
+from app.services.revision_store import revision_store
+from app.services.room_persister import room_persister
+from app.services.room_service import room_cache
+from app.services.websocket_manager import websocket_manager
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize database on startup
     await init_db()
+    room_persister.start()
+    await websocket_manager.start(create_backplane())
+    await python_pool.start()
     yield
+    await websocket_manager.stop()
+    await execution_engine.stop()
+    await python_pool.stop()
+    await completion_client.stop()
+    await rate_limiter.stop()
+    # Write any unsaved room code before shutting down
+    await room_persister.stop()
 
 
 app = FastAPI(
@@ -85,7 +103,10 @@ async def health_check():
     return {
         "status": "healthy",
         "active_rooms": len(websocket.websocket_manager.active_connections),
-        "total_connections": sum(len(conns) for conns in websocket.websocket_manager.active_connections.values())
+        "total_connections": sum(len(conns) for conns in websocket.websocket_manager.active_connections.values()),
+        "rate_limiter": rate_limiter.stats(),
+        "room_cache": room_cache.stats(),
+        "revisions": revision_store.stats()
     }
 
 
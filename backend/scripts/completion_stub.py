@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the upstream completion model, for exercising the
+autocomplete client's connection pool and circuit breaker offline.
+
+Answers every POST like the Hugging Face inference API does, optionally
+after a delay or with a 503 for a fraction of requests.
+
+    python scripts/completion_stub.py --port 8900 --delay 0.05 --fail-rate 0.2
+    AUTOCOMPLETE_API_URL=http://127.0.0.1:8900/ uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+from typing import Dict
+
+options = argparse.Namespace(delay=0.0, fail_rate=0.0, suffix="  # completed")
+
+
+async def read_request(reader: asyncio.StreamReader):
+    request_line = await reader.readline()
+    if not request_line:
+        raise ConnectionError
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return request_line.split()[0], headers, body
+
+
+def response(status: str, payload) -> bytes:
+    body = json.dumps(payload).encode()
+    return (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"\r\n"
+    ).encode() + body
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    # Keep-alive: serve requests on this connection until the client closes it
+    try:
+        while True:
+            method, headers, body = await read_request(reader)
+            if options.delay:
+                await asyncio.sleep(options.delay)
+
+            if method != b"POST":
+                writer.write(response("405 Method Not Allowed", {"error": "POST only"}))
+            elif random.random() < options.fail_rate:
+                writer.write(response("503 Service Unavailable", {"error": "Model is overloaded"}))
+            else:
+                try:
+                    inputs = json.loads(body or b"{}").get("inputs", "")
+                    if isinstance(inputs, list):
+                        # Batched prompts get one list of generations each
+                        result = [[{"generated_text": prompt + options.suffix}] for prompt in inputs]
+                    else:
+                        result = [{"generated_text": inputs + options.suffix}]
+                    writer.write(response("200 OK", result))
+                except ValueError:
+                    writer.write(response("400 Bad Request", {"error": "Invalid JSON"}))
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def main():
+    global options
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--suffix", default="  # completed", help="text appended to the prompt")
+    options = parser.parse_args()
+
+    server = await asyncio.start_server(handle, options.host, options.port)
+    print(f"Completion stub listening on {options.host}:{options.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Redis pub/sub, for running several workers with
+BACKPLANE=redis (and RATE_LIMIT_BACKEND=redis) on a machine without Redis.
+
+Speaks enough of the Redis protocol for the backplane and the shared rate
+limiter: PING, AUTH, SELECT, SUBSCRIBE, UNSUBSCRIBE, PUBLISH, INCR, DECR,
+GET, PEXPIRE and QUIT.
+
+    python scripts/pubsub_relay.py --port 6379
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+subscribers: Dict[bytes, Set[asyncio.StreamWriter]] = {}
+counters: Dict[bytes, Tuple[int, Optional[float]]] = {}  # key -> (value, expires_at)
+
+
+def counter(key: bytes) -> Tuple[int, Optional[float]]:
+    value, expires_at = counters.get(key, (0, None))
+    if expires_at is not None and expires_at <= time.monotonic():
+        del counters[key]
+        return 0, None
+    return value, expires_at
+
+
+def bulk(data: bytes) -> bytes:
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+def array(items: List[bytes]) -> bytes:
+    return b"*%d\r\n" % len(items) + b"".join(items)
+
+
+async def read_command(reader: asyncio.StreamReader) -> List[bytes]:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError
+    if not line.startswith(b"*"):
+        # Inline command, e.g. from telnet
+        return line.strip().split()
+    args = []
+    for _ in range(int(line[1:-2])):
+        header = await reader.readline()
+        length = int(header[1:-2])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    channels: Set[bytes] = set()
+    try:
+        while True:
+            args = await read_command(reader)
+            if not args:
+                continue
+            command = args[0].upper()
+
+            if command == b"PING":
+                writer.write(b"+PONG\r\n")
+            elif command in (b"AUTH", b"SELECT"):
+                writer.write(b"+OK\r\n")
+            elif command == b"SUBSCRIBE":
+                for channel in args[1:]:
+                    subscribers.setdefault(channel, set()).add(writer)
+                    channels.add(channel)
+                    writer.write(array([bulk(b"subscribe"), bulk(channel), b":%d\r\n" % len(channels)]))
+            elif command == b"UNSUBSCRIBE":
+                for channel in args[1:] or list(channels):
+                    subscribers.get(channel, set()).discard(writer)
+                    channels.discard(channel)
+                    writer.write(array([bulk(b"unsubscribe"), bulk(channel), b":%d\r\n" % len(channels)]))
+            elif command == b"PUBLISH" and len(args) == 3:
+                channel, message = args[1], args[2]
+                targets = subscribers.get(channel, set())
+                frame = array([bulk(b"message"), bulk(channel), bulk(message)])
+                for target in list(targets):
+                    target.write(frame)
+                writer.write(b":%d\r\n" % len(targets))
+            elif command in (b"INCR", b"DECR") and len(args) == 2:
+                if len(counters) > 10000:
+                    for key in list(counters):
+                        counter(key)
+                value, expires_at = counter(args[1])
+                value += 1 if command == b"INCR" else -1
+                counters[args[1]] = (value, expires_at)
+                writer.write(b":%d\r\n" % value)
+            elif command == b"GET" and len(args) == 2:
+                counter(args[1])  # drops the key if it has expired
+                if args[1] in counters:
+                    writer.write(bulk(b"%d" % counters[args[1]][0]))
+                else:
+                    writer.write(b"$-1\r\n")
+            elif command == b"PEXPIRE" and len(args) == 3:
+                value, _ = counter(args[1])
+                exists = args[1] in counters
+                if exists:
+                    counters[args[1]] = (value, time.monotonic() + int(args[2]) / 1000)
+                writer.write(b":%d\r\n" % exists)
+            elif command == b"QUIT":
+                writer.write(b"+OK\r\n")
+                break
+            else:
+                writer.write(b"-ERR unknown command '%s'\r\n" % args[0])
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        for channel in channels:
+            subscribers.get(channel, set()).discard(writer)
+        writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    server = await asyncio.start_server(handle, args.host, args.port)
+    print(f"Pub/sub relay listening on {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,49 @@
+"""
+Unit tests for the subprocess execution engine.
+Run from the backend directory: python -m unittest discover tests
+"""
+
+import asyncio
+import unittest
+
+from app.services.execution_engine import ExecutionEngine
+
+
+def is_running(pid: int) -> bool:
+    """True unless the process is gone or a zombie waiting to be reaped"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+class ExecutionEngineTest(unittest.TestCase):
+    def run_command(self, argv, **kwargs):
+        return asyncio.run(ExecutionEngine().run(argv, **kwargs))
+
+    def test_output_and_exit_code(self):
+        result = self.run_command(["sh", "-c", "echo out; echo err >&2; exit 3"])
+        self.assertEqual(result.stdout, "out\n")
+        self.assertEqual(result.stderr, "err\n")
+        self.assertEqual(result.returncode, 3)
+        self.assertFalse(result.timed_out)
+
+    def test_timeout_kills_background_grandchild(self):
+        # The shell exits at once, but the sleep it left behind holds the pipes
+        result = self.run_command(["sh", "-c", "sleep 300 & echo $!"], timeout=1.0)
+        self.assertTrue(result.timed_out)
+        self.assertLess(result.duration, 5)
+        grandchild = int(result.stdout.split()[-1])
+        self.assertFalse(is_running(grandchild))
+
+    def test_output_cap_kills_program(self):
+        engine = ExecutionEngine(output_limit=1024)
+        result = asyncio.run(engine.run(["sh", "-c", "yes & yes"], timeout=5.0))
+        self.assertTrue(result.truncated)
+        self.assertFalse(result.timed_out)
+        self.assertLessEqual(len(result.stdout), 1024)
+
+
+if __name__ == "__main__":
+    unittest.main()
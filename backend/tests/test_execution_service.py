@@ -0,0 +1,80 @@
+"""
+Unit tests for run sharing and result caching in ExecutionService.
+Run from the backend directory: python -m unittest discover tests
+"""
+
+import asyncio
+import unittest
+from unittest import mock
+
+from app.services import execution_service
+from app.services.execution_service import ExecutionService
+from app.services.ttl_cache import TTLCache
+
+
+class ExecutionServiceTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.runs = 0
+        self.release = asyncio.Event()
+
+        async def fake_execute(language, code, on_output):
+            self.runs += 1
+            await on_output("stdout", "hi\n")
+            await self.release.wait()
+            return {"output": "hi\n", "error": None, "execution_time": 5.0, "exit_code": 0, "truncated": False}
+
+        patches = [
+            mock.patch.object(ExecutionService, "_execute", staticmethod(fake_execute)),
+            mock.patch.object(ExecutionService, "_live_runs", {}),
+            mock.patch.object(execution_service, "result_cache", TTLCache(max_entries=16, ttl=60)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_identical_runs_share_one_process(self):
+        first = asyncio.create_task(ExecutionService.execute("python", "print('hi')"))
+        second = asyncio.create_task(ExecutionService.execute("python", "print('hi')"))
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(first, second)
+        self.assertEqual(self.runs, 1)
+        self.assertEqual([result["output"] for result in results], ["hi\n", "hi\n"])
+
+    async def test_caller_after_cancelled_run_starts_a_new_one(self):
+        first = asyncio.create_task(ExecutionService.execute("python", "print('hi')"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        self.assertTrue(first.cancelled())
+
+        # The cancelled run has not unwound yet; a new caller must not join it
+        self.release.set()
+        result = await ExecutionService.execute("python", "print('hi')")
+        self.assertEqual(result["output"], "hi\n")
+        self.assertEqual(self.runs, 2)
+
+    async def test_cache_hit_reports_its_own_time(self):
+        self.release.set()
+        first = await ExecutionService.execute("python", "print('hi')")
+        self.assertFalse(first["cached"])
+        chunks = []
+
+        async def on_output(stream, text):
+            chunks.append((stream, text))
+
+        second = await ExecutionService.execute("python", "print('hi')", on_output)
+        self.assertTrue(second["cached"])
+        self.assertLess(second["execution_time"], 1.0)
+        self.assertEqual(chunks, [("stdout", "hi\n")])
+        self.assertEqual(self.runs, 1)
+
+    def test_nondeterministic_programs_are_not_cacheable(self):
+        for code in ["from os import urandom\nprint(urandom(4))", "print({1, 2, 3})", "import random"]:
+            with self.subTest(code=code):
+                self.assertFalse(ExecutionService.is_cacheable("python", code))
+        self.assertTrue(ExecutionService.is_cacheable("python", "print(sum([1, 2, 3]))"))
+
+
+if __name__ == "__main__":
+    unittest.main()
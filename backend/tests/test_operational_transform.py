@@ -0,0 +1,132 @@
+"""
+Unit tests for operational transform and the rope document.
+Run from the backend directory: python -m unittest discover tests
+"""
+
+import random
+import unittest
+
+from app.services.document import Rope
+from app.services.operational_transform import TextOperation
+
+
+def random_edits(length: int, rng: random.Random):
+    """Sorted, non-overlapping range edits against a document of length"""
+    edits = []
+    pos = 0
+    while pos <= length and rng.random() < 0.7:
+        pos = rng.randint(pos, length)
+        delete = rng.randint(0, min(3, length - pos))
+        insert = "".join(rng.choice("ab\n") for _ in range(rng.randint(0, 3)))
+        edits.append({"pos": pos, "delete": delete, "insert": insert})
+        pos += delete + 1
+    return edits
+
+
+class TransformTest(unittest.TestCase):
+    def test_concurrent_operations_converge(self):
+        rng = random.Random(1)
+        for _ in range(500):
+            doc = "".join(rng.choice("xyz\n") for _ in range(rng.randint(0, 20)))
+            a = TextOperation.from_edits(random_edits(len(doc), rng), len(doc))
+            b = TextOperation.from_edits(random_edits(len(doc), rng), len(doc))
+            a_prime, b_prime = TextOperation.transform(a, b)
+            self.assertEqual(b_prime.apply(a.apply(doc)), a_prime.apply(b.apply(doc)))
+
+    def test_same_position_inserts_put_first_operation_first(self):
+        a = TextOperation.from_edits([{"pos": 1, "delete": 0, "insert": "A"}], 2)
+        b = TextOperation.from_edits([{"pos": 1, "delete": 0, "insert": "B"}], 2)
+        a_prime, b_prime = TextOperation.transform(a, b)
+        self.assertEqual(b_prime.apply(a.apply("xy")), "xABy")
+        self.assertEqual(a_prime.apply(b.apply("xy")), "xABy")
+
+    def test_overlapping_deletes(self):
+        a = TextOperation.from_edits([{"pos": 0, "delete": 3, "insert": ""}], 5)
+        b = TextOperation.from_edits([{"pos": 2, "delete": 3, "insert": ""}], 5)
+        a_prime, b_prime = TextOperation.transform(a, b)
+        self.assertEqual(b_prime.apply(a.apply("abcde")), "")
+        self.assertEqual(a_prime.apply(b.apply("abcde")), "")
+
+    def test_mismatched_base_lengths(self):
+        with self.assertRaises(ValueError):
+            TextOperation.transform(TextOperation().retain(2), TextOperation().retain(3))
+
+    def test_round_trips(self):
+        operation = TextOperation.from_diff("hello world", "hello there world")
+        self.assertEqual(operation.apply("hello world"), "hello there world")
+        self.assertEqual(TextOperation.from_ops(operation.ops).ops, operation.ops)
+        edits = operation.to_edits()
+        self.assertEqual(TextOperation.from_edits(edits, 11).ops, operation.ops)
+
+
+class FromEditsTest(unittest.TestCase):
+    def test_rejects_malformed_edits(self):
+        bad = [
+            "not a list",
+            ["not an edit"],
+            [None],
+            [{"pos": "1"}],
+            [{"pos": 0, "delete": 1.5}],
+            [{"pos": True}],
+            [{"pos": 0, "insert": 3}],
+            [{"pos": 0, "delete": -1}],
+            [{"pos": -1}],
+            [{"pos": 3, "delete": 0}, {"pos": 1, "delete": 0}],
+            [{"pos": 0, "delete": 2}, {"pos": 1, "delete": 0}],
+            [{"pos": 4, "delete": 2}],
+        ]
+        for edits in bad:
+            with self.subTest(edits=edits), self.assertRaises(ValueError):
+                TextOperation.from_edits(edits, 5)
+
+    def test_defaults(self):
+        operation = TextOperation.from_edits([{"pos": 2}, {"pos": 3, "insert": None}], 5)
+        self.assertTrue(operation.is_noop())
+        self.assertEqual(operation.base_length, 5)
+
+
+class RopeTest(unittest.TestCase):
+    def test_edits_match_string(self):
+        rng = random.Random(2)
+        text = "".join(rng.choice("abc\n") for _ in range(5000))
+        rope = Rope(text)
+        for _ in range(500):
+            edits = random_edits(len(text), rng)
+            rope.apply_edits(edits)
+            text = TextOperation.from_edits(edits, len(text)).apply(text)
+            self.assertEqual(len(rope), len(text))
+        self.assertEqual(rope.text(), text)
+        self.assertEqual(rope.line_count, text.count("\n") + 1)
+        for offset in range(0, len(text) + 1, 97):
+            line, column = rope.offset_to_line_col(offset)
+            self.assertEqual(line, text.count("\n", 0, offset))
+            self.assertEqual(rope.line_col_to_offset(line, column), offset)
+
+    def test_large_insert_and_slice(self):
+        rope = Rope("start end")
+        middle = "x" * 10_000 + "\n"
+        rope.insert(6, middle)
+        self.assertEqual(rope.slice(0, 6), "start ")
+        self.assertEqual(rope.slice(6 + len(middle), len(rope)), "end")
+        rope.delete(6, len(middle))
+        self.assertEqual(rope.text(), "start end")
+
+    def test_out_of_range_edits(self):
+        rope = Rope("abc")
+        with self.assertRaises(ValueError):
+            rope.insert(4, "x")
+        with self.assertRaises(ValueError):
+            rope.delete(2, 2)
+        self.assertEqual(rope.text(), "abc")
+
+    def test_changes_since(self):
+        rope = Rope("a\nb\nc\nd\n")
+        version = rope.version
+        rope.insert(rope.line_start(1), "x")
+        self.assertEqual(rope.changes_since(version), (1, 3))
+        self.assertEqual(rope.changes_since(rope.version), (5, 5))
+        self.assertIsNone(rope.changes_since(version - 1))
+
+
+if __name__ == "__main__":
+    unittest.main()